@@ -13,8 +13,26 @@ import cv2
 import threading
 import numpy as np
 import logging
+import sqlite3
 import time
 
+from drowsiness_state import DrowsinessState
+from event_stream import EventBroadcaster
+from face_detection import DetectionCache, create_face_tracker, largest_face
+from frame_bus import FrameBus
+from mjpeg_stream import MJPEGBroadcaster
+from async_server import serve_async
+from camera_sources import (FILE_SOURCES, capture_picamera2, capture_timestamp, configure_picamera2,
+                            crop_channel_order, lores_size, open_file_source, read_frame, source_ended)
+from governor import PerformanceGovernor
+from inference import InputPreprocessor, get_interpreter_class, load_interpreter, read_output, reload_interpreter
+from inference_worker import InferenceWorker
+from event_log import start_event_log
+from metrics import CONTENT_TYPE, LatencyWindow, stage_metrics
+from resource_monitor import resource_monitor
+from session_store import query_episodes, query_minutes, query_sessions, start_session_store
+import config
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -25,20 +43,27 @@ app = Flask(__name__)
 # GLOBAL VARIABLES
 # ============================================================
 camera = None
-output_frame = None
-lock = threading.Lock()
+frame_bus = FrameBus()  # Captured frames shared by stream and routes
 camera_type = None
 interpreter = None
+interpreter_settings = None  # Threads / XNNPACK used for the interpreter
 input_details = None
 output_details = None
 face_cascade = None
 eye_cascade = None  # For eye detection visualization
+detection_cache = None  # Face/eye detections shared by stream and routes
+input_preprocessor = None  # Writes face crops straight into the input tensor
 inference_lock = threading.Lock()
+inference_worker = None  # Detection + inference process (DROWSY_INFERENCE_WORKER)
+governor = None  # Thermal / load governor (DROWSY_GOVERNOR)
+event_log = None  # Binary per-frame session log (DROWSY_EVENT_LOG)
+session_store = None  # SQLite session history (DROWSY_SESSION_STORE)
+events = EventBroadcaster()  # Test results / resources pushed to the page over /events
 stop_capture_thread = False  # Flag to stop capture thread gracefully
 
 # Drowsy duration tracking
-drowsy_start_time = None
 drowsy_duration_threshold = 3.0  # seconds (configurable)
+drowsiness_state = DrowsinessState(1, drowsy_duration_threshold)  # Windowed eye-closure statistics
 
 # GPIO Hardware
 hardware = None
@@ -50,7 +75,7 @@ live_test_stats = {
     "drowsy_detected": 0,
     "alert_detected": 0,
     "start_time": None,
-    "inference_times": [],  # Track inference times
+    "inference_times": LatencyWindow(),  # Last DROWSY_LATENCY_WINDOW inference times (ms)
     "current_scenario": "Real-time Testing",  # User can set this
     "ground_truth_labels": []  # User will mark ground truth for accuracy calculation
 }
@@ -847,75 +872,83 @@ HTML_TEMPLATE = """
         function loadTestResults() {
             fetch('/test_results')
                 .then(r => r.json())
-                .then(data => {
-                    // Show live stats instead of static accuracy
-                    const total = data.live_stats.total_detections;
-                    const drowsy = data.live_stats.drowsy_detected;
-                    const alert = data.live_stats.alert_detected;
-                    
-                    document.getElementById('test-acc').textContent = total > 0 ? 
-                        `${total} samples` : 'No data yet';
-                    document.getElementById('test-tp').textContent = drowsy;
-                    document.getElementById('test-tn').textContent = alert;
-                    document.getElementById('test-fp').textContent = '-';
-                    document.getElementById('test-fn').textContent = '-';
-                    document.getElementById('test-inf').textContent = data.performance.inference_time_ms + ' ms';
-                    document.getElementById('test-fps').textContent = data.performance.fps + ' FPS';
-                    
-                    // Scenarios button (shows reference data from Bab 4)
-                    document.getElementById('btn-scenarios').onclick = function() {
-                        const panel = document.getElementById('scenarios-panel');
-                        if (panel.style.display === 'none') {
-                            panel.innerHTML = data.scenarios.map(s => `
-                                <div style="background:rgba(0,0,0,0.2);border-left:3px solid #3b82f6;padding:10px;margin-bottom:8px;border-radius:6px">
-                                    <div style="font-weight:bold;color:#00d4ff;margin-bottom:3px">${s.name}</div>
-                                    <div style="font-size:0.7rem;color:#94a3b8;margin-bottom:6px">${s.condition}</div>
-                                    <div style="display:grid;grid-template-columns:1fr 1fr;gap:4px;font-size:0.75rem">
-                                        <div><span style="color:#94a3b8">TP:</span> ${s.true_positive}</div>
-                                        <div><span style="color:#94a3b8">TN:</span> ${s.true_negative}</div>
-                                        <div><span style="color:#94a3b8">FP:</span> ${s.false_positive}</div>
-                                        <div><span style="color:#94a3b8">FN:</span> ${s.false_negative}</div>
-                                    </div>
-                                    <div style="text-align:center;margin-top:6px;padding-top:6px;border-top:1px solid rgba(255,255,255,0.1);color:#10b981;font-weight:bold">
-                                        Accuracy: ${(s.accuracy * 100).toFixed(2)}%
-                                    </div>
-                                </div>
-                            `).join('');
-                            panel.style.display = 'block';
-                            this.textContent = '📊 Hide Reference Data (Bab 4)';
-                        } else {
-                            panel.style.display = 'none';
-                            this.textContent = '📊 View Reference Data (Bab 4)';
-                        }
-                    };
-                })
+                .then(showTestResults)
                 .catch(err => console.error('Failed to load test results:', err));
         }
         
-        // Load initially
-        loadTestResults();
-        
-        // Auto-refresh every 2 seconds to show live updates
-        setInterval(loadTestResults, 2000);
+        function showTestResults(data) {
+            // Show live stats instead of static accuracy
+            const total = data.live_stats.total_detections;
+            const drowsy = data.live_stats.drowsy_detected;
+            const alert = data.live_stats.alert_detected;
+            
+            document.getElementById('test-acc').textContent = total > 0 ? 
+                `${total} samples` : 'No data yet';
+            document.getElementById('test-tp').textContent = drowsy;
+            document.getElementById('test-tn').textContent = alert;
+            document.getElementById('test-fp').textContent = '-';
+            document.getElementById('test-fn').textContent = '-';
+            document.getElementById('test-inf').textContent = data.performance.inference_time_ms + ' ms';
+            document.getElementById('test-fps').textContent = data.performance.fps + ' FPS';
+            
+            // Scenarios button (shows reference data from Bab 4)
+            document.getElementById('btn-scenarios').onclick = function() {
+                const panel = document.getElementById('scenarios-panel');
+                if (panel.style.display === 'none') {
+                    panel.innerHTML = data.scenarios.map(s => `
+                        <div style="background:rgba(0,0,0,0.2);border-left:3px solid #3b82f6;padding:10px;margin-bottom:8px;border-radius:6px">
+                            <div style="font-weight:bold;color:#00d4ff;margin-bottom:3px">${s.name}</div>
+                            <div style="font-size:0.7rem;color:#94a3b8;margin-bottom:6px">${s.condition}</div>
+                            <div style="display:grid;grid-template-columns:1fr 1fr;gap:4px;font-size:0.75rem">
+                                <div><span style="color:#94a3b8">TP:</span> ${s.true_positive}</div>
+                                <div><span style="color:#94a3b8">TN:</span> ${s.true_negative}</div>
+                                <div><span style="color:#94a3b8">FP:</span> ${s.false_positive}</div>
+                                <div><span style="color:#94a3b8">FN:</span> ${s.false_negative}</div>
+                            </div>
+                            <div style="text-align:center;margin-top:6px;padding-top:6px;border-top:1px solid rgba(255,255,255,0.1);color:#10b981;font-weight:bold">
+                                Accuracy: ${(s.accuracy * 100).toFixed(2)}%
+                            </div>
+                        </div>
+                    `).join('');
+                    panel.style.display = 'block';
+                    this.textContent = '📊 Hide Reference Data (Bab 4)';
+                } else {
+                    panel.style.display = 'none';
+                    this.textContent = '📊 View Reference Data (Bab 4)';
+                }
+            };
+        }
         
         // Load resource stats
         function loadResourceStats() {
             fetch('/resource_stats')
                 .then(r => r.json())
-                .then(data => {
-                    if (!data.error) {
-                        document.getElementById('res-cpu').textContent = data.cpu_percent + '%';
-                        document.getElementById('res-ram').textContent = data.ram_gb + ' GB';
-                        document.getElementById('res-temp').textContent = data.temp_c + '°C';
-                        document.getElementById('res-power').textContent = data.power_w + ' W';
-                    }
-                })
+                .then(showResourceStats)
                 .catch(err => console.error('Resource stats error:', err));
         }
         
-        // Load resource stats initially and every 5 seconds
-        loadResourceStats();
-        setInterval(loadResourceStats, 5000);
+        function showResourceStats(data) {
+            if (!data.error) {
+                document.getElementById('res-cpu').textContent = data.cpu_percent + '%';
+                document.getElementById('res-ram').textContent = data.ram_gb + ' GB';
+                document.getElementById('res-temp').textContent = data.temp_c + '°C';
+                document.getElementById('res-power').textContent = data.power_w + ' W';
+            }
+        }
+        
+        if (window.EventSource) {
+            // Pushed by the server: test results every second, resources every 5 seconds
+            const source = new EventSource('/events');
+            source.addEventListener('test_results', e => showTestResults(JSON.parse(e.data)));
+            source.addEventListener('resources', e => showResourceStats(JSON.parse(e.data)));
+            source.onerror = () => console.error('Event stream interrupted, reconnecting...');
+        } else {
+            // Load initially, then refresh every 2 / 5 seconds
+            loadTestResults();
+            setInterval(loadTestResults, 2000);
+            loadResourceStats();
+            setInterval(loadResourceStats, 5000);
+        }
     </script>
 </body>
 </html>
@@ -931,13 +964,13 @@ def initialize_picamera2():
         from picamera2 import Picamera2
         
         cam = Picamera2()
-        config = cam.create_video_configuration(
-            main={"size": (640, 480), "format": "RGB888"}
-        )
-        cam.configure(config)
+        # 640x480 main stream (BGR in memory) + lores YUV stream for face detection
+        cam.configure(configure_picamera2(cam))
         cam.start()
         
         logger.info("✅ Raspberry Pi Camera Module initialized (picamera2)")
+        if lores_size(cam):
+            logger.info(f"   Lores detection stream: {lores_size(cam)[0]}x{lores_size(cam)[1]} (Y plane)")
         return cam, "picamera2"
     except Exception as e:
         logger.warning(f"picamera2 error: {e}")
@@ -964,17 +997,33 @@ def initialize_opencv_camera():
         logger.warning(f"OpenCV camera error: {e}")
         return None, None
 
+def initialize_file_source():
+    """Video file / image directory / synthetic frames instead of a camera (DROWSY_CAMERA_SOURCE)"""
+    try:
+        cam = open_file_source()
+        logger.info(f"✅ {cam.describe()}")
+        return cam, config.CAMERA_SOURCE
+    except Exception as e:
+        logger.error(f"❌ Camera source error: {e}")
+        return None, None
+
 def initialize_camera():
-    """Initialize camera - try USB webcam first, then picamera2"""
+    """Initialize camera - try USB webcam first, then picamera2 (DROWSY_CAMERA_SOURCE picks one or a file source)"""
     global camera, camera_type
     
-    camera, camera_type = initialize_opencv_camera()
-    if camera:
-        return True
+    if config.CAMERA_SOURCE in FILE_SOURCES:
+        camera, camera_type = initialize_file_source()
+        return camera is not None
     
-    camera, camera_type = initialize_picamera2()
-    if camera:
-        return True
+    if config.CAMERA_SOURCE != "picamera2":
+        camera, camera_type = initialize_opencv_camera()
+        if camera:
+            return True
+    
+    if config.CAMERA_SOURCE != "opencv":
+        camera, camera_type = initialize_picamera2()
+        if camera:
+            return True
     
     logger.error("❌ No camera found!")
     return False
@@ -985,26 +1034,14 @@ def initialize_camera():
 
 def initialize_model():
     """Initialize TFLite model"""
-    global interpreter, input_details, output_details, face_cascade
+    global interpreter, interpreter_settings, input_details, output_details, input_preprocessor, face_cascade, detection_cache
     
     try:
-        # Try different TFLite interpreter imports (TF 2.19 compatibility)
-        Interpreter = None
-        try:
-            from tflite_runtime.interpreter import Interpreter
-            logger.info("Using tflite-runtime")
-        except ImportError:
-            try:
-                from tensorflow.lite.python.interpreter import Interpreter
-                logger.info("Using tensorflow.lite")
-            except ImportError:
-                try:
-                    # TF 2.19+ new location (though deprecated)
-                    from ai_edge_litert.interpreter import Interpreter
-                    logger.info("Using ai_edge_litert (TF 2.19+)")
-                except ImportError:
-                    logger.error("❌ No TFLite interpreter found!")
-                    return False
+        Interpreter, backend = get_interpreter_class()
+        if Interpreter is None:
+            logger.error("❌ No TFLite interpreter found!")
+            return False
+        logger.info(f"Using {backend}")
         
         import os
         model_path = os.path.join(os.path.dirname(__file__), 'best_model_compatible.tflite')
@@ -1013,14 +1050,17 @@ def initialize_model():
             logger.error(f"❌ Model file not found: {model_path}")
             return False
         
-        interpreter = Interpreter(model_path=model_path)
-        interpreter.allocate_tensors()
+        interpreter, interpreter_settings = load_interpreter(model_path)
         
         input_details = interpreter.get_input_details()
         output_details = interpreter.get_output_details()
+        input_preprocessor = InputPreprocessor(interpreter, input_details[0])
         
-        logger.info(f"✅ Model loaded: {model_path}")
+        logger.info(f"✅ Model loaded: {interpreter_settings['model_path']} (variant: {interpreter_settings['variant']})")
         logger.info(f"   Input shape: {input_details[0]['shape']}")
+        logger.info(f"   Threads: {interpreter_settings['num_threads']}, "
+                    f"XNNPACK: {'on' if interpreter_settings['xnnpack'] else 'off'} "
+                    f"({interpreter_settings['source']})")
         
         cascade_paths = [
             '/usr/share/opencv4/haarcascades/haarcascade_frontalface_default.xml',
@@ -1063,6 +1103,12 @@ def initialize_model():
         
         if eye_cascade is None or eye_cascade.empty():
             logger.warning("⚠️ Eye cascade not found - will only show face box")
+            eye_cascade = None
+        
+        detection_cache = DetectionCache(face_cascade, eye_cascade, create_face_tracker(face_cascade))
+        
+        if config.INFERENCE_WORKER:
+            start_inference_worker(model_path, cascade_path)
         
         return True
         
@@ -1072,6 +1118,56 @@ def initialize_model():
         traceback.print_exc()
         return False
 
+def start_inference_worker(model_path, cascade_path):
+    """Move face detection + inference into a worker process (DROWSY_INFERENCE_WORKER)
+
+    The in-process interpreter stays loaded for /health and as a fallback
+    when the worker cannot be started.
+    """
+    global inference_worker, detection_cache
+    
+    worker = InferenceWorker(model_path, cascade_path)
+    if not worker.start():
+        logger.warning("⚠️ Inference worker not started - detecting in-process")
+        return False
+    
+    inference_worker = worker
+    worker.configure(channel_order=crop_channel_order(camera_type))
+    # Faces now come from the worker, the stream reuses them instead of running the cascade
+    detection_cache = DetectionCache(None, eye_cascade)
+    logger.info(f"✅ Inference worker started (pid {worker.process.pid}, {worker.num_slots} shared memory slots, "
+                f"{worker.settings['num_threads']} threads)")
+    return True
+
+def start_governor():
+    """Step quality down when the Pi runs hot or out of CPU (DROWSY_GOVERNOR)"""
+    global governor
+    
+    base_threads = interpreter_settings['num_threads'] if interpreter_settings else 1
+    # Reads temperature and load from resource_monitor
+    governor = PerformanceGovernor(base_threads, on_change=apply_governor_settings).start()
+    logger.info(f"✅ Governor started (warm {config.GOVERNOR_TEMP_WARM:g}°C / CPU {config.GOVERNOR_CPU_HIGH:g}%, "
+                f"hot {config.GOVERNOR_TEMP_HOT:g}°C)")
+
+def apply_governor_settings(settings):
+    """Apply a governor level: detection resolution and inference threads
+    
+    Stream FPS and JPEG quality are read by generate_frames() itself.
+    """
+    global interpreter, interpreter_settings, input_details, output_details, input_preprocessor
+    
+    if detection_cache is not None:
+        detection_cache.detect_scale = settings['detect_scale']
+    if inference_worker is not None:
+        inference_worker.configure(detect_scale=settings['detect_scale'], num_threads=settings['num_threads'])
+        return
+    if interpreter_settings and settings['num_threads'] != interpreter_settings['num_threads']:
+        with inference_lock:
+            interpreter, interpreter_settings = reload_interpreter(interpreter_settings, settings['num_threads'])
+            input_details = interpreter.get_input_details()
+            output_details = interpreter.get_output_details()
+            input_preprocessor = InputPreprocessor(interpreter, input_details[0])
+
 # ============================================================
 # HARDWARE ALERT CLASS
 # ============================================================
@@ -1098,6 +1194,7 @@ class HardwareAlert:
         logger.info(f"   Buzzer: GPIO{self.BUZZER_PIN}")
         logger.info(f"   RGB LED: R=GPIO{self.LED_RED_PIN}, G=GPIO{self.LED_GREEN_PIN}, B=GPIO{self.LED_BLUE_PIN}")
     
+    @stage_metrics.timed("gpio")
     def set_led(self, red=0, yellow=0, green=0):
         """Set individual LEDs (0=off, 100=on)"""
         self.led_r.value = red / 100.0
@@ -1122,12 +1219,14 @@ class HardwareAlert:
     
     def buzzer_on(self):
         if not self.buzzer_active:
-            self.buzzer.on()
+            with stage_metrics.time("gpio"):
+                self.buzzer.on()
             self.buzzer_active = True
     
     def buzzer_off(self):
         if self.buzzer_active:
-            self.buzzer.off()
+            with stage_metrics.time("gpio"):
+                self.buzzer.off()
             self.buzzer_active = False
     
     def update_status(self, is_drowsy, confidence):
@@ -1180,7 +1279,7 @@ def initialize_hardware():
 
 def capture_frames():
     """Capture frames in background thread"""
-    global camera, output_frame, lock, camera_type, stop_capture_thread
+    global camera, frame_bus, camera_type, stop_capture_thread
     
     logger.info("🎥 Frame capture thread started")
     
@@ -1219,11 +1318,15 @@ def capture_frames():
     
     logger.info(f"Camera ready: type={camera_type}, isOpened={camera.isOpened() if hasattr(camera, 'isOpened') else 'N/A'}")
     
+    # picamera2 lores stream size (None for USB cameras)
+    lores = lores_size(camera) if camera_type == "picamera2" else None
+    
     while not stop_capture_thread:
         try:
             if camera_type == "picamera2":
-                frame = camera.capture_array()
-                frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
+                # Main stream is already BGR, detection reads the lores Y plane
+                with stage_metrics.time("capture"):
+                    frame, gray, gray_scale = capture_picamera2(camera, lores)
             else:
                 if camera is None:
                     logger.warning("Camera became None during capture")
@@ -1231,14 +1334,18 @@ def capture_frames():
                 if not camera.isOpened():
                     logger.warning("Camera not opened, stopping capture thread")
                     break
-                ret, frame = camera.read()
+                # Read straight into the frame bus slot
+                ret, frame = read_frame(camera, frame_bus.next_slot())
                 if not ret:
+                    if source_ended(camera):
+                        logger.info("⏹️ End of camera source")
+                        break
                     logger.warning("Failed to read frame")
                     time.sleep(0.1)
                     continue
+                gray, gray_scale = None, 1.0
             
-            with lock:
-                output_frame = frame.copy()
+            frame_bus.publish(frame, timestamp=capture_timestamp(camera), gray=gray, gray_scale=gray_scale)
                 
         except Exception as e:
             logger.error(f"Capture error: {e}")
@@ -1246,62 +1353,43 @@ def capture_frames():
     
     logger.info("🎥 Frame capture thread stopped gracefully")
 
+def stream_settings():
+    """(max FPS, JPEG quality) of the MJPEG stream, lowered by the governor when hot"""
+    if governor is None:
+        return 15, 50
+    settings = governor.settings
+    return settings['stream_fps'], settings['jpeg_quality']
+
+def render_stream_frame(bus_frame):
+    """Stream image of a bus frame with bounding boxes"""
+    frame = bus_frame.image
+    
+    # Draw bounding boxes (detections are cached per captured frame)
+    if detection_cache is not None:
+        frame = draw_bounding_boxes(frame, detection_cache.get_frame(bus_frame, with_eyes=True))
+    return frame
+
+# One encoder for all viewers, running only while someone watches
+stream_encoder = MJPEGBroadcaster(frame_bus, render_stream_frame, stream_settings)
+stage_metrics.add_gauge("stream_viewers", "Connected MJPEG viewers", lambda: stream_encoder.viewers)
+stage_metrics.add_gauge("event_subscribers", "Connected /events clients", lambda: events.subscribers)
+stage_metrics.add_gauge("cpu_percent", "CPU load, % of all cores", lambda: resource_monitor.snapshot()["cpu_percent"])
+stage_metrics.add_gauge("soc_temperature_celsius", "SoC temperature", lambda: resource_monitor.snapshot()["temp_c"])
+
 def generate_frames():
-    """Generate frames for MJPEG streaming with bounding boxes"""
-    global output_frame, lock
-    
-    last_frame_time = 0
-    frame_interval = 1.0 / 15  # 15 FPS max
-    
-    while True:
-        current_time = time.time()
-        if current_time - last_frame_time < frame_interval:
-            time.sleep(0.01)
-            continue
-        
-        with lock:
-            if output_frame is None:
-                time.sleep(0.01)
-                continue
-            frame = output_frame.copy()
-        
-        # Draw bounding boxes using helper function
-        frame = draw_bounding_boxes(frame)
-        
-        small = cv2.resize(frame, (480, 360))
-        
-        ret, buffer = cv2.imencode('.jpg', small, [cv2.IMWRITE_JPEG_QUALITY, 50])
-        if not ret:
-            continue
-        
-        last_frame_time = current_time
-        
-        yield (b'--frame\r\n'
-               b'Content-Type: image/jpeg\r\n\r\n' + buffer.tobytes() + b'\r\n')
+    """MJPEG stream of one viewer (JPEGs are shared by all viewers)"""
+    return stream_encoder.viewer()
 
 
 # ============================================================
 # BOUNDING BOX DRAWING
 # ============================================================
 
-def draw_bounding_boxes(frame):
-    """Draw face and eye bounding boxes on frame"""
-    global face_cascade, eye_cascade
-    
-    if face_cascade is None:
-        return frame
-    
+def draw_bounding_boxes(frame, detections):
+    """Draw cached face and eye bounding boxes on frame"""
     frame_with_boxes = frame.copy()
-    gray = cv2.cvtColor(frame_with_boxes, cv2.COLOR_BGR2GRAY)
     
-    faces = face_cascade.detectMultiScale(
-        gray,
-        scaleFactor=1.1,
-        minNeighbors=4,
-        minSize=(30, 30)
-    )
-    
-    for (x, y, w, h) in faces:
+    for i, (x, y, w, h) in enumerate(detections.faces):
         # Draw face rectangle (green)
         cv2.rectangle(frame_with_boxes, (x, y), (x+w, y+h), (0, 255, 0), 2)
         
@@ -1309,26 +1397,16 @@ def draw_bounding_boxes(frame):
         cv2.putText(frame_with_boxes, 'Face', (x, y-10),
                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
         
-        # Detect eyes within face region
-        if eye_cascade is not None:
-            # Only detect in upper half of face (where eyes actually are)
+        # Draw eyes within face region
+        if eye_cascade is not None and detections.eyes is not None:
+            # Eyes are only searched in the upper part of the face
             eye_region_height = int(h * 0.6)  # Top 60% of face
-            roi_gray = gray[y:y+eye_region_height, x:x+w]
             roi_color = frame_with_boxes[y:y+eye_region_height, x:x+w]
             
-            eyes = eye_cascade.detectMultiScale(
-                roi_gray,
-                scaleFactor=1.1,
-                minNeighbors=10,  # Increased from 5 to reduce false positives
-                minSize=(30, 30)   # Increased minimum size
-            )
+            # Cache keeps only the 2 largest detections (left and right eye)
+            eyes = detections.eyes[i]
             
-            # Filter and select only the 2 largest detections (left and right eye)
             if len(eyes) > 0:
-                # Sort by area (width * height) and take top 2
-                eyes_sorted = sorted(eyes, key=lambda e: e[2] * e[3], reverse=True)
-                eyes = eyes_sorted[:2]  # Only keep 2 largest
-                
                 for (ex, ey, ew, eh) in eyes:
                     # Draw eye rectangle (blue)
                     cv2.rectangle(roi_color, (ex, ey), (ex+ew, ey+eh), (255, 0, 0), 2)
@@ -1359,53 +1437,65 @@ def draw_bounding_boxes(frame):
 # PREDICTION FUNCTION
 # ============================================================
 
-def predict_drowsiness(frame, threshold=0.5):
-    """Predict drowsiness from frame"""
-    global interpreter, input_details, output_details, face_cascade, live_test_stats
+def predict_drowsiness(frame, threshold=0.5, frame_seq=None, gray=None, gray_scale=1.0, timings=None):
+    """Predict drowsiness from frame (faces come from the detection cache)
+
+    Per-stage times go to the latency histograms (stage_metrics) and, if
+    given, into the `timings` dict.
+    """
+    global interpreter, input_details, output_details, detection_cache, live_test_stats
     
-    if interpreter is None or face_cascade is None:
+    if interpreter is None or detection_cache is None:
         logger.warning("Model or face cascade not initialized")
         return False, None, None, 0
     
     import time
     start_time = time.time()
-    
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    
-    faces = face_cascade.detectMultiScale(
-        gray, 
-        scaleFactor=1.1,
-        minNeighbors=4,
-        minSize=(30, 30)
-    )
-    
-    if len(faces) == 0:
-        return False, None, None, 0
-    
-    x, y, w, h = max(faces, key=lambda f: f[2] * f[3])
-    
-    face_roi = frame[y:y+h, x:x+w]
-    if face_roi.size == 0:
-        return False, None, None, 0
-    
-    face_roi = cv2.resize(face_roi, (224, 224))
-    
-    input_data = np.expand_dims(face_roi, axis=0)
-    
-    if input_details[0]['dtype'] == np.uint8:
-        input_data = input_data.astype(np.uint8)
-    else:
-        input_data = input_data.astype(np.float32) / 255.0
-    
-    with inference_lock:
-        interpreter.set_tensor(input_details[0]['index'], input_data)
-        interpreter.invoke()
-        output = interpreter.get_tensor(output_details[0]['index']).copy()
-    
-    if output_details[0]['dtype'] == np.uint8:
-        quant_scale, zero_point = output_details[0]['quantization']
-        confidence = (float(output[0][0]) - zero_point) * quant_scale
+    if timings is None:
+        timings = {}
+    
+    if inference_worker is not None:
+        # Face detection + inference run in the worker process
+        result = inference_worker.run(frame, frame_seq, gray, gray_scale)
+        if result is None:
+            return False, None, None, 0
+        stage_metrics.observe_timings(result["timings"])
+        timings.update(result["timings"])
+        # `frame` is a bus slot the camera overwrites later, the cache keeps a copy
+        detection_cache.put(frame_seq, frame.copy(), result["faces"])
+        if not result["boxes"]:
+            return False, None, None, 0
+        (x, y, w, h), confidence = result["boxes"][0], result["confidences"][0]
     else:
+        detections = detection_cache.get(frame_seq, frame, gray=gray, gray_scale=gray_scale)
+        stage_metrics.observe_timings(detections.timings)
+        timings.update(detections.timings)
+        face = largest_face(detections.faces)
+        
+        if face is None:
+            return False, None, None, 0
+        
+        x, y, w, h = face
+        
+        face_roi = frame[y:y+h, x:x+w]
+        if face_roi.size == 0:
+            return False, None, None, 0
+        if crop_channel_order(camera_type) == "RGB":
+            face_roi = cv2.cvtColor(face_roi, cv2.COLOR_BGR2RGB)
+        
+        with inference_lock:
+            # Resize + normalise straight into the interpreter's input tensor
+            t0 = time.perf_counter()
+            input_preprocessor.write(face_roi)
+            t1 = time.perf_counter()
+            interpreter.invoke()
+            t2 = time.perf_counter()
+            output = read_output(interpreter, output_details[0])  # Dequantized float32 copy
+            t3 = time.perf_counter()
+        inference_timings = {"resize": t1 - t0, "invoke": t2 - t1, "postprocess": t3 - t2}
+        stage_metrics.observe_timings(inference_timings)
+        timings.update(inference_timings)
+        
         confidence = float(output[0][0])
     
     # Lower confidence = drowsy (eyes closed)
@@ -1415,12 +1505,8 @@ def predict_drowsiness(frame, threshold=0.5):
     # Calculate inference time
     inference_time_ms = (time.time() - start_time) * 1000
     
-    # Track inference time
-    if len(live_test_stats["inference_times"]) < 100:  # Keep last 100
-        live_test_stats["inference_times"].append(inference_time_ms)
-    else:
-        live_test_stats["inference_times"].pop(0)
-        live_test_stats["inference_times"].append(inference_time_ms)
+    # Track inference time (ring buffer, oldest sample overwritten)
+    live_test_stats["inference_times"].add(inference_time_ms)
     
     # DEBUG: Log confidence values to help diagnose
     logger.info(f"🔍 DEBUG - Confidence: {confidence:.3f}, Threshold: {threshold:.2f}, Drowsy: {is_drowsy}, Inference: {inference_time_ms:.1f}ms")
@@ -1446,7 +1532,7 @@ def video_feed():
 @app.route('/predict', methods=['POST'])
 def predict():
     """Prediction endpoint - uses current frame"""
-    global output_frame, lock, hardware, drowsy_start_time, drowsy_duration_threshold, live_test_stats
+    global frame_bus, hardware, drowsiness_state, drowsy_duration_threshold, live_test_stats
     
     try:
         data = request.get_json() or {}
@@ -1454,29 +1540,28 @@ def predict():
         alarm_duration = data.get('alarm_duration', 3)  # Get from UI
         drowsy_duration_threshold = float(alarm_duration)
         
-        with lock:
-            if output_frame is None:
-                return jsonify({'error': 'No frame available'}), 503
-            frame = output_frame.copy()
+        bus_frame = frame_bus.latest()
+        if bus_frame is None:
+            return jsonify({'error': 'No frame available'}), 503
         
-        face_detected, is_drowsy, face_box, inference_time_ms = predict_drowsiness(frame, threshold)
+        timings = {}
+        face_detected, is_drowsy, face_box, inference_time_ms = predict_drowsiness(
+            bus_frame.image, threshold, frame_seq=bus_frame.seq,
+            gray=bus_frame.gray, gray_scale=bus_frame.gray_scale, timings=timings)
+        stage_metrics.observe_decision(bus_frame.timestamp)
         
         # Initialize start time if first detection
         if live_test_stats["start_time"] is None and face_detected:
             import time
             live_test_stats["start_time"] = time.time()
         
-        # Track statistics
-        if face_detected:
-            live_test_stats["total_detections"] += 1
-            if is_drowsy:
-                live_test_stats["drowsy_detected"] += 1
-            else:
-                live_test_stats["alert_detected"] += 1
-        
         if not face_detected:
             logger.info("🔍 DEBUG - No face detected")
-            drowsy_start_time = None  # Reset timer
+            drowsiness_state.reset()
+            if event_log is not None:
+                event_log.record(bus_frame.timestamp, bus_frame.seq, None, 0, timings)
+            if session_store is not None:
+                session_store.record(bus_frame.timestamp, None, 0)
             if hardware:
                 hardware.led_off()
                 hardware.buzzer_off()
@@ -1488,22 +1573,33 @@ def predict():
                 'alarm_active': False
             })
         
-        # Duration-based alarm logic
+        # Duration-based alarm logic (closed time in a sliding window, see drowsiness_stats.py)
         import time
         current_time = time.time()
-        alarm_active = False
-        drowsy_duration = 0
+        drowsiness_state.alarm_threshold = drowsy_duration_threshold
+        with stage_metrics.time("state_update"):
+            state = drowsiness_state.update(face_box, is_drowsy, None, current_time)
+        is_drowsy = state.is_drowsy
+        alarm_active = state.alarm_active
+        drowsy_duration = state.drowsy_duration
+        
+        # Track statistics (the smoothed decision, as returned to the UI)
+        live_test_stats["total_detections"] += 1
+        if is_drowsy:
+            live_test_stats["drowsy_detected"] += 1
+        else:
+            live_test_stats["alert_detected"] += 1
+        if event_log is not None:
+            event_log.record(bus_frame.timestamp, bus_frame.seq, state, 1, timings, current_time)
+        if session_store is not None:
+            session_store.record(bus_frame.timestamp, state, 1)
         
         if is_drowsy:
-            if drowsy_start_time is None:
-                drowsy_start_time = current_time
+            if state.started:
                 logger.info("⏱️ Drowsy state started")
             
-            drowsy_duration = current_time - drowsy_start_time
-            
             # Only trigger alarm after threshold duration
-            if drowsy_duration >= drowsy_duration_threshold:
-                alarm_active = True
+            if alarm_active:
                 logger.warning(f"⚠️ ALARM! Drowsy for {drowsy_duration:.1f}s (threshold: {drowsy_duration_threshold}s)")
                 if hardware:
                     hardware.led_red()
@@ -1515,11 +1611,9 @@ def predict():
                     hardware.led_yellow()  # Warning state
                     hardware.buzzer_off()
         else:
-            # Alert state - reset timer
-            if drowsy_start_time is not None:
-                logger.info(f"✅ Alert state restored (was drowsy for {current_time - drowsy_start_time:.1f}s)")
-            drowsy_start_time = None
-            drowsy_duration = 0
+            # Alert state
+            if state.recovered_after is not None:
+                logger.info(f"✅ Alert state restored (was drowsy for {state.recovered_after:.1f}s)")
             if hardware:
                 hardware.led_green()
                 hardware.buzzer_off()
@@ -1531,7 +1625,9 @@ def predict():
             'face_box': face_box,
             'drowsy_duration': round(drowsy_duration, 1),
             'alarm_active': alarm_active,
-            'alarm_threshold': drowsy_duration_threshold
+            'alarm_threshold': drowsy_duration_threshold,
+            'perclos': round(state.stats.perclos, 3),
+            'blink_rate': round(state.stats.blink_rate, 1)
         })
         
     except Exception as e:
@@ -1548,13 +1644,70 @@ def health():
         'camera_type': camera_type,
         'camera_active': camera is not None,
         'model_loaded': interpreter is not None,
+        'interpreter': interpreter_settings,
         'face_cascade_loaded': face_cascade is not None,
-        'hardware_available': hardware is not None
+        'hardware_available': hardware is not None,
+        'detection_cache': detection_cache.get_stats() if detection_cache else None,
+        'inference_worker': inference_worker.get_stats() if inference_worker else None,
+        'governor': governor.get_stats() if governor else None,
+        'events': events.get_stats(),
+        'stream': stream_encoder.get_stats(),
+        'frame_bus': frame_bus.get_stats(),
+        'latency': stage_metrics.summary(),
+        'event_log': event_log.get_stats() if event_log else None,
+        'session_store': session_store.get_stats() if session_store else None
     })
 
+@app.route('/metrics')
+def metrics():
+    """Prometheus text format: per-stage latency histograms, frame age, detection FPS"""
+    return Response(stage_metrics.render({'app': 'app'}), content_type=CONTENT_TYPE)
+
+def session_page(query, *args):
+    """Streamed JSON page of a session_store query (503 when disabled, 500 when the database cannot be read)"""
+    if session_store is None:
+        return jsonify({'error': 'Session store disabled'}), 503
+    try:
+        page = query(session_store.path, *args)
+    except sqlite3.Error as e:
+        logger.error(f"Session store query failed: {e}")
+        return jsonify({'error': f'Session store unavailable: {e}'}), 500
+    return Response(page, mimetype='application/json')
+
+@app.route('/sessions')
+def sessions():
+    """Past sessions, newest first (?limit=&before=<id>&scenario=&since=&until=), streamed JSON"""
+    args = request.args
+    return session_page(query_sessions, args.get('limit', 50, type=int), args.get('before', type=int),
+                        args.get('scenario'), args.get('since', type=float), args.get('until', type=float))
+
+@app.route('/sessions/<int:session_id>/episodes')
+def session_episodes(session_id):
+    """Drowsy episodes of a session, oldest first (?limit=&after=<id>&alarms=1), streamed JSON"""
+    args = request.args
+    return session_page(query_episodes, session_id, args.get('limit', 50, type=int),
+                        args.get('after', type=int), args.get('alarms') == '1')
+
+@app.route('/sessions/<int:session_id>/minutes')
+def session_minutes(session_id):
+    """Per-minute aggregates of a session, oldest first (?limit=&after=<minute>), streamed JSON"""
+    args = request.args
+    return session_page(query_minutes, session_id, args.get('limit', 60, type=int), args.get('after', type=float))
+
+@app.route('/governor')
+def governor_status():
+    """Thermal / load governor level, readings and recent transitions"""
+    if governor is None:
+        return jsonify({'enabled': False})
+    return jsonify(governor.get_stats())
+
 @app.route('/test_results')
 def test_results():
     """Get live test results"""
+    return jsonify(test_results_snapshot())
+
+def test_results_snapshot():
+    """Live test statistics for /test_results and the 'test_results' event"""
     global live_test_stats, REFERENCE_RESULTS
     
     import time
@@ -1564,20 +1717,19 @@ def test_results():
     drowsy = live_test_stats["drowsy_detected"]
     alert = live_test_stats["alert_detected"]
     
-    # Calculate average inference time
-    avg_inference = 0
-    if live_test_stats["inference_times"]:
-        avg_inference = sum(live_test_stats["inference_times"]) / len(live_test_stats["inference_times"])
+    # Inference time mean + tail percentiles over the latency window
+    latency = live_test_stats["inference_times"].summary()
     
-    # Calculate FPS (approximate from inference time)
-    fps = int(1000 / avg_inference) if avg_inference > 0 else 0
+    # Measured rate of completed predictions (1000 / inference time ignored the
+    # cascade, the request round trip and the page's polling interval)
+    fps = round(stage_metrics.detection_rate.rate(), 1)
     
     # Calculate duration
     duration_seconds = 0
     if live_test_stats["start_time"]:
         duration_seconds = time.time() - live_test_stats["start_time"]
     
-    return jsonify({
+    return {
         "overall": {
             "accuracy": 0,  # Cannot calculate without ground truth
             "true_positive": 0,  # User needs to provide ground truth
@@ -1594,48 +1746,73 @@ def test_results():
             "current_scenario": live_test_stats["current_scenario"]
         },
         "performance": {
-            "inference_time_ms": round(avg_inference, 1),
+            "inference_time_ms": round(latency["mean"] or 0, 1),
             "fps": fps,
-            "latency_ms": round(avg_inference, 1)
+            "latency_ms": round(latency["mean"] or 0, 1),
+            "latency_percentiles_ms": {
+                name: round(latency[name], 1) if latency[name] is not None else None
+                for name in ("p50", "p90", "p99", "min", "max")
+            },
+            "latency_samples": latency["samples"]
         },
         "scenarios": REFERENCE_RESULTS["scenarios"]  # Reference data from Bab 4
-    })
+    }
 
 @app.route('/resource_stats')
 def resource_stats():
-    """Get current resource usage statistics"""
+    """Get current resource usage statistics (latest background sample)"""
     try:
-        import psutil
-        import subprocess
-        
-        # CPU
-        cpu_percent = psutil.cpu_percent(interval=0.5)
-        
-        # RAM
-        memory = psutil.virtual_memory()
-        ram_gb = memory.used / (1024 ** 3)
-        
-        # Temperature
-        try:
-            temp_output = subprocess.check_output(['vcgencmd', 'measure_temp']).decode()
-            temp_c = float(temp_output.replace("temp=", "").replace("'C\n", ""))
-        except:
-            temp_c = 0.0
-        
-        # Power estimation (rough)
-        base_power = 2.5
-        max_power = 5.0
-        estimated_power = base_power + (max_power - base_power) * (cpu_percent / 100)
-        
-        return jsonify({
-            "cpu_percent": round(cpu_percent, 1),
-            "ram_gb": round(ram_gb, 2),
-            "temp_c": round(temp_c, 1),
-            "power_w": round(estimated_power, 1)
-        })
+        return jsonify(resource_snapshot())
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/resource_history')
+def resource_history():
+    """Recent resource samples, oldest first (?seconds=N limits the range)"""
+    seconds = request.args.get('seconds', type=float)
+    return jsonify({
+        "interval": resource_monitor.interval,
+        "samples": resource_monitor.history(seconds)
+    })
+
+def resource_snapshot():
+    """CPU / RAM / temperature / power for /resource_stats and the 'resources' event"""
+    sample = resource_monitor.snapshot()
+    cpu_percent = sample["cpu_percent"] or 0.0
+    
+    # Power estimation (rough)
+    base_power = 2.5
+    max_power = 5.0
+    estimated_power = base_power + (max_power - base_power) * (cpu_percent / 100)
+    
+    return {
+        "cpu_percent": cpu_percent,
+        "cpu_cores": sample["cpu_cores"],
+        "ram_gb": sample["ram_gb"] or 0.0,
+        "rss_mb": sample["rss_mb"],
+        "temp_c": sample["temp_c"] or 0.0,
+        "throttled": sample["throttled"],
+        "power_w": round(estimated_power, 1),
+        "sampled_at": sample["time"],
+        "governor_level": governor.settings['name'] if governor else None
+    }
+
+def resource_event():
+    """'resources' event: the cached snapshot"""
+    try:
+        return resource_snapshot()
+    except Exception as e:
+        return {"error": str(e)}
+
+events.add_producer('test_results', config.EVENTS_STATS_INTERVAL, test_results_snapshot)
+events.add_producer('resources', config.EVENTS_RESOURCE_INTERVAL, resource_event)
+
+@app.route('/events')
+def event_stream():
+    """Server-Sent Events: 'test_results' and 'resources' snapshots at their own rates"""
+    return Response(events.subscribe(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/export_test_data', methods=['POST'])
 def export_test_data():
     """Export test data with enhanced CSV and metadata"""
@@ -1658,24 +1835,16 @@ def export_test_data():
         csv_filename = f"{scenario_name}_{timestamp}.csv"
         csv_path = os.path.join(results_dir, csv_filename)
         
-        # Get resource stats (optional)
-        cpu_percent = 0
-        ram_gb = 0
-        try:
-            import psutil
-            cpu_percent = psutil.cpu_percent(interval=0.1)
-            memory = psutil.virtual_memory()
-            ram_gb = memory.used / (1024 ** 3)
-        except:
-            pass  # Resource stats optional
+        # Resource stats (latest background sample, fields are None without psutil / sensors)
+        resources = resource_monitor.snapshot()
+        cpu_percent = resources["cpu_percent"] or 0
+        ram_gb = resources["ram_gb"] or 0
         
         # Calculate statistics
         total = live_test_stats["total_detections"]
         drowsy = live_test_stats["drowsy_detected"]
         alert = live_test_stats["alert_detected"]
-        avg_inference = 0
-        if live_test_stats["inference_times"]:
-            avg_inference = sum(live_test_stats["inference_times"]) / len(live_test_stats["inference_times"])
+        latency = live_test_stats["inference_times"].summary()
         
         # Calculate duration
         duration_seconds = 0
@@ -1700,7 +1869,11 @@ def export_test_data():
             writer.writerow(['Total Detections', total])
             writer.writerow(['Drowsy Detected', drowsy])
             writer.writerow(['Alert Detected', alert])
-            writer.writerow(['Avg Inference Time (ms)', round(avg_inference, 2)])
+            writer.writerow(['Avg Inference Time (ms)', round(latency["mean"] or 0, 2)])
+            for name in ("p50", "p90", "p99", "min", "max"):
+                value = latency[name]
+                writer.writerow([f'{name.capitalize()} Inference Time (ms)', round(value, 2) if value is not None else ''])
+            writer.writerow(['Inference Time Samples', latency["samples"]])
             writer.writerow([])
             
             # Resource Usage
@@ -1708,12 +1881,14 @@ def export_test_data():
             writer.writerow(['Resource', 'Value'])
             writer.writerow(['CPU Usage (%)', round(cpu_percent, 1)])
             writer.writerow(['RAM Usage (GB)', round(ram_gb, 2)])
+            writer.writerow(['Process RSS (MB)', resources["rss_mb"] if resources["rss_mb"] is not None else ''])
+            writer.writerow(['SoC Temperature (C)', resources["temp_c"] if resources["temp_c"] is not None else ''])
             writer.writerow([])
             
             # Inference Times
             writer.writerow(['Inference Times (ms)'])
             writer.writerow(['Sample', 'Time (ms)'])
-            for idx, inf_time in enumerate(live_test_stats["inference_times"], 1):
+            for idx, inf_time in enumerate(live_test_stats["inference_times"].values().tolist(), 1):
                 writer.writerow([idx, round(inf_time, 2)])
         
         
@@ -1726,22 +1901,27 @@ def export_test_data():
         }
         
         # Auto-capture face photo with bounding boxes for documentation
+        photo_path = None
         try:
-            with lock:
-                if output_frame is not None:
-                    frame = output_frame.copy()
-                    
-                    # Draw bounding boxes on frame
-                    frame_with_boxes = draw_bounding_boxes(frame)
-                    
-                    photo_filename = f"{scenario_name}_{timestamp}.jpg"
-                    photo_path = os.path.join(results_dir, photo_filename)
-                    cv2.imwrite(photo_path, frame_with_boxes, [cv2.IMWRITE_JPEG_QUALITY, 95])
-                    logger.info(f"📸 Face photo saved: {photo_filename}")
-                    response_data["photo_filename"] = photo_filename
+            bus_frame = frame_bus.latest()
+            
+            if bus_frame is not None and detection_cache is not None:
+                # Draw cached bounding boxes on frame
+                frame_with_boxes = draw_bounding_boxes(bus_frame.image, detection_cache.get_frame(bus_frame, with_eyes=True))
+                
+                photo_filename = f"{scenario_name}_{timestamp}.jpg"
+                photo_path = os.path.join(results_dir, photo_filename)
+                cv2.imwrite(photo_path, frame_with_boxes, [cv2.IMWRITE_JPEG_QUALITY, 95])
+                logger.info(f"📸 Face photo saved: {photo_filename}")
+                response_data["photo_filename"] = photo_filename
         except Exception as photo_error:
             logger.warning(f"Failed to save photo: {photo_error}")
         
+        if session_store is not None:
+            # The export names the scenario of the running session
+            session_store.set_scenario(scenario_name)
+            session_store.add_export(scenario_name, csv_path, photo_path)
+        
         return jsonify(response_data)
 
         
@@ -1760,14 +1940,16 @@ def reset_test_stats():
     live_test_stats["drowsy_detected"] = 0
     live_test_stats["alert_detected"] = 0
     live_test_stats["start_time"] = None
-    live_test_stats["inference_times"] = []
+    live_test_stats["inference_times"].clear()
+    if session_store is not None:
+        session_store.new_session(live_test_stats["current_scenario"], event_log.path if event_log else None)
     
     return jsonify({"success": True, "message": "Statistics reset"})
 
 @app.route('/capture_frame', methods=['POST'])
 def capture_frame():
     """Capture current frame with bounding boxes"""
-    global output_frame, lock
+    global frame_bus
     
     try:
         import os
@@ -1778,13 +1960,15 @@ def capture_frame():
         scenario_name = data.get('scenario_name', 'capture')
         
         # Get current frame
-        with lock:
-            if output_frame is None:
-                return jsonify({"success": False, "error": "No frame available"}), 503
-            frame = output_frame.copy()
+        bus_frame = frame_bus.latest()
+        if bus_frame is None:
+            return jsonify({"success": False, "error": "No frame available"}), 503
         
-        # Draw bounding boxes on frame
-        frame_with_boxes = draw_bounding_boxes(frame)
+        # Draw cached bounding boxes on frame
+        if detection_cache is not None:
+            frame_with_boxes = draw_bounding_boxes(bus_frame.image, detection_cache.get_frame(bus_frame, with_eyes=True))
+        else:
+            frame_with_boxes = bus_frame.image
         
         # Create test_results directory if not exists
         results_dir = os.path.join(os.path.dirname(__file__), 'test_results')
@@ -1868,6 +2052,16 @@ if __name__ == '__main__':
         print("   Please fix model compatibility issue.")
         # Don't exit - allow app to run for testing interface
     
+    resource_monitor.start()  # Governor and resource routes read its samples
+    event_log = start_event_log("app")
+    if event_log is not None:
+        print(f"📝 Event log: {event_log.path}")
+    session_store = start_session_store("app", event_log)
+    if session_store is not None:
+        print(f"🗄️ Session store: {session_store.path}")
+    if config.GOVERNOR:
+        start_governor()
+    
     if initialize_hardware():
         print("✅ Hardware alerts enabled")
     else:
@@ -1890,9 +2084,18 @@ if __name__ == '__main__':
         stop_capture_thread = True
         time.sleep(0.5)  # Give thread time to stop
         
+        if governor:
+            governor.stop()
+        resource_monitor.stop()
+        if event_log is not None:
+            event_log.close()
+        if session_store is not None:
+            session_store.close()
+        if inference_worker:
+            inference_worker.stop()
         if hardware:
             hardware.cleanup()
-        if camera_type == "opencv" and camera:
+        if camera_type in ("opencv",) + FILE_SOURCES and camera:
             camera.release()
         elif camera_type == "picamera2" and camera:
             try:
@@ -1919,7 +2122,11 @@ if __name__ == '__main__':
     signal.signal(signal.SIGTERM, signal_handler)
     
     try:
-        app.run(host='0.0.0.0', port=5000, threaded=True, debug=False, use_reloader=False)
+        # Async server: stream viewers and event subscribers cost a task each, not a thread
+        if not (config.ASYNC_SERVER and serve_async(app, {
+                '/video_feed': ('multipart/x-mixed-replace; boundary=frame', stream_encoder.async_viewer),
+                '/events': ('text/event-stream', events.async_subscribe)})):
+            app.run(host='0.0.0.0', port=5000, threaded=True, debug=False, use_reloader=False)
     except KeyboardInterrupt:
         print("\n⏹️ Server stopped")
     finally:
@@ -14,8 +14,28 @@ import cv2
 import threading
 import numpy as np
 import logging
+import sqlite3
 import time
 
+from face_detection import DetectionCache, create_face_tracker, face_crops
+from frame_bus import FrameBus
+from mjpeg_stream import MJPEGBroadcaster
+from async_server import serve_async
+from camera_sources import (FILE_SOURCES, capture_picamera2, capture_timestamp, configure_picamera2,
+                            crop_channel_order, lores_size, open_file_source, read_frame, source_ended)
+from governor import PerformanceGovernor
+from inference import BatchInference, get_interpreter_class, load_interpreter, reload_interpreter
+from inference_worker import InferenceWorker
+from event_log import start_event_log
+from metrics import CONTENT_TYPE, stage_metrics
+from resource_monitor import resource_monitor
+from session_store import query_episodes, query_minutes, query_sessions, start_session_store
+from drowsiness_state import FaceStates
+from event_stream import EventBroadcaster
+from pipeline import Pipeline
+from rate_scheduler import RateScheduler
+import config
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -26,21 +46,30 @@ app = Flask(__name__)
 # GLOBAL VARIABLES
 # ============================================================
 camera = None
-output_frame = None
-lock = threading.Lock()
+frame_bus = FrameBus()  # Captured frames shared by detection loop, stream and routes
 camera_type = None
 interpreter = None
+interpreter_settings = None  # Threads / XNNPACK used for the interpreter
 input_details = None
 output_details = None
 face_cascade = None
 eye_cascade = None
+detection_cache = None  # Face/eye detections shared by loop, stream and routes
+batch_inference = None  # Runs all face crops of a frame through one invoke()
 inference_lock = threading.Lock()
+detection_pipeline = None  # Detect -> infer -> decide stages (DROWSY_PIPELINE)
+inference_worker = None  # Detection + inference process (DROWSY_INFERENCE_WORKER)
+rate_scheduler = RateScheduler()  # Detection rate follows the driver state
+governor = None  # Thermal / load governor (DROWSY_GOVERNOR)
+event_log = None  # Binary per-frame session log (DROWSY_EVENT_LOG)
+session_store = None  # SQLite session history (DROWSY_SESSION_STORE)
+events = EventBroadcaster()  # Status / stats pushed to dashboards over /events
 stop_capture_thread = False
 stop_detection_thread = False
 
-# Drowsy duration tracking
-drowsy_start_time = None
+# Drowsy duration tracking (one timer per face)
 drowsy_duration_threshold = 3.0  # seconds
+face_states = FaceStates(drowsy_duration_threshold)
 
 # Current detection state (for UI display)
 current_state = {
@@ -49,7 +78,8 @@ current_state = {
     "confidence": None,
     "drowsy_duration": 0,
     "alarm_active": False,
-    "face_detected": False
+    "face_detected": False,
+    "faces": []
 }
 state_lock = threading.Lock()
 
@@ -492,16 +522,25 @@ HTML_TEMPLATE = """
         let fpsCounter = 0;
         let lastFpsUpdate = Date.now();
         
-        // Auto-start detection on page load
+        // Fallback for browsers without Server-Sent Events
         function autoDetect() {
             fetch('/get_status')
                 .then(r => r.json())
                 .then(data => {
                     updateUI(data);
+                    updateStats(data.stats);
                 })
                 .catch(err => console.error('Detection error:', err));
         }
         
+        // Status is pushed when it changes, statistics once per second
+        function connectEvents() {
+            const source = new EventSource('/events');
+            source.addEventListener('status', e => updateUI(JSON.parse(e.data)));
+            source.addEventListener('stats', e => updateStats(JSON.parse(e.data)));
+            source.onerror = () => console.error('Event stream interrupted, reconnecting...');
+        }
+        
         function updateUI(data) {
             // Update status badge
             const statusBadge = document.getElementById('status-badge');
@@ -548,11 +587,6 @@ HTML_TEMPLATE = """
                 alarmOverlay.classList.add('hidden');
             }
             
-            // Update statistics
-            document.getElementById('total-detections').textContent = data.stats.total;
-            document.getElementById('drowsy-count').textContent = data.stats.drowsy;
-            document.getElementById('alert-count').textContent = data.stats.alert;
-            
             // Update uptime
             const uptime = Math.floor((Date.now() - startTime) / 1000);
             document.getElementById('uptime').textContent = uptime + 's';
@@ -567,6 +601,12 @@ HTML_TEMPLATE = """
             }
         }
         
+        function updateStats(stats) {
+            document.getElementById('total-detections').textContent = stats.total;
+            document.getElementById('drowsy-count').textContent = stats.drowsy;
+            document.getElementById('alert-count').textContent = stats.alert;
+        }
+        
         function updateLEDs(state) {
             const greenLED = document.getElementById('led-green');
             const yellowLED = document.getElementById('led-yellow');
@@ -597,11 +637,13 @@ HTML_TEMPLATE = """
             })
             .catch(err => console.error('Health check error:', err));
         
-        // Auto-detect every 100ms (10 FPS)
-        setInterval(autoDetect, 100);
-        
-        // Initial detection
-        autoDetect();
+        if (window.EventSource) {
+            connectEvents();
+        } else {
+            // Poll every 100ms (10 FPS)
+            setInterval(autoDetect, 100);
+            autoDetect();
+        }
     </script>
 </body>
 </html>
@@ -617,13 +659,13 @@ def initialize_picamera2():
         from picamera2 import Picamera2
         
         cam = Picamera2()
-        config = cam.create_video_configuration(
-            main={"size": (640, 480), "format": "RGB888"}
-        )
-        cam.configure(config)
+        # 640x480 main stream (BGR in memory) + lores YUV stream for face detection
+        cam.configure(configure_picamera2(cam))
         cam.start()
         
         logger.info("✅ Raspberry Pi Camera Module initialized (picamera2)")
+        if lores_size(cam):
+            logger.info(f"   Lores detection stream: {lores_size(cam)[0]}x{lores_size(cam)[1]} (Y plane)")
         return cam, "picamera2"
     except Exception as e:
         logger.warning(f"picamera2 error: {e}")
@@ -662,19 +704,35 @@ def initialize_opencv_camera():
         logger.warning(f"OpenCV camera error: {e}")
         return None, None
 
+def initialize_file_source():
+    """Video file / image directory / synthetic frames instead of a camera (DROWSY_CAMERA_SOURCE)"""
+    try:
+        cam = open_file_source()
+        logger.info(f"✅ {cam.describe()}")
+        return cam, config.CAMERA_SOURCE
+    except Exception as e:
+        logger.error(f"❌ Camera source error: {e}")
+        return None, None
+
 def initialize_camera():
-    """Initialize camera - try USB webcam first, then picamera2"""
+    """Initialize camera - try USB webcam first, then picamera2 (DROWSY_CAMERA_SOURCE picks one or a file source)"""
     global camera, camera_type
     
+    if config.CAMERA_SOURCE in FILE_SOURCES:
+        camera, camera_type = initialize_file_source()
+        return camera is not None
+    
     # Try USB camera first (faster if webcam is connected)
-    camera, camera_type = initialize_opencv_camera()
-    if camera:
-        return True
+    if config.CAMERA_SOURCE != "picamera2":
+        camera, camera_type = initialize_opencv_camera()
+        if camera:
+            return True
     
     # Fallback to Pi Camera
-    camera, camera_type = initialize_picamera2()
-    if camera:
-        return True
+    if config.CAMERA_SOURCE != "opencv":
+        camera, camera_type = initialize_picamera2()
+        if camera:
+            return True
     
     logger.error("❌ No camera found!")
     return False
@@ -685,25 +743,15 @@ def initialize_camera():
 
 def initialize_model():
     """Initialize TFLite model"""
-    global interpreter, input_details, output_details, face_cascade, eye_cascade
+    global interpreter, interpreter_settings, input_details, output_details, batch_inference, face_cascade, eye_cascade, detection_cache
     
     try:
         # Try different TFLite interpreter imports
-        Interpreter = None
-        try:
-            from tflite_runtime.interpreter import Interpreter
-            logger.info("Using tflite-runtime")
-        except ImportError:
-            try:
-                from tensorflow.lite.python.interpreter import Interpreter
-                logger.info("Using tensorflow.lite")
-            except ImportError:
-                try:
-                    from ai_edge_litert.interpreter import Interpreter
-                    logger.info("Using ai_edge_litert (TF 2.19+)")
-                except ImportError:
-                    logger.error("❌ No TFLite interpreter found!")
-                    return False
+        Interpreter, backend = get_interpreter_class()
+        if Interpreter is None:
+            logger.error("❌ No TFLite interpreter found!")
+            return False
+        logger.info(f"Using {backend}")
         
         import os
         model_path = os.path.join(os.path.dirname(__file__), 'best_model_compatible.tflite')
@@ -712,14 +760,17 @@ def initialize_model():
             logger.error(f"❌ Model file not found: {model_path}")
             return False
         
-        interpreter = Interpreter(model_path=model_path)
-        interpreter.allocate_tensors()
+        interpreter, interpreter_settings = load_interpreter(model_path)
         
         input_details = interpreter.get_input_details()
         output_details = interpreter.get_output_details()
+        batch_inference = BatchInference(interpreter)
         
-        logger.info(f"✅ Model loaded: {model_path}")
+        logger.info(f"✅ Model loaded: {interpreter_settings['model_path']} (variant: {interpreter_settings['variant']})")
         logger.info(f"   Input shape: {input_details[0]['shape']}")
+        logger.info(f"   Threads: {interpreter_settings['num_threads']}, "
+                    f"XNNPACK: {'on' if interpreter_settings['xnnpack'] else 'off'} "
+                    f"({interpreter_settings['source']})")
         
         # Load face cascade
         cascade_paths = [
@@ -762,6 +813,12 @@ def initialize_model():
         
         if eye_cascade is None or eye_cascade.empty():
             logger.warning("⚠️ Eye cascade not found - will only show face box")
+            eye_cascade = None
+        
+        detection_cache = DetectionCache(face_cascade, eye_cascade, create_face_tracker(face_cascade))
+        
+        if config.INFERENCE_WORKER:
+            start_inference_worker(model_path, cascade_path)
         
         return True
         
@@ -771,6 +828,56 @@ def initialize_model():
         traceback.print_exc()
         return False
 
+def start_inference_worker(model_path, cascade_path):
+    """Move face detection + inference into a worker process (DROWSY_INFERENCE_WORKER)
+
+    The in-process interpreter stays loaded for /health and as a fallback
+    when the worker cannot be started.
+    """
+    global inference_worker, detection_cache
+    
+    worker = InferenceWorker(model_path, cascade_path)
+    if not worker.start():
+        logger.warning("⚠️ Inference worker not started - detecting in-process")
+        return False
+    
+    inference_worker = worker
+    worker.configure(channel_order=crop_channel_order(camera_type))
+    # Faces now come from the worker, the stream reuses them instead of running the cascade
+    detection_cache = DetectionCache(None, eye_cascade)
+    logger.info(f"✅ Inference worker started (pid {worker.process.pid}, {worker.num_slots} shared memory slots, "
+                f"{worker.settings['num_threads']} threads)")
+    return True
+
+def start_governor():
+    """Step quality down when the Pi runs hot or out of CPU (DROWSY_GOVERNOR)"""
+    global governor
+    
+    base_threads = interpreter_settings['num_threads'] if interpreter_settings else 1
+    # Reads temperature and load from resource_monitor
+    governor = PerformanceGovernor(base_threads, on_change=apply_governor_settings).start()
+    logger.info(f"✅ Governor started (warm {config.GOVERNOR_TEMP_WARM:g}°C / CPU {config.GOVERNOR_CPU_HIGH:g}%, "
+                f"hot {config.GOVERNOR_TEMP_HOT:g}°C)")
+
+def apply_governor_settings(settings):
+    """Apply a governor level: detection resolution and inference threads
+    
+    Stream FPS and JPEG quality are read by generate_frames() itself.
+    """
+    global interpreter, interpreter_settings, input_details, output_details, batch_inference
+    
+    if detection_cache is not None:
+        detection_cache.detect_scale = settings['detect_scale']
+    if inference_worker is not None:
+        inference_worker.configure(detect_scale=settings['detect_scale'], num_threads=settings['num_threads'])
+        return
+    if interpreter_settings and settings['num_threads'] != interpreter_settings['num_threads']:
+        with inference_lock:
+            interpreter, interpreter_settings = reload_interpreter(interpreter_settings, settings['num_threads'])
+            input_details = interpreter.get_input_details()
+            output_details = interpreter.get_output_details()
+            batch_inference = BatchInference(interpreter)
+
 # ============================================================
 # HARDWARE ALERT CLASS
 # ============================================================
@@ -797,6 +904,7 @@ class HardwareAlert:
         logger.info(f"   Buzzer: GPIO{self.BUZZER_PIN}")
         logger.info(f"   RGB LED: R=GPIO{self.LED_RED_PIN}, G=GPIO{self.LED_GREEN_PIN}, B=GPIO{self.LED_BLUE_PIN}")
     
+    @stage_metrics.timed("gpio")
     def set_led(self, red=0, yellow=0, green=0):
         """Set individual LEDs (0=off, 100=on)"""
         self.led_r.value = red / 100.0
@@ -821,12 +929,14 @@ class HardwareAlert:
     
     def buzzer_on(self):
         if not self.buzzer_active:
-            self.buzzer.on()
+            with stage_metrics.time("gpio"):
+                self.buzzer.on()
             self.buzzer_active = True
     
     def buzzer_off(self):
         if self.buzzer_active:
-            self.buzzer.off()
+            with stage_metrics.time("gpio"):
+                self.buzzer.off()
             self.buzzer_active = False
     
     def cleanup(self):
@@ -867,7 +977,7 @@ def initialize_hardware():
 
 def capture_frames():
     """Capture frames in background thread"""
-    global camera, output_frame, lock, camera_type, stop_capture_thread
+    global camera, frame_bus, camera_type, stop_capture_thread
     
     logger.info("🎥 Frame capture thread started")
     
@@ -884,14 +994,18 @@ def capture_frames():
     
     logger.info(f"Camera ready: type={camera_type}")
     
+    # picamera2 lores stream size (None for USB cameras)
+    lores = lores_size(camera) if camera_type == "picamera2" else None
+    
     consecutive_failures = 0
     max_consecutive_failures = 50  # Allow 50 consecutive failures before giving up
     
     while not stop_capture_thread:
         try:
             if camera_type == "picamera2":
-                frame = camera.capture_array()
-                frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
+                # Main stream is already BGR, detection reads the lores Y plane
+                with stage_metrics.time("capture"):
+                    frame, gray, gray_scale = capture_picamera2(camera, lores)
                 consecutive_failures = 0  # Reset on success
             else:
                 # OpenCV camera
@@ -904,9 +1018,12 @@ def capture_frames():
                     time.sleep(0.5)
                     continue
                 
-                # Try to read frame
-                ret, frame = camera.read()
+                # Try to read frame (straight into the frame bus slot)
+                ret, frame = read_frame(camera, frame_bus.next_slot())
                 if not ret:
+                    if source_ended(camera):
+                        logger.info("⏹️ End of camera source")
+                        break
                     consecutive_failures += 1
                     logger.warning(f"Failed to read frame (attempt {consecutive_failures}/{max_consecutive_failures})")
                     
@@ -919,9 +1036,9 @@ def capture_frames():
                 
                 # Success - reset failure counter
                 consecutive_failures = 0
+                gray, gray_scale = None, 1.0
             
-            with lock:
-                output_frame = frame.copy()
+            frame_bus.publish(frame, timestamp=capture_timestamp(camera), gray=gray, gray_scale=gray_scale)
                 
         except Exception as e:
             consecutive_failures += 1
@@ -935,83 +1052,54 @@ def capture_frames():
     
     logger.info("🎥 Frame capture thread stopped")
 
+def stream_settings():
+    """(max FPS, JPEG quality) of the MJPEG stream, lowered by the governor when hot"""
+    if governor is None:
+        return 15, 50
+    settings = governor.settings
+    return settings['stream_fps'], settings['jpeg_quality']
+
+def render_stream_frame(bus_frame):
+    """Stream image of a bus frame with bounding boxes"""
+    frame = bus_frame.image
+    
+    # Draw bounding boxes (detections are shared with the detection loop)
+    if detection_cache is not None:
+        frame = draw_bounding_boxes(frame, detection_cache.get_frame(bus_frame, with_eyes=True))
+    return frame
+
+# One encoder for all viewers, running only while someone watches
+stream_encoder = MJPEGBroadcaster(frame_bus, render_stream_frame, stream_settings)
+stage_metrics.add_gauge("stream_viewers", "Connected MJPEG viewers", lambda: stream_encoder.viewers)
+stage_metrics.add_gauge("event_subscribers", "Connected /events clients", lambda: events.subscribers)
+stage_metrics.add_gauge("cpu_percent", "CPU load, % of all cores", lambda: resource_monitor.snapshot()["cpu_percent"])
+stage_metrics.add_gauge("soc_temperature_celsius", "SoC temperature", lambda: resource_monitor.snapshot()["temp_c"])
+
 def generate_frames():
-    """Generate frames for MJPEG streaming with bounding boxes"""
-    global output_frame, lock
-    
-    last_frame_time = 0
-    frame_interval = 1.0 / 15  # 15 FPS max
-    
-    while True:
-        current_time = time.time()
-        if current_time - last_frame_time < frame_interval:
-            time.sleep(0.01)
-            continue
-        
-        with lock:
-            if output_frame is None:
-                time.sleep(0.01)
-                continue
-            frame = output_frame.copy()
-        
-        # Draw bounding boxes
-        frame = draw_bounding_boxes(frame)
-        
-        small = cv2.resize(frame, (480, 360))
-        
-        ret, buffer = cv2.imencode('.jpg', small, [cv2.IMWRITE_JPEG_QUALITY, 50])
-        if not ret:
-            continue
-        
-        last_frame_time = current_time
-        
-        yield (b'--frame\r\n'
-               b'Content-Type: image/jpeg\r\n\r\n' + buffer.tobytes() + b'\r\n')
+    """MJPEG stream of one viewer (JPEGs are shared by all viewers)"""
+    return stream_encoder.viewer()
 
 # ============================================================
 # BOUNDING BOX DRAWING
 # ============================================================
 
-def draw_bounding_boxes(frame):
-    """Draw face and eye bounding boxes on frame"""
-    global face_cascade, eye_cascade
-    
-    if face_cascade is None:
-        return frame
-    
+def draw_bounding_boxes(frame, detections):
+    """Draw cached face and eye bounding boxes on frame"""
     frame_with_boxes = frame.copy()
-    gray = cv2.cvtColor(frame_with_boxes, cv2.COLOR_BGR2GRAY)
     
-    faces = face_cascade.detectMultiScale(
-        gray,
-        scaleFactor=1.1,
-        minNeighbors=4,
-        minSize=(30, 30)
-    )
-    
-    for (x, y, w, h) in faces:
+    for i, (x, y, w, h) in enumerate(detections.faces):
         # Draw face rectangle (green)
         cv2.rectangle(frame_with_boxes, (x, y), (x+w, y+h), (0, 255, 0), 2)
         cv2.putText(frame_with_boxes, 'Face', (x, y-10),
                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
         
-        # Detect eyes
-        if eye_cascade is not None:
+        # Draw eyes
+        if eye_cascade is not None and detections.eyes is not None:
             eye_region_height = int(h * 0.6)
-            roi_gray = gray[y:y+eye_region_height, x:x+w]
             roi_color = frame_with_boxes[y:y+eye_region_height, x:x+w]
-            
-            eyes = eye_cascade.detectMultiScale(
-                roi_gray,
-                scaleFactor=1.1,
-                minNeighbors=10,
-                minSize=(30, 30)
-            )
+            eyes = detections.eyes[i]
             
             if len(eyes) > 0:
-                eyes_sorted = sorted(eyes, key=lambda e: e[2] * e[3], reverse=True)
-                eyes = eyes_sorted[:2]
-                
                 for (ex, ey, ew, eh) in eyes:
                     cv2.rectangle(roi_color, (ex, ey), (ex+ew, ey+eh), (255, 0, 0), 2)
             else:
@@ -1038,151 +1126,294 @@ def draw_bounding_boxes(frame):
 # PREDICTION FUNCTION
 # ============================================================
 
-def predict_drowsiness(frame, threshold=0.65):
-    """Predict drowsiness from frame"""
-    global interpreter, input_details, output_details, face_cascade
-    
-    if interpreter is None or face_cascade is None:
-        return False, None, None
-    
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    
-    faces = face_cascade.detectMultiScale(
-        gray, 
-        scaleFactor=1.1,
-        minNeighbors=4,
-        minSize=(30, 30)
-    )
+def detect_faces_in_frame(frame, frame_seq=None, gray=None, gray_scale=1.0, copy=False, timings=None):
+    """Detection step: (boxes, crops) of the faces to classify (faces come from the detection cache)
+
+    `timings` (optional dict) receives the frame's conversion, cascade and crop seconds.
+    """
+    global detection_cache
+    
+    if detection_cache is None:
+        return [], []
+    
+    detections = detection_cache.get(frame_seq, frame, gray=gray, gray_scale=gray_scale)
+    
+    # Largest face, or up to MAX_FACES faces in multi-face mode
+    start = time.perf_counter()
+    boxes, crops = face_crops(frame, detections.faces, copy=copy, channel_order=crop_channel_order(camera_type))
+    if timings is not None:
+        # Whoever ran the cascade for this frame (detection or stream), its cost is counted here once
+        timings.update(detections.timings, crop=time.perf_counter() - start)
+    return boxes, crops
+
+def classify_faces(boxes, crops, threshold=0.65, timings=None):
+    """Inference step: [(box, is_drowsy, confidence), ...], all faces in one invoke()"""
+    global interpreter, batch_inference
     
-    if len(faces) == 0:
-        return False, None, None
+    if interpreter is None or not crops:
+        return []
     
-    x, y, w, h = max(faces, key=lambda f: f[2] * f[3])
+    with inference_lock:
+        # Resize + normalise straight into the interpreter's input tensor, one invoke() for all faces
+        confidences = batch_inference.run(crops, timings=timings)
     
-    face_roi = frame[y:y+h, x:x+w]
-    if face_roi.size == 0:
-        return False, None, None
+    # Lower confidence = drowsy (eyes closed)
+    return [(box, bool(conf < threshold), float(conf)) for box, conf in zip(boxes, confidences)]
+
+def predict_drowsiness(frame, threshold=0.65, frame_seq=None, gray=None, gray_scale=1.0, timings=None):
+    """Predict drowsiness for the faces in a frame (detection + inference steps)
+
+    Returns [(box, is_drowsy, confidence), ...]: the driver's face, or up to
+    MAX_FACES faces in multi-face mode, all run through one invoke().
+    """
+    boxes, crops = detect_faces_in_frame(frame, frame_seq, gray, gray_scale, timings=timings)
+    return classify_faces(boxes, crops, threshold, timings=timings)
+
+# ============================================================
+# ALARM DECISION
+# ============================================================
+
+def update_alarm(results, current_time):
+    """Decision step: per-face drowsy timers, LEDs/buzzer, UI state and statistics"""
+    global current_state, state_lock, face_states, hardware, stats
+    
+    face_states.alarm_threshold = drowsy_duration_threshold
+    with stage_metrics.time("state_update"):
+        faces = face_states.update(results, current_time)
+        primary = face_states.primary()  # Most severe face drives LEDs/buzzer
+    # Raw per-frame prediction: one closed-eye frame restores the full rate at once
+    rate_scheduler.update(face_states.frame_status(), current_time)
+    
+    for face in faces:
+        label = f"Face {face.face_id}: " if config.MULTI_FACE else ""
+        if face.recovered_after is not None:
+            logger.info(f"✅ {label}Alert state restored (was drowsy for {face.recovered_after:.1f}s)")
+        elif face.started:
+            logger.info(f"⏱️ {label}Drowsy state started")
+    
+    if primary is None:
+        if hardware:
+            hardware.led_off()
+            hardware.buzzer_off()
+        
+        with state_lock:
+            current_state.update({
+                "status": "NO FACE",
+                "is_drowsy": False,
+                "confidence": None,
+                "drowsy_duration": 0,
+                "alarm_active": False,
+                "face_detected": False,
+                "faces": []
+            })
+        publish_status()
+        return
     
-    face_roi = cv2.resize(face_roi, (224, 224))
-    input_data = np.expand_dims(face_roi, axis=0)
+    # Update statistics (one detection per face)
+    for face in faces:
+        stats["total_detections"] += 1
+        if face.is_drowsy:
+            stats["drowsy_count"] += 1
+        else:
+            stats["alert_count"] += 1
     
-    if input_details[0]['dtype'] == np.uint8:
-        input_data = input_data.astype(np.uint8)
+    if primary.alarm_active:
+        logger.warning(f"⚠️ ALARM! Drowsy for {primary.drowsy_duration:.1f}s")
+        if hardware:
+            hardware.led_red()
+            hardware.buzzer_on()
+    elif primary.is_drowsy:
+        logger.info(f"🔍 Drowsy duration: {primary.drowsy_duration:.1f}s / {drowsy_duration_threshold}s")
+        if hardware:
+            hardware.led_yellow()
+            hardware.buzzer_off()
     else:
-        input_data = input_data.astype(np.float32) / 255.0
-    
-    with inference_lock:
-        interpreter.set_tensor(input_details[0]['index'], input_data)
-        interpreter.invoke()
-        output = interpreter.get_tensor(output_details[0]['index']).copy()
+        if hardware:
+            hardware.led_green()
+            hardware.buzzer_off()
     
-    if output_details[0]['dtype'] == np.uint8:
-        quant_scale, zero_point = output_details[0]['quantization']
-        confidence = (float(output[0][0]) - zero_point) * quant_scale
+    with state_lock:
+        current_state.update({
+            "status": primary.status,
+            "is_drowsy": primary.is_drowsy,
+            "confidence": primary.confidence,
+            "drowsy_duration": primary.drowsy_duration,
+            "alarm_active": primary.alarm_active,
+            "face_detected": True,
+            "faces": [face.to_dict() for face in faces]
+        })
+    publish_status()
+
+def status_snapshot():
+    """Current decision for /get_status and the 'status' event"""
+    with state_lock:
+        state_copy = current_state.copy()
+    state_copy["alarm_threshold"] = drowsy_duration_threshold
+    return state_copy
+
+def stats_snapshot():
+    """Detection counters for /get_status and the 'stats' event"""
+    return {
+        "total": stats["total_detections"],
+        "drowsy": stats["drowsy_count"],
+        "alert": stats["alert_count"]
+    }
+
+def publish_status():
+    """Push the decision to /events subscribers (skipped when nothing changed)"""
+    events.publish('status', status_snapshot())
+
+events.add_producer('stats', config.EVENTS_STATS_INTERVAL, stats_snapshot)
+
+# ============================================================
+# AUTO-DETECTION THREAD
+# ============================================================
+
+def read_bus_frame(reader, copy=False, classify=False):
+    """Detection step on the next bus frame, return a pipeline item or None on timeout
+
+    Without `copy` the crops are views into the bus slot, so `classify`
+    runs the inference step too before the slot is released.
+    """
+    # Block until a frame newer than the last processed one arrives
+    bus_frame = reader.next(timeout=0.5)
+    if bus_frame is None:
+        return None
+    
+    timings = {}
+    boxes, crops = detect_faces_in_frame(
+        bus_frame.image, bus_frame.seq, bus_frame.gray, bus_frame.gray_scale, copy=copy, timings=timings)
+    item = {"timestamp": bus_frame.timestamp, "seq": bus_frame.seq, "timings": timings}
+    if classify:
+        item["results"] = classify_faces(boxes, crops, threshold=0.65, timings=timings)
     else:
-        confidence = float(output[0][0])
+        item.update(boxes=boxes, crops=crops)
+    if not reader.release(bus_frame):
+        logger.warning("Frame slot reused during detection - increase DROWSY_FRAME_BUS_SLOTS")
+    return item
+
+def submit_bus_frame(reader):
+    """Hand the next bus frame to the inference worker (detection + inference run there)"""
+    # Wait for a free slot first, then take the newest frame
+    if not inference_worker.reserve(timeout=0.5):
+        return None
+    bus_frame = reader.next(timeout=0.5)
+    if bus_frame is None:
+        return None
+    
+    # Copied into a shared memory slot, the bus slot is free again right away;
+    # the stream draws the worker's boxes on a private copy once the result is in
+    submitted = inference_worker.submit(bus_frame.image, bus_frame.seq, bus_frame.gray, bus_frame.gray_scale)
+    image = bus_frame.image.copy() if submitted else None
+    if not reader.release(bus_frame):
+        logger.warning("Frame slot reused during detection - increase DROWSY_FRAME_BUS_SLOTS")
+    if not submitted:
+        return None
+    return {"timestamp": bus_frame.timestamp, "seq": bus_frame.seq, "image": image}
+
+def collect_worker_result(item, threshold=0.65):
+    """Wait for the worker's result of a submitted frame, return a pipeline item or None"""
+    result = inference_worker.collect(item["seq"])
+    if result is None:
+        return None
+    
+    # Share the worker's faces with the MJPEG stream
+    detection_cache.put(result["seq"], item["image"], result["faces"])
     
     # Lower confidence = drowsy (eyes closed)
-    is_drowsy = confidence < threshold
+    results = [(tuple(box), bool(conf < threshold), conf)
+               for box, conf in zip(result["boxes"], result["confidences"])]
+    return {"timestamp": item["timestamp"], "seq": item["seq"], "results": results,
+            "timings": result["timings"]}
+
+def next_detection(reader):
+    """Detection + inference of the next bus frame (sequential loop), None if there was none"""
+    if inference_worker is not None:
+        item = submit_bus_frame(reader)
+        return collect_worker_result(item) if item is not None else None
     
-    return True, is_drowsy, confidence
+    return read_bus_frame(reader, classify=True)
 
-# ============================================================
-# AUTO-DETECTION THREAD
-# ============================================================
+def decide(item):
+    """Decision step of a detected frame: alarm logic, latency metrics, event log"""
+    now = time.time()
+    stage_metrics.observe_timings(item["timings"])
+    stage_metrics.observe_decision(item["timestamp"], now)
+    update_alarm(item["results"], now)
+    primary, faces = face_states.primary(), len(face_states.current)
+    if event_log is not None:
+        event_log.record(item["timestamp"], item["seq"], primary, faces, item["timings"], now)
+    if session_store is not None:
+        session_store.record(item["timestamp"], primary, faces)
+
+def start_detection_pipeline(reader):
+    """Detect -> infer -> decide stages, each on its own thread (capture runs in capture_frames)
+
+    With the inference worker the first two stages become submit -> collect:
+    the worker process detects + classifies frame N while frame N+1 is
+    copied into the next shared memory slot.
+    """
+    # Crops are copied: the bus slot is released before the infer stage reads them
+    def detect_stage():
+        return read_bus_frame(reader, copy=True)
+    
+    def infer_stage(item):
+        return {"timestamp": item["timestamp"], "seq": item["seq"], "timings": item["timings"],
+                "results": classify_faces(item["boxes"], item["crops"], timings=item["timings"])}
+    
+    def decide_stage(item):
+        decide(item)
+        return item
+    
+    def on_error(name, e):
+        logger.error(f"Auto-detection {name} stage error: {e}")
+    
+    # The first stage is paced by the rate scheduler, the rest follow it
+    pipeline = Pipeline(on_error=on_error)
+    if inference_worker is not None:
+        pipeline.add_stage("submit", lambda: submit_bus_frame(reader), pacer=rate_scheduler)
+        pipeline.add_stage("collect", collect_worker_result)
+    else:
+        pipeline.add_stage("detect", detect_stage, pacer=rate_scheduler)
+        pipeline.add_stage("infer", infer_stage)
+    pipeline.add_stage("decide", decide_stage)
+    return pipeline.start()
 
 def auto_detection_loop():
     """Continuously detect drowsiness in background"""
-    global output_frame, lock, current_state, state_lock, drowsy_start_time
-    global hardware, stats, stop_detection_thread
+    global frame_bus, hardware, stats, stop_detection_thread, detection_pipeline
     
     logger.info("🤖 Auto-detection thread started")
     
+    reader = frame_bus.reader("detection")
+    
     # Initialize stats start time
     stats["start_time"] = time.time()
     
+    if config.PIPELINE:
+        # Paced by the rate scheduler, at most as fast as the slowest stage allows
+        detection_pipeline = start_detection_pipeline(reader)
+        logger.info(f"🧵 Detection pipeline: {' -> '.join(s.stage_name for s in detection_pipeline.stages)}")
+        while not stop_detection_thread:
+            time.sleep(0.2)
+        detection_pipeline.stop()
+    
     while not stop_detection_thread:
         try:
-            with lock:
-                if output_frame is None:
-                    time.sleep(0.1)
-                    continue
-                frame = output_frame.copy()
-            
-            face_detected, is_drowsy, confidence = predict_drowsiness(frame, threshold=0.65)
-            
-            current_time = time.time()
-            alarm_active = False
-            drowsy_duration = 0
+            # Wait for the next frame deadline (rate follows the driver state)
+            rate_scheduler.wait()
             
-            if not face_detected:
-                drowsy_start_time = None
-                if hardware:
-                    hardware.led_off()
-                    hardware.buzzer_off()
-                
-                with state_lock:
-                    current_state.update({
-                        "status": "NO FACE",
-                        "is_drowsy": False,
-                        "confidence": None,
-                        "drowsy_duration": 0,
-                        "alarm_active": False,
-                        "face_detected": False
-                    })
-            else:
-                # Update statistics
-                stats["total_detections"] += 1
-                
-                if is_drowsy:
-                    stats["drowsy_count"] += 1
-                    
-                    if drowsy_start_time is None:
-                        drowsy_start_time = current_time
-                        logger.info("⏱️ Drowsy state started")
-                    
-                    drowsy_duration = current_time - drowsy_start_time
-                    
-                    # Check if alarm should trigger
-                    if drowsy_duration >= drowsy_duration_threshold:
-                        alarm_active = True
-                        logger.warning(f"⚠️ ALARM! Drowsy for {drowsy_duration:.1f}s")
-                        if hardware:
-                            hardware.led_red()
-                            hardware.buzzer_on()
-                    else:
-                        logger.info(f"🔍 Drowsy duration: {drowsy_duration:.1f}s / {drowsy_duration_threshold}s")
-                        if hardware:
-                            hardware.led_yellow()
-                            hardware.buzzer_off()
-                else:
-                    stats["alert_count"] += 1
-                    
-                    if drowsy_start_time is not None:
-                        logger.info(f"✅ Alert state restored (was drowsy for {current_time - drowsy_start_time:.1f}s)")
-                    drowsy_start_time = None
-                    drowsy_duration = 0
-                    if hardware:
-                        hardware.led_green()
-                        hardware.buzzer_off()
-                
-                with state_lock:
-                    current_state.update({
-                        "status": "DROWSY" if is_drowsy else "ALERT",
-                        "is_drowsy": is_drowsy,
-                        "confidence": confidence,
-                        "drowsy_duration": drowsy_duration,
-                        "alarm_active": alarm_active,
-                        "face_detected": True
-                    })
+            item = next_detection(reader)
+            if item is None:
+                continue
             
-            # Sleep to maintain ~10 FPS detection rate
-            time.sleep(0.1)
+            decide(item)
             
         except Exception as e:
             logger.error(f"Auto-detection error: {e}")
             time.sleep(0.1)
     
+    reader.close()
     logger.info("🤖 Auto-detection thread stopped")
 
 # ============================================================
@@ -1203,20 +1434,17 @@ def video_feed():
 @app.route('/get_status')
 def get_status():
     """Get current detection status"""
-    global current_state, state_lock, stats
-    
-    with state_lock:
-        state_copy = current_state.copy()
-    
-    state_copy["stats"] = {
-        "total": stats["total_detections"],
-        "drowsy": stats["drowsy_count"],
-        "alert": stats["alert_count"]
-    }
-    state_copy["alarm_threshold"] = drowsy_duration_threshold
+    state_copy = status_snapshot()
+    state_copy["stats"] = stats_snapshot()
     
     return jsonify(state_copy)
 
+@app.route('/events')
+def event_stream():
+    """Server-Sent Events: 'status' on every change, 'stats' every EVENTS_STATS_INTERVAL"""
+    return Response(events.subscribe(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/health')
 def health():
     """Health check"""
@@ -1225,10 +1453,67 @@ def health():
         'camera_type': camera_type,
         'camera_active': camera is not None,
         'model_loaded': interpreter is not None,
+        'interpreter': interpreter_settings,
         'face_cascade_loaded': face_cascade is not None,
-        'hardware_available': hardware is not None
+        'hardware_available': hardware is not None,
+        'detection_cache': detection_cache.get_stats() if detection_cache else None,
+        'batch_inference': batch_inference.get_stats() if batch_inference else None,
+        'pipeline': detection_pipeline.get_stats() if detection_pipeline else None,
+        'detection_rate': rate_scheduler.get_stats(),
+        'inference_worker': inference_worker.get_stats() if inference_worker else None,
+        'governor': governor.get_stats() if governor else None,
+        'events': events.get_stats(),
+        'stream': stream_encoder.get_stats(),
+        'frame_bus': frame_bus.get_stats(),
+        'latency': stage_metrics.summary(),
+        'resources': resource_monitor.snapshot(),
+        'event_log': event_log.get_stats() if event_log else None,
+        'session_store': session_store.get_stats() if session_store else None
     })
 
+@app.route('/metrics')
+def metrics():
+    """Prometheus text format: per-stage latency histograms, frame age, detection FPS"""
+    return Response(stage_metrics.render({'app': 'app_auto'}), content_type=CONTENT_TYPE)
+
+def session_page(query, *args):
+    """Streamed JSON page of a session_store query (503 when disabled, 500 when the database cannot be read)"""
+    if session_store is None:
+        return jsonify({'error': 'Session store disabled'}), 503
+    try:
+        page = query(session_store.path, *args)
+    except sqlite3.Error as e:
+        logger.error(f"Session store query failed: {e}")
+        return jsonify({'error': f'Session store unavailable: {e}'}), 500
+    return Response(page, mimetype='application/json')
+
+@app.route('/sessions')
+def sessions():
+    """Past sessions, newest first (?limit=&before=<id>&scenario=&since=&until=), streamed JSON"""
+    args = request.args
+    return session_page(query_sessions, args.get('limit', 50, type=int), args.get('before', type=int),
+                        args.get('scenario'), args.get('since', type=float), args.get('until', type=float))
+
+@app.route('/sessions/<int:session_id>/episodes')
+def session_episodes(session_id):
+    """Drowsy episodes of a session, oldest first (?limit=&after=<id>&alarms=1), streamed JSON"""
+    args = request.args
+    return session_page(query_episodes, session_id, args.get('limit', 50, type=int),
+                        args.get('after', type=int), args.get('alarms') == '1')
+
+@app.route('/sessions/<int:session_id>/minutes')
+def session_minutes(session_id):
+    """Per-minute aggregates of a session, oldest first (?limit=&after=<minute>), streamed JSON"""
+    args = request.args
+    return session_page(query_minutes, session_id, args.get('limit', 60, type=int), args.get('after', type=float))
+
+@app.route('/governor')
+def governor_status():
+    """Thermal / load governor level, readings and recent transitions"""
+    if governor is None:
+        return jsonify({'enabled': False})
+    return jsonify(governor.get_stats())
+
 # ============================================================
 # MAIN
 # ============================================================
@@ -1263,6 +1548,16 @@ if __name__ == '__main__':
         print("\n⚠️ WARNING: Model failed to load!")
         print("   App will run but predictions will not work.")
     
+    resource_monitor.start()  # Governor and resource routes read its samples
+    event_log = start_event_log("app_auto")
+    if event_log is not None:
+        print(f"📝 Event log: {event_log.path}")
+    session_store = start_session_store("app_auto", event_log)
+    if session_store is not None:
+        print(f"🗄️ Session store: {session_store.path}")
+    if config.GOVERNOR:
+        start_governor()
+    
     if initialize_hardware():
         print("✅ Hardware alerts enabled")
     else:
@@ -1294,9 +1589,18 @@ if __name__ == '__main__':
         stop_detection_thread = True
         time.sleep(0.5)
         
+        if governor:
+            governor.stop()
+        resource_monitor.stop()
+        if event_log is not None:
+            event_log.close()
+        if session_store is not None:
+            session_store.close()
+        if inference_worker:
+            inference_worker.stop()
         if hardware:
             hardware.cleanup()
-        if camera_type == "opencv" and camera:
+        if camera_type in ("opencv",) + FILE_SOURCES and camera:
             camera.release()
         elif camera_type == "picamera2" and camera:
             try:
@@ -1321,7 +1625,11 @@ if __name__ == '__main__':
     signal.signal(signal.SIGTERM, signal_handler)
     
     try:
-        app.run(host='0.0.0.0', port=5000, threaded=True, debug=False, use_reloader=False)
+        # Async server: stream viewers and event subscribers cost a task each, not a thread
+        if not (config.ASYNC_SERVER and serve_async(app, {
+                '/video_feed': ('multipart/x-mixed-replace; boundary=frame', stream_encoder.async_viewer),
+                '/events': ('text/event-stream', events.async_subscribe)})):
+            app.run(host='0.0.0.0', port=5000, threaded=True, debug=False, use_reloader=False)
     except KeyboardInterrupt:
         print("\n⏹️ Server stopped")
     finally:
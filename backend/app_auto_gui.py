@@ -10,27 +10,43 @@ if '/usr/lib/python3/dist-packages' not in sys.path:
     sys.path.insert(0, '/usr/lib/python3/dist-packages')
 
 import cv2
-import numpy as np
 import time
 import os
 from datetime import datetime
 
+from face_detection import create_face_tracker, face_crops, find_faces, scale_boxes
+from camera_sources import (FILE_SOURCES, capture_picamera2, capture_timestamp, configure_picamera2,
+                            crop_channel_order, lores_size, open_file_source, read_frame, source_ended)
+from inference import BatchInference, get_interpreter_class, load_interpreter
+from event_log import start_event_log
+from metrics import stage_metrics, start_metrics_dump
+from session_store import start_session_store
+from drowsiness_state import FaceStates
+from pipeline import Pipeline
+import config
+
 # ============================================================
 # GLOBAL VARIABLES
 # ============================================================
 camera = None
 camera_type = None
+camera_lores = None  # picamera2 lores stream size used for face detection
 interpreter = None
+interpreter_settings = None  # Threads / XNNPACK used for the interpreter
 input_details = None
 output_details = None
+batch_inference = None  # Runs all face crops of a frame through one invoke()
 face_cascade = None
+face_tracker = None  # Follows the face between full cascade detections
 eye_cascade = None
 hardware = None
 GPIO_AVAILABLE = False
 
-# Detection state
-drowsy_start_time = None
+# Detection state (one drowsy timer per face)
 drowsy_duration_threshold = 3.0  # seconds
+face_states = FaceStates(drowsy_duration_threshold)
+event_log = None  # Binary per-frame session log (DROWSY_EVENT_LOG)
+session_store = None  # SQLite session history (DROWSY_SESSION_STORE)
 stats = {
     "total": 0,
     "drowsy": 0,
@@ -75,6 +91,7 @@ class HardwareAlert:
         print(f"   Buzzer: GPIO{self.BUZZER_PIN}")
         print(f"   RGB LED: R=GPIO{self.LED_RED_PIN}, G=GPIO{self.LED_GREEN_PIN}, B=GPIO{self.LED_BLUE_PIN}")
     
+    @stage_metrics.timed("gpio")
     def set_led(self, red=0, green=0, blue=0):
         """Set RGB LED (0-100)"""
         self.led_r.value = red / 100.0
@@ -99,12 +116,14 @@ class HardwareAlert:
     
     def buzzer_on(self):
         if not self.buzzer_active:
-            self.buzzer.on()
+            with stage_metrics.time("gpio"):
+                self.buzzer.on()
             self.buzzer_active = True
     
     def buzzer_off(self):
         if self.buzzer_active:
-            self.buzzer.off()
+            with stage_metrics.time("gpio"):
+                self.buzzer.off()
             self.buzzer_active = False
     
     def cleanup(self):
@@ -124,44 +143,58 @@ class HardwareAlert:
 # CAMERA INITIALIZATION
 # ============================================================
 def initialize_camera():
-    """Initialize camera - try USB first, then Pi Camera"""
-    global camera, camera_type
+    """Initialize camera - try USB first, then Pi Camera (or the DROWSY_CAMERA_SOURCE file/synthetic source)"""
+    global camera, camera_type, camera_lores
+    
+    # Video file / image directory / synthetic frames instead of a camera
+    if config.CAMERA_SOURCE in FILE_SOURCES:
+        try:
+            camera = open_file_source()
+            camera_type = config.CAMERA_SOURCE
+            print(f"✅ {camera.describe()}")
+            return True
+        except Exception as e:
+            print(f"❌ Camera source error: {e}")
+            return False
     
     # Try USB camera
-    try:
-        usb_indices = [0, 1, 8, 9, 2, 3, 4]
-        for i in usb_indices:
-            cam = cv2.VideoCapture(i)
-            if cam.isOpened():
-                ret, _ = cam.read()
-                if ret:
-                    cam.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-                    cam.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
-                    cam.set(cv2.CAP_PROP_BUFFERSIZE, 1)
-                    cam.set(cv2.CAP_PROP_FPS, 15)
-                    camera = cam
-                    camera_type = "opencv"
-                    print(f"✅ USB Camera initialized at /dev/video{i}")
-                    return True
-                cam.release()
-    except Exception as e:
-        print(f"⚠️  USB camera error: {e}")
+    if config.CAMERA_SOURCE != "picamera2":
+        try:
+            usb_indices = [0, 1, 8, 9, 2, 3, 4]
+            for i in usb_indices:
+                cam = cv2.VideoCapture(i)
+                if cam.isOpened():
+                    ret, _ = cam.read()
+                    if ret:
+                        cam.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
+                        cam.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
+                        cam.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+                        cam.set(cv2.CAP_PROP_FPS, 15)
+                        camera = cam
+                        camera_type = "opencv"
+                        print(f"✅ USB Camera initialized at /dev/video{i}")
+                        return True
+                    cam.release()
+        except Exception as e:
+            print(f"⚠️  USB camera error: {e}")
     
     # Try Pi Camera
-    try:
-        from picamera2 import Picamera2
-        cam = Picamera2()
-        config = cam.create_video_configuration(
-            main={"size": (640, 480), "format": "RGB888"}
-        )
-        cam.configure(config)
-        cam.start()
-        camera = cam
-        camera_type = "picamera2"
-        print("✅ Raspberry Pi Camera Module initialized")
-        return True
-    except Exception as e:
-        print(f"⚠️  Pi Camera error: {e}")
+    if config.CAMERA_SOURCE != "opencv":
+        try:
+            from picamera2 import Picamera2
+            cam = Picamera2()
+            # 640x480 main stream (BGR in memory) + lores YUV stream for face detection
+            cam.configure(configure_picamera2(cam))
+            cam.start()
+            camera = cam
+            camera_type = "picamera2"
+            camera_lores = lores_size(cam)
+            print("✅ Raspberry Pi Camera Module initialized")
+            if camera_lores:
+                print(f"   Lores detection stream: {camera_lores[0]}x{camera_lores[1]}")
+            return True
+        except Exception as e:
+            print(f"⚠️  Pi Camera error: {e}")
     
     print("❌ No camera found!")
     return False
@@ -171,25 +204,15 @@ def initialize_camera():
 # ============================================================
 def initialize_model():
     """Initialize TFLite model and face cascade"""
-    global interpreter, input_details, output_details, face_cascade, eye_cascade
+    global interpreter, interpreter_settings, input_details, output_details, batch_inference, face_cascade, eye_cascade, face_tracker
     
     # Load TFLite interpreter
     try:
-        Interpreter = None
-        try:
-            from tflite_runtime.interpreter import Interpreter
-            print("Using tflite-runtime")
-        except ImportError:
-            try:
-                from tensorflow.lite.python.interpreter import Interpreter
-                print("Using tensorflow.lite")
-            except ImportError:
-                try:
-                    from ai_edge_litert.interpreter import Interpreter
-                    print("Using ai_edge_litert")
-                except ImportError:
-                    print("❌ No TFLite interpreter found!")
-                    return False
+        Interpreter, backend = get_interpreter_class()
+        if Interpreter is None:
+            print("❌ No TFLite interpreter found!")
+            return False
+        print(f"Using {backend}")
         
         model_path = os.path.join(os.path.dirname(__file__), 'best_model_compatible.tflite')
         
@@ -197,14 +220,17 @@ def initialize_model():
             print(f"❌ Model file not found: {model_path}")
             return False
         
-        interpreter = Interpreter(model_path=model_path)
-        interpreter.allocate_tensors()
+        interpreter, interpreter_settings = load_interpreter(model_path)
         
         input_details = interpreter.get_input_details()
         output_details = interpreter.get_output_details()
+        batch_inference = BatchInference(interpreter)
         
-        print(f"✅ Model loaded: {os.path.basename(model_path)}")
+        print(f"✅ Model loaded: {os.path.basename(interpreter_settings['model_path'])} (variant: {interpreter_settings['variant']})")
         print(f"   Input shape: {input_details[0]['shape']}")
+        print(f"   Threads: {interpreter_settings['num_threads']}, "
+              f"XNNPACK: {'on' if interpreter_settings['xnnpack'] else 'off'} "
+              f"({interpreter_settings['source']})")
         
     except Exception as e:
         print(f"❌ Model loading failed: {e}")
@@ -231,6 +257,8 @@ def initialize_model():
         print("❌ Face cascade not found!")
         return False
     
+    face_tracker = create_face_tracker(face_cascade)
+    
     # Load eye cascade
     eye_cascade_paths = [
         '/usr/share/opencv4/haarcascades/haarcascade_eye.xml',
@@ -256,63 +284,57 @@ def initialize_model():
 # ============================================================
 # PREDICTION
 # ============================================================
-def predict_drowsiness(frame, threshold=0.65):
-    """Predict drowsiness from frame"""
-    global interpreter, input_details, output_details, face_cascade
-    
-    if interpreter is None or face_cascade is None:
-        return False, None, None, None
-    
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    
-    faces = face_cascade.detectMultiScale(
-        gray, 
-        scaleFactor=1.1,
-        minNeighbors=4,
-        minSize=(30, 30)
-    )
-    
-    if len(faces) == 0:
-        return False, None, None, None
-    
-    # Get largest face
-    face_box = max(faces, key=lambda f: f[2] * f[3])
-    x, y, w, h = face_box
-    
-    face_roi = frame[y:y+h, x:x+w]
-    if face_roi.size == 0:
-        return False, None, None, None
-    
-    # Preprocess
-    face_roi_resized = cv2.resize(face_roi, (224, 224))
-    input_data = np.expand_dims(face_roi_resized, axis=0)
-    
-    if input_details[0]['dtype'] == np.uint8:
-        input_data = input_data.astype(np.uint8)
-    else:
-        input_data = input_data.astype(np.float32) / 255.0
-    
-    # Inference
-    interpreter.set_tensor(input_details[0]['index'], input_data)
-    interpreter.invoke()
-    output = interpreter.get_tensor(output_details[0]['index']).copy()
+def detect_faces_in_frame(frame, gray=None, gray_scale=1.0, timings=None):
+    """Detection step: (boxes, crops) of the faces to classify (gray = optional lores Y plane)
+
+    `timings` (optional dict) receives the frame's conversion, cascade and crop seconds.
+    """
+    global face_cascade, face_tracker
+    
+    if face_cascade is None:
+        return [], []
+    
+    start = time.perf_counter()
+    if gray is None:
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        gray_scale = 1.0
+    converted = time.perf_counter()
+    
+    # Tracked face(s) between periodic cascade detections (full scan if tracking is off)
+    faces = scale_boxes(find_faces(face_cascade, face_tracker, gray), gray_scale)
+    detected = time.perf_counter()
+    
+    # Largest face, or up to MAX_FACES faces in multi-face mode
+    boxes, crops = face_crops(frame, faces, channel_order=crop_channel_order(camera_type))
+    if timings is not None:
+        timings.update(convert=converted - start, cascade=detected - converted,
+                       crop=time.perf_counter() - detected)
+    return boxes, crops
+
+def classify_faces(boxes, crops, threshold=0.65, timings=None):
+    """Inference step: [(box, is_drowsy, confidence), ...], all faces in one invoke()"""
+    if interpreter is None or not crops:
+        return []
     
-    # Get confidence
-    if output_details[0]['dtype'] == np.uint8:
-        quant_scale, zero_point = output_details[0]['quantization']
-        confidence = (float(output[0][0]) - zero_point) * quant_scale
-    else:
-        confidence = float(output[0][0])
+    # Preprocess (straight into the input tensor) + one invoke() for all faces
+    confidences = batch_inference.run(crops, timings=timings)
     
     # Lower confidence = drowsy (eyes closed)
-    is_drowsy = confidence < threshold
-    
-    return True, is_drowsy, confidence, face_box
+    return [(box, bool(conf < threshold), float(conf)) for box, conf in zip(boxes, confidences)]
+
+def predict_drowsiness(frame, threshold=0.65, gray=None, gray_scale=1.0, timings=None):
+    """Predict drowsiness for the faces in a frame (detection + inference steps)
+
+    Returns [(box, is_drowsy, confidence), ...]: the driver's face, or up to
+    MAX_FACES faces in multi-face mode.
+    """
+    boxes, crops = detect_faces_in_frame(frame, gray, gray_scale, timings)
+    return classify_faces(boxes, crops, threshold, timings)
 
 # ============================================================
 # DRAWING FUNCTIONS
 # ============================================================
-def draw_bounding_boxes(frame, face_box):
+def draw_bounding_boxes(frame, face_box, label='Face', color=(0, 255, 0)):
     """Draw face and eye bounding boxes"""
     global eye_cascade
     
@@ -321,10 +343,10 @@ def draw_bounding_boxes(frame, face_box):
     
     x, y, w, h = face_box
     
-    # Draw face rectangle (green)
-    cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
-    cv2.putText(frame, 'Face', (x, y-10),
-               cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
+    # Draw face rectangle (green unless the face's state says otherwise)
+    cv2.rectangle(frame, (x, y), (x+w, y+h), color, 2)
+    cv2.putText(frame, label, (x, y-10),
+               cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
     
     # Detect and draw eyes
     if eye_cascade is not None:
@@ -436,12 +458,137 @@ def draw_status_overlay(frame, status, confidence, duration, led_state):
     
     return frame
 
+# ============================================================
+# PIPELINE STEPS
+# ============================================================
+def capture_frame():
+    """Capture step: dict with the frame, its optional lores gray plane and capture time"""
+    if camera_type == "picamera2":
+        # Main stream is already BGR, detection reads the lores Y plane
+        with stage_metrics.time("capture"):
+            frame, gray, gray_scale = capture_picamera2(camera, camera_lores)
+    else:
+        ret, frame = read_frame(camera)
+        if not ret:
+            if source_ended(camera):
+                time.sleep(0.1)
+                return None
+            print("\n❌ Failed to read frame")
+            time.sleep(0.1)
+            return None
+        gray, gray_scale = None, 1.0
+    return {"timestamp": capture_timestamp(camera), "frame": frame, "gray": gray, "gray_scale": gray_scale}
+
+def update_alarm(results, current_time):
+    """Decision step: per-face drowsy timers and LEDs/buzzer
+
+    Returns (status, confidence, duration, led_state, faces) for drawing.
+    """
+    global hardware, face_states, stats
+    
+    with stage_metrics.time("state_update"):
+        faces = face_states.update(results, current_time)
+        primary = face_states.primary()  # Most severe face drives LEDs/buzzer
+    confidence = None
+    duration = 0
+    
+    if primary is None:
+        # No face
+        status = "NO FACE"
+        led_state = "off"
+        if hardware:
+            hardware.led_off()
+            hardware.buzzer_off()
+    
+    else:
+        for face in faces:
+            stats["total"] += 1
+            stats["drowsy" if face.is_drowsy else "alert"] += 1
+        status = primary.status
+        confidence = primary.confidence
+        duration = primary.drowsy_duration
+    
+        if primary.alarm_active:
+            # ALARM!
+            led_state = "red"
+            if hardware:
+                hardware.led_red()
+                hardware.buzzer_on()
+        elif primary.is_drowsy:
+            # Warning
+            led_state = "yellow"
+            if hardware:
+                hardware.led_yellow()
+                hardware.buzzer_off()
+        else:
+            # Alert (awake)
+            led_state = "green"
+            if hardware:
+                hardware.led_green()
+                hardware.buzzer_off()
+    
+    return status, confidence, duration, led_state, faces
+
+def draw_decision(frame, decision):
+    """Draw face boxes and the status overlay for one decision"""
+    status, confidence, duration, led_state, faces = decision
+    
+    # Draw bounding boxes
+    for face in faces:
+        if config.MULTI_FACE:
+            color = (0, 0, 255) if face.alarm_active else (0, 165, 255) if face.is_drowsy else (0, 255, 0)
+            frame = draw_bounding_boxes(frame, face.box, f"Face {face.face_id}", color)
+        else:
+            frame = draw_bounding_boxes(frame, face.box)
+    
+    # Draw status overlay
+    return draw_status_overlay(frame, status, confidence, duration, led_state)
+
+# Pipeline stages - each runs on its own thread, connected by drop-oldest queues.
+# Drawing and imshow() stay on the main thread (OpenCV HighGUI requirement).
+def detect_stage(item):
+    if not paused:
+        item["timings"] = {}
+        item["boxes"], item["crops"] = detect_faces_in_frame(item["frame"], item["gray"], item["gray_scale"],
+                                                             item["timings"])
+    return item
+
+def infer_stage(item):
+    if "crops" in item:
+        item["results"] = classify_faces(item["boxes"], item["crops"], timings=item["timings"])
+    return item
+
+def decide_stage(item):
+    if "results" in item:
+        item["decision"] = decide(item["results"], item["timestamp"], item["timings"])
+    return item
+
+def decide(results, capture_time, timings):
+    """Decision step of a detected frame: alarm logic, latency metrics, event log"""
+    now = time.time()
+    stage_metrics.observe_timings(timings)
+    stage_metrics.observe_decision(capture_time, now)
+    decision = update_alarm(results, now)
+    primary, faces = face_states.primary(), len(face_states.current)
+    if event_log is not None:
+        event_log.record(capture_time, None, primary, faces, timings, now)
+    if session_store is not None:
+        session_store.record(capture_time, primary, faces)
+    return decision
+
+def print_pipeline_stats(pipeline):
+    """Per-stage throughput and queue counters"""
+    for stage in pipeline.get_stats():
+        latency = f" | latency {stage['latency_ms']:.0f}ms" if stage['latency_ms'] is not None else ""
+        print(f"  {stage['name']:<8} {stage['fps']:5.1f} FPS | busy {stage['busy_ms']:6.1f}ms | "
+              f"queue {stage['queue_depth']} (dropped {stage['queue_dropped']}){latency}")
+
 # ============================================================
 # MAIN LOOP
 # ============================================================
 def run_detection():
     """Main detection loop with GUI"""
-    global camera, camera_type, hardware, drowsy_start_time, stats, paused
+    global camera, camera_type, hardware, face_states, stats, paused, event_log, session_store
     
     print("\n" + "="*80)
     print("🚗 DROWSINESS DETECTION - GUI MODE")
@@ -476,87 +623,58 @@ def run_detection():
     
     stats["start_time"] = time.time()
     
+    dumper = start_metrics_dump("gui")
+    if dumper is not None:
+        print(f"📈 Latency metrics: {dumper.path} (every {dumper.interval:.0f}s)\n")
+    event_log = start_event_log("gui")
+    if event_log is not None:
+        print(f"📝 Event log: {event_log.path}\n")
+    session_store = start_session_store("gui", event_log)
+    if session_store is not None:
+        print(f"🗄️ Session store: {session_store.path}\n")
+    
     # Create window
     cv2.namedWindow(WINDOW_NAME, cv2.WINDOW_NORMAL)
     cv2.resizeWindow(WINDOW_NAME, 800, 600)
     
-    led_state = "off"
     fps_counter = 0
     fps_start = time.time()
     current_fps = 0
     
+    pipeline = None
+    if config.PIPELINE:
+        # Capture -> detect -> infer -> decide on worker threads, display here
+        pipeline = Pipeline(on_error=lambda name, e: print(f"\n❌ {name} stage error: {e}"))
+        pipeline.add_stage("capture", capture_frame)
+        pipeline.add_stage("detect", detect_stage)
+        pipeline.add_stage("infer", infer_stage)
+        pipeline.add_stage("decide", decide_stage)
+        display_queue = pipeline.output()
+        pipeline.start()
+    
     try:
         while True:
-            # Capture frame
-            if camera_type == "picamera2":
-                frame = camera.capture_array()
-                frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
+            if pipeline is not None:
+                # Newest frame that went through every stage
+                item = display_queue.get(timeout=0.5)
             else:
-                ret, frame = camera.read()
-                if not ret:
-                    print("\n❌ Failed to read frame")
-                    time.sleep(0.1)
-                    continue
-            
-            if not paused:
+                item = capture_frame()
+            if item is None:
+                if source_ended(camera):
+                    print("\n\n⏹️  End of camera source")
+                    break
+                continue
+            if pipeline is None and not paused:
                 # Predict
-                face_detected, is_drowsy, confidence, face_box = predict_drowsiness(frame, threshold=0.65)
-                
-                current_time = time.time()
-                duration = 0
-                
-                if not face_detected:
-                    # No face
-                    status = "NO FACE"
-                    drowsy_start_time = None
-                    led_state = "off"
-                    if hardware:
-                        hardware.led_off()
-                        hardware.buzzer_off()
-                    
-                elif is_drowsy:
-                    # Drowsy detected
-                    status = "DROWSY"
-                    stats["total"] += 1
-                    stats["drowsy"] += 1
-                    
-                    if drowsy_start_time is None:
-                        drowsy_start_time = current_time
-                    
-                    duration = current_time - drowsy_start_time
-                    
-                    # Check alarm threshold
-                    if duration >= drowsy_duration_threshold:
-                        # ALARM!
-                        led_state = "red"
-                        if hardware:
-                            hardware.led_red()
-                            hardware.buzzer_on()
-                    else:
-                        # Warning
-                        led_state = "yellow"
-                        if hardware:
-                            hardware.led_yellow()
-                            hardware.buzzer_off()
-                    
-                else:
-                    # Alert (awake)
-                    status = "ALERT"
-                    stats["total"] += 1
-                    stats["alert"] += 1
-                    
-                    drowsy_start_time = None
-                    led_state = "green"
-                    if hardware:
-                        hardware.led_green()
-                        hardware.buzzer_off()
-                
-                # Draw bounding boxes
-                if face_box is not None:
-                    frame = draw_bounding_boxes(frame, face_box)
-                
-                # Draw status overlay
-                frame = draw_status_overlay(frame, status, confidence, duration, led_state)
+                timings = {}
+                results = predict_drowsiness(item["frame"], threshold=0.65, gray=item["gray"],
+                                             gray_scale=item["gray_scale"], timings=timings)
+                item["decision"] = decide(results, item["timestamp"], timings)
+            
+            frame = item["frame"]
+            if not paused and "decision" in item:
+                # Draw bounding boxes + status overlay
+                frame = draw_decision(frame, item["decision"])
             else:
                 # Paused
                 cv2.putText(frame, "PAUSED", (frame.shape[1]//2 - 100, frame.shape[0]//2),
@@ -587,19 +705,28 @@ def run_detection():
                 else:
                     print("\n▶️  Detection RESUMED")
             
-            # Control detection rate
-            time.sleep(0.03)  # ~30 FPS max
+            # Control detection rate (the pipeline runs at camera speed)
+            if pipeline is None:
+                time.sleep(0.03)  # ~30 FPS max
             
     except KeyboardInterrupt:
         print("\n\n⏹️  Stopping detection...")
     finally:
         # Cleanup
         print("\nCleaning up...")
+        if pipeline is not None:
+            pipeline.stop()
+        if dumper is not None:
+            dumper.stop()
+        if event_log is not None:
+            event_log.close()
+        if session_store is not None:
+            session_store.close()
         cv2.destroyAllWindows()
         
         if hardware:
             hardware.cleanup()
-        if camera_type == "opencv" and camera:
+        if camera_type in ("opencv",) + FILE_SOURCES and camera:
             camera.release()
         elif camera_type == "picamera2" and camera:
             try:
@@ -617,6 +744,19 @@ def run_detection():
         print(f"Total detections: {stats['total']}")
         print(f"Drowsy: {stats['drowsy']} ({stats['drowsy']/max(stats['total'],1)*100:.1f}%)")
         print(f"Alert: {stats['alert']} ({stats['alert']/max(stats['total'],1)*100:.1f}%)")
+        if face_tracker is not None:
+            tracker_stats = face_tracker.get_stats()
+            print(f"Face cascade runs: {tracker_stats['detections']} | Tracked frames: {tracker_stats['tracked']}")
+            if 'search' in tracker_stats:
+                search_stats = tracker_stats['search']
+                print(f"Face search: ROI {search_stats['roi_searches']} ({search_stats['roi_time_ms']:.0f}ms) | "
+                      f"Full frame {search_stats['full_searches']} ({search_stats['full_time_ms']:.0f}ms)")
+        if pipeline is not None:
+            print("Pipeline stages:")
+            print_pipeline_stats(pipeline)
+        if batch_inference is not None and config.MULTI_FACE:
+            batch_stats = batch_inference.get_stats()
+            print(f"Inference: batched {batch_stats['batched_invokes']} | single {batch_stats['single_invokes']}")
         print("="*80)
         print("✅ Done!\n")
 
@@ -0,0 +1,199 @@
+"""
+Drowsiness Detection - Async Serving Mode
+ASGI front end for the Flask apps (DROWSY_ASYNC_SERVER=1): the MJPEG stream
+and the /events push channel are served as async generators on one event
+loop, every other route still runs the Flask view on a small thread pool.
+Camera, detection and encoder threads are unchanged.
+
+Needs uvicorn (pip install uvicorn); without it the apps fall back to
+Flask's threaded server.
+"""
+
+import asyncio
+import io
+import logging
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# ============================================================
+# THREAD -> EVENT LOOP WAKE-UP
+# ============================================================
+class LoopSignal:
+    """Wakes async waiters when a producer thread has published something
+
+    notify() costs one call_soon_threadsafe per event loop, however many
+    viewers wait on it. Waiters re-check their own condition after waking.
+    """
+
+    def __init__(self):
+        self._events = {}  # loop -> asyncio.Event of the current round
+        self._lock = threading.Lock()
+
+    def notify(self):
+        """Call from any thread"""
+        with self._lock:
+            loops = list(self._events)
+        for loop in loops:
+            try:
+                loop.call_soon_threadsafe(self._fire, loop)
+            except RuntimeError:
+                # Loop closed
+                with self._lock:
+                    self._events.pop(loop, None)
+
+    async def wait(self, timeout=None):
+        """Wait for the next notify(), return False on timeout"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            event = self._events.get(loop)
+            if event is None:
+                event = self._events[loop] = asyncio.Event()
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def _fire(self, loop):
+        # Runs in the loop: wake this round's waiters, later waiters get a new event
+        with self._lock:
+            event = self._events.get(loop)
+            self._events[loop] = asyncio.Event()
+        if event is not None:
+            event.set()
+
+# ============================================================
+# ASGI APPLICATION
+# ============================================================
+def create_asgi_app(flask_app, streams, threads=config.ASYNC_SERVER_THREADS):
+    """ASGI app: `streams` paths are served natively, everything else by Flask
+
+    streams: {path: (content type, factory)}; factory() returns an async
+    iterator of body chunks (e.g. MJPEGBroadcaster.async_viewer). Flask
+    responses are buffered, so long-lived responses must be in `streams`.
+    """
+    executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="wsgi")
+
+    async def app(scope, receive, send):
+        if scope["type"] != "http":
+            return
+        if scope["path"] in streams and scope["method"] == "GET":
+            content_type, factory = streams[scope["path"]]
+            await _stream_response(send, receive, content_type, factory())
+            return
+
+        body = bytearray()
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        environ = _wsgi_environ(scope, bytes(body))
+        status, headers, content = await asyncio.get_running_loop().run_in_executor(
+            executor, _run_wsgi, flask_app, environ)
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(k.lower().encode("latin1"), v.encode("latin1")) for k, v in headers]
+        })
+        await send({"type": "http.response.body", "body": content})
+
+    return app
+
+def _wsgi_environ(scope, body):
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf8").decode("latin1"),
+        "PATH_INFO": scope["path"].encode("utf8").decode("latin1"),
+        "QUERY_STRING": scope["query_string"].decode("latin1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope['http_version']}",
+        "REMOTE_ADDR": scope["client"][0] if scope.get("client") else "",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False
+    }
+    for name, value in scope["headers"]:
+        name = name.decode("latin1")
+        if name == "content-type":
+            key = "CONTENT_TYPE"
+        elif name == "content-length":
+            key = "CONTENT_LENGTH"
+        else:
+            key = "HTTP_" + name.upper().replace("-", "_")
+        value = value.decode("latin1")
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+def _run_wsgi(wsgi_app, environ):
+    """Run one WSGI request to completion, return (status, headers, body)"""
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response["status"] = int(status.split(" ", 1)[0])
+        response["headers"] = headers
+
+    result = wsgi_app(environ, start_response)
+    try:
+        content = b"".join(result)
+    finally:
+        if hasattr(result, "close"):
+            result.close()
+    return response["status"], response["headers"], content
+
+async def _stream_response(send, receive, content_type, chunks):
+    """Send chunks until the iterator ends or the client disconnects"""
+    async def pump():
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", content_type.encode()),
+                (b"cache-control", b"no-cache"),
+                (b"x-accel-buffering", b"no")
+            ]
+        })
+        async for chunk in chunks:
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def disconnected():
+        while (await receive())["type"] != "http.disconnect":
+            pass
+
+    # Whichever finishes first cancels the other, so a closed tab frees its viewer at once
+    tasks = [asyncio.ensure_future(pump()), asyncio.ensure_future(disconnected())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await chunks.aclose()
+
+def serve_async(flask_app, streams, host="0.0.0.0", port=5000):
+    """Run the app on uvicorn, return False if the async server is not installed"""
+    try:
+        import uvicorn
+    except ImportError:
+        logger.warning("⚠️ uvicorn not installed - using Flask's threaded server (pip install uvicorn)")
+        return False
+
+    logger.info(f"⚡ Async server (uvicorn) on {host}:{port}, "
+                f"native streams: {', '.join(sorted(streams))}")
+    uvicorn.run(create_asgi_app(flask_app, streams), host=host, port=port,
+                lifespan="off", log_level="warning")
+    return True
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Drowsiness Detection - Batch Inference Benchmark
+Compares one batched invoke() for N face crops (BatchInference) with N
+sequential batch-1 invoke() calls, for N = 1..4. Times include writing the
+crops into the input tensor and reading the outputs.
+
+Usage:
+    python3 benchmark_batch.py [--iterations 50] [--max-batch 4]
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+
+from inference import BatchInference, get_interpreter_class, load_interpreter
+
+def time_calls(func, iterations):
+    """Average milliseconds per call after a short warm-up"""
+    for _ in range(3):
+        func()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch inference benchmark")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--max-batch", type=int, default=4)
+    parser.add_argument("--model", default=os.path.join(os.path.dirname(__file__), 'best_model_compatible.tflite'))
+    args = parser.parse_args()
+
+    Interpreter, backend = get_interpreter_class()
+    if Interpreter is None:
+        print("❌ No TFLite interpreter found!")
+        return 1
+
+    interpreter, settings = load_interpreter(args.model)
+    runner = BatchInference(interpreter, max_batch=args.max_batch)
+    crops = [np.random.randint(0, 256, (160 + 10 * i, 140 + 10 * i, 3), dtype=np.uint8)
+             for i in range(args.max_batch)]
+
+    print("=" * 70)
+    print(f"Batch benchmark ({backend}, {os.path.basename(settings['model_path'])}, "
+          f"{settings['num_threads']} threads, XNNPACK {'on' if settings['xnnpack'] else 'off'})")
+    if not runner.batching:
+        print("⚠️ Model has a fixed batch dimension - batched calls fall back to sequential")
+    print("=" * 70)
+    print(f"{'Faces':>5} {'sequential ms':>15} {'batched ms':>12} {'speedup':>9} {'max diff':>10}")
+    print("-" * 70)
+
+    for n in range(1, args.max_batch + 1):
+        batch = crops[:n]
+        sequential = lambda: [runner.run([crop]) for crop in batch]
+        batched = lambda: runner.run(batch)
+
+        # Alternating between sizes re-allocates tensors, so each mode is timed in a block
+        seq_ms = time_calls(sequential, args.iterations)
+        batch_ms = time_calls(batched, args.iterations)
+
+        expected = np.concatenate(sequential())
+        diff = float(np.abs(expected - batched()).max())
+        print(f"{n:>5} {seq_ms:>15.2f} {batch_ms:>12.2f} {seq_ms / batch_ms:>8.2f}x {diff:>10.2e}")
+
+    print("-" * 70)
+    stats = runner.get_stats()
+    print(f"Batched invokes: {stats['batched_invokes']} | Single invokes: {stats['single_invokes']}")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Drowsiness Detection - Preprocessing Microbenchmark
+Compares the old preprocessing path (resize -> expand_dims -> astype/255 -> set_tensor)
+with InputPreprocessor writing straight into the interpreter's input tensor.
+Reports time and temporary numpy allocations per call. invoke() is not included.
+
+Usage:
+    python3 benchmark_preprocess.py [--iterations 2000] [--crop 180x200]
+"""
+
+import argparse
+import os
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from inference import InputPreprocessor, get_interpreter_class
+
+def old_preprocess(interpreter, input_detail, face_roi):
+    """Preprocessing as it was done in predict_drowsiness() before InputPreprocessor"""
+    face_roi = cv2.resize(face_roi, (224, 224))
+    input_data = np.expand_dims(face_roi, axis=0)
+
+    if input_detail['dtype'] == np.uint8:
+        input_data = input_data.astype(np.uint8)
+    else:
+        input_data = input_data.astype(np.float32) / 255.0
+
+    interpreter.set_tensor(input_detail['index'], input_data)
+
+def measure(name, func, iterations):
+    """Time per call and temporary memory per call (tracemalloc sees numpy buffers)"""
+    for _ in range(20):  # Warm up
+        func()
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    elapsed_us = (time.perf_counter() - start) / iterations * 1e6
+
+    # Peak traced memory during one call = temporary arrays it allocates
+    tracemalloc.start()
+    peak = 0
+    for _ in range(min(iterations, 50)):
+        tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        func()
+        _, call_peak = tracemalloc.get_traced_memory()
+        peak = max(peak, call_peak - base)
+    tracemalloc.stop()
+
+    print(f"{name:<28} {elapsed_us:9.1f} us/call   temporaries {peak / 1024:8.1f} KiB/call")
+    return elapsed_us, peak
+
+def main():
+    parser = argparse.ArgumentParser(description="Preprocessing microbenchmark")
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--crop", default="180x200", help="Face crop size WxH")
+    parser.add_argument("--model", default=os.path.join(os.path.dirname(__file__), 'best_model_compatible.tflite'))
+    args = parser.parse_args()
+
+    Interpreter, backend = get_interpreter_class()
+    if Interpreter is None:
+        print("❌ No TFLite interpreter found!")
+        return 1
+
+    interpreter = Interpreter(model_path=args.model)
+    interpreter.allocate_tensors()
+    input_detail = interpreter.get_input_details()[0]
+    preprocessor = InputPreprocessor(interpreter, input_detail)
+
+    crop_w, crop_h = (int(v) for v in args.crop.split("x"))
+    face_roi = np.random.randint(0, 256, (crop_h, crop_w, 3), dtype=np.uint8)
+
+    print("=" * 80)
+    print(f"Preprocessing benchmark ({backend}, input {input_detail['dtype'].__name__}, crop {crop_w}x{crop_h})")
+    print("=" * 80)
+    old_us, old_peak = measure("old (astype + set_tensor)", lambda: old_preprocess(interpreter, input_detail, face_roi), args.iterations)
+    new_us, new_peak = measure("new (write into tensor)", lambda: preprocessor.write(face_roi), args.iterations)
+    print("-" * 80)
+    print(f"Speedup: {old_us / new_us:.2f}x   Temporaries: {old_peak / 1024:.0f} KiB -> {new_peak / 1024:.0f} KiB per call")
+
+    # Both paths must feed the model the same data
+    old_preprocess(interpreter, input_detail, face_roi)
+    expected = interpreter.get_tensor(input_detail['index']).copy()
+    preprocessor.write(face_roi)
+    actual = interpreter.get_tensor(input_detail['index'])
+    print(f"Max difference between paths: {np.abs(expected.astype(np.float64) - actual).max():.2e}")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Drowsiness Detection - Offline Replay Benchmark
+Feeds a recorded video file or a directory of images through the same steps
+as predict_drowsiness() and the auto-detection state machine (detection
+cache with face tracking, face crops, BatchInference, FaceStates), either
+as fast as possible or paced to real time. Needs no camera and no GPIO.
+
+Reports per-stage latency (grayscale, cascade, crop, resize, invoke,
+postprocess, decision) and end-to-end throughput. Alarm decisions use the
+recording's timestamps, so a replay gives the same alarms at any speed.
+
+Usage:
+    python3 benchmark_replay.py VIDEO_OR_DIR [--realtime] [--fps 15] [--frames N] [--loop N] [--json out.json]
+"""
+
+import argparse
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+
+import config
+from camera_sources import MAIN_SIZE
+from drowsiness_state import FaceStates
+from face_detection import DetectionCache, create_face_tracker, face_crops
+from inference import BatchInference, get_interpreter_class, load_interpreter
+
+STAGES = ("gray", "cascade", "crop", "resize", "invoke", "postprocess", "decision")
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+def read_frames(path, fps, size, loops=1):
+    """Yield (frame, timestamp) from a video file or an image directory
+
+    Timestamps advance by 1/fps per frame and keep running across loops.
+    """
+    files = None
+    if os.path.isdir(path):
+        files = sorted(os.path.join(path, f) for f in os.listdir(path) if f.lower().endswith(IMAGE_EXTENSIONS))
+        if not files:
+            raise ValueError(f"No images in {path}")
+
+    index = 0
+    for _ in range(loops):
+        if files is not None:
+            frames = (cv2.imread(f) for f in files)
+        else:
+            frames = _video_frames(path)
+        for frame in frames:
+            if frame is None:
+                continue
+            if size and (frame.shape[1], frame.shape[0]) != size:
+                frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+            yield frame, index / fps
+            index += 1
+
+def _video_frames(path):
+    cap = cv2.VideoCapture(path)
+    try:
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                return
+            yield frame
+    finally:
+        cap.release()
+
+def source_fps(path, default):
+    """The video's own frame rate, `default` for image directories"""
+    if os.path.isdir(path):
+        return default
+    cap = cv2.VideoCapture(path)
+    try:
+        if not cap.isOpened():
+            raise ValueError(f"Cannot open {path}")
+        return cap.get(cv2.CAP_PROP_FPS) or default
+    finally:
+        cap.release()
+
+def summarize(values):
+    """Latency summary in ms"""
+    if not values:
+        return None
+    ms = np.array(values) * 1000
+    return {
+        "mean": float(ms.mean()),
+        "p50": float(np.percentile(ms, 50)),
+        "p90": float(np.percentile(ms, 90)),
+        "p99": float(np.percentile(ms, 99)),
+        "max": float(ms.max())
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline replay benchmark")
+    parser.add_argument("source", help="Video file or directory of images")
+    parser.add_argument("--realtime", action="store_true",
+                        help="Pace frames at the source FPS and drop frames while busy, like a live camera")
+    parser.add_argument("--fps", type=float, default=15.0, help="Frame rate of an image directory (videos use their own)")
+    parser.add_argument("--frames", type=int, default=0, help="Stop after N frames (0 = whole source)")
+    parser.add_argument("--loop", type=int, default=1, help="Play the source N times")
+    parser.add_argument("--size", default=f"{MAIN_SIZE[0]}x{MAIN_SIZE[1]}",
+                        help="Resize frames to the camera size before the pipeline ('' = keep)")
+    parser.add_argument("--threshold", type=float, default=0.65)
+    parser.add_argument("--alarm-seconds", type=float, default=3.0)
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    parser.add_argument("--model", default=os.path.join(os.path.dirname(__file__), 'best_model_compatible.tflite'))
+    args = parser.parse_args()
+
+    Interpreter, backend = get_interpreter_class()
+    if Interpreter is None:
+        print("❌ No TFLite interpreter found!")
+        return 1
+
+    interpreter, settings = load_interpreter(args.model)
+    runner = BatchInference(interpreter)
+    face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+    cache = DetectionCache(face_cascade, face_tracker=create_face_tracker(face_cascade))
+    face_states = FaceStates(args.alarm_seconds)
+
+    size = tuple(int(v) for v in args.size.split("x")) if args.size else None
+    try:
+        fps = source_fps(args.source, args.fps)
+        frames = read_frames(args.source, fps, size, args.loop)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 1
+
+    timings = {name: [] for name in STAGES}
+    decode_times, frame_times = [], []
+    counts = {"frames": 0, "dropped": 0, "faces": 0, "drowsy": 0, "alarms": 0}
+    alarm_active = False
+    seq = 0
+
+    replay_start = time.perf_counter()
+    while True:
+        start = time.perf_counter()
+        item = next(frames, None)
+        if item is None:
+            break
+        frame, timestamp = item
+        decode_times.append(time.perf_counter() - start)
+
+        if args.realtime:
+            # Frames whose time has passed while the last one was processed are lost, as with a camera
+            delay = replay_start + timestamp - time.perf_counter()
+            if delay < -1.0 / fps:
+                counts["dropped"] += 1
+                continue
+            if delay > 0:
+                time.sleep(delay)
+
+        seq += 1
+        t0 = time.perf_counter()
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        t1 = time.perf_counter()
+        faces = cache.get(seq, frame, gray=gray).faces
+        t2 = time.perf_counter()
+        boxes, crops = face_crops(frame, faces)
+        t3 = time.perf_counter()
+
+        stage = {}
+        results = []
+        if crops:
+            confidences = runner.run(crops, timings=stage)
+            post = time.perf_counter()
+            results = [(box, bool(conf < args.threshold), float(conf)) for box, conf in zip(boxes, confidences)]
+            stage["postprocess"] += time.perf_counter() - post
+        t4 = time.perf_counter()
+
+        face_states.update(results, timestamp)
+        primary = face_states.primary()
+        t5 = time.perf_counter()
+
+        timings["gray"].append(t1 - t0)
+        timings["cascade"].append(t2 - t1)
+        timings["crop"].append(t3 - t2)
+        for name, seconds in stage.items():
+            timings[name].append(seconds)
+        timings["decision"].append(t5 - t4)
+        frame_times.append(t5 - t0)
+
+        counts["frames"] += 1
+        if primary is not None:
+            counts["faces"] += 1
+            counts["drowsy"] += primary.is_drowsy
+            if primary.alarm_active and not alarm_active:
+                counts["alarms"] += 1
+            alarm_active = primary.alarm_active
+        else:
+            alarm_active = False
+
+        if args.frames and counts["frames"] >= args.frames:
+            break
+    elapsed = time.perf_counter() - replay_start
+
+    if not counts["frames"]:
+        print("❌ No frames replayed")
+        return 1
+
+    inferred = len(timings["invoke"])
+    result = {
+        "source": args.source,
+        "mode": "realtime" if args.realtime else "max speed",
+        "source_fps": fps,
+        "backend": backend,
+        "model": os.path.basename(settings["model_path"]),
+        "threads": settings["num_threads"],
+        "xnnpack": settings["xnnpack"],
+        "face_tracking": config.FACE_TRACKING,
+        "counts": counts,
+        "elapsed_s": elapsed,
+        "throughput_fps": counts["frames"] / elapsed,
+        "pipeline_fps": counts["frames"] / sum(frame_times),
+        "decode": summarize(decode_times),
+        "frame": summarize(frame_times),
+        "stages": {name: summarize(timings[name]) for name in STAGES}
+    }
+
+    print("=" * 78)
+    print(f"Replay benchmark: {os.path.basename(args.source.rstrip('/'))} ({result['mode']}, {fps:.1f} FPS source)")
+    print(f"{backend}, {result['model']}, {settings['num_threads']} threads, "
+          f"XNNPACK {'on' if settings['xnnpack'] else 'off'}, "
+          f"face tracking {'on' if config.FACE_TRACKING else 'off'}, {os.cpu_count()} CPUs")
+    print("=" * 78)
+    print(f"{'Stage':<12} {'frames':>7} {'mean ms':>9} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    print("-" * 78)
+    rows = [(name, len(timings[name]), result["stages"][name]) for name in STAGES]
+    rows.append(("= frame", len(frame_times), result["frame"]))
+    rows.append(("(decode)", len(decode_times), result["decode"]))
+    for name, n, s in rows:
+        if s is None:
+            print(f"{name:<12} {n:>7} {'-':>9}")
+            continue
+        print(f"{name:<12} {n:>7} {s['mean']:>9.2f} {s['p50']:>9.2f} {s['p90']:>9.2f} {s['p99']:>9.2f} {s['max']:>9.2f}")
+    print("-" * 78)
+    print(f"Frames: {counts['frames']} processed, {counts['dropped']} dropped | "
+          f"face in {counts['faces']}, inferred {inferred}, drowsy {counts['drowsy']}, alarms {counts['alarms']}")
+    print(f"Throughput: {result['throughput_fps']:.1f} FPS end-to-end (incl. decoding/pacing), "
+          f"{result['pipeline_fps']:.1f} FPS pipeline only")
+    print("resize/invoke/postprocess only run on frames with a face; = frame is the whole pipeline.")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"✅ Results written to {args.json}")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
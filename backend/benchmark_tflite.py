@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Drowsiness Detection - TFLite Thread / XNNPACK Benchmark
+Times invoke() for every thread count with XNNPACK on and off and records the
+fastest setting for this board in tflite_tuning.json, which all app versions
+read at startup.
+
+Usage:
+    python3 benchmark_tflite.py [--iterations 20] [--threads 1,2,4] [--no-save]
+"""
+
+import argparse
+import os
+
+import config
+from inference import autotune, get_interpreter_class
+
+def main():
+    parser = argparse.ArgumentParser(description="TFLite thread/XNNPACK benchmark")
+    parser.add_argument("--iterations", type=int, default=20, help="invoke() calls per setting")
+    parser.add_argument("--threads", help="Comma separated thread counts (default: 1..cpu_count)")
+    parser.add_argument("--model", default=os.path.join(os.path.dirname(__file__), 'best_model_compatible.tflite'))
+    parser.add_argument("--no-save", action="store_true", help="Only print results, keep the tuning file unchanged")
+    args = parser.parse_args()
+
+    Interpreter, backend = get_interpreter_class()
+    if Interpreter is None:
+        print("❌ No TFLite interpreter found!")
+        return 1
+    if not os.path.exists(args.model):
+        print(f"❌ Model file not found: {args.model}")
+        return 1
+
+    thread_counts = None
+    if args.threads:
+        thread_counts = [int(t) for t in args.threads.split(",")]
+
+    print("=" * 60)
+    print(f"TFLite benchmark ({backend}, {os.path.basename(args.model)}, {os.cpu_count()} CPUs)")
+    print("=" * 60)
+    print(f"{'XNNPACK':<10} {'Threads':>8} {'invoke ms':>12}")
+    print("-" * 60)
+
+    def report(result):
+        xnnpack = "on" if result["xnnpack"] else "off"
+        print(f"{xnnpack:<10} {result['num_threads']:>8} {result['invoke_ms']:>12.2f}")
+
+    record = autotune(args.model, args.iterations, thread_counts, save=not args.no_save, report=report)
+
+    print("-" * 60)
+    print(f"✅ Fastest: {record['num_threads']} threads, "
+          f"XNNPACK {'on' if record['xnnpack'] else 'off'} ({record['invoke_ms']:.2f} ms)")
+    if not args.no_save:
+        print(f"💾 Saved to {config.TFLITE_TUNING_FILE}")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
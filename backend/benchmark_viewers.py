@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Drowsiness Detection - Web Viewer Load Test
+Starts app_auto.py's web tier in a child process (Flask threaded server or
+the async server), feeds its frame bus with synthetic camera frames and
+connects N dashboard "tabs" (one /video_feed + one /events connection each).
+Reports the server's CPU, threads and memory, in total and per viewer.
+
+No camera or model is needed: the stream shows the synthetic frames, and
+only the web tier is measured.
+
+Usage:
+    python3 benchmark_viewers.py [--viewers 0,1,5,10,20] [--seconds 5] [--servers threaded,async]
+"""
+
+import argparse
+import importlib.util
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+def serve(server, port, fps):
+    """Child process: app_auto's routes + synthetic frames, no camera/model"""
+    import logging
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+    import app_auto
+    from async_server import serve_async
+    from camera_sources import SyntheticSource
+
+    source = SyntheticSource(fps)
+
+    def camera():
+        while True:
+            ok, frame = source.read()
+            app_auto.frame_bus.publish(frame, timestamp=source.timestamp)
+
+    threading.Thread(target=camera, daemon=True).start()
+    if server == "async":
+        serve_async(app_auto.app, {
+            '/video_feed': ('multipart/x-mixed-replace; boundary=frame', app_auto.stream_encoder.async_viewer),
+            '/events': ('text/event-stream', app_auto.events.async_subscribe)
+        }, host="127.0.0.1", port=port)
+    else:
+        app_auto.app.run(host="127.0.0.1", port=port, threaded=True, debug=False, use_reloader=False)
+
+class Viewer:
+    """One client connection reading a streaming response as fast as it arrives"""
+
+    def __init__(self, port, path):
+        self.sock = socket.create_connection(("127.0.0.1", port))
+        self.sock.sendall(f"GET {path} HTTP/1.1\r\nHost: localhost\r\nConnection: keep-alive\r\n\r\n".encode())
+        self.bytes = 0
+        self.frames = 0
+        self._tail = b""
+        self._stop = False
+        self._thread = threading.Thread(target=self._read, daemon=True)
+        self._thread.start()
+
+    def _read(self):
+        try:
+            while not self._stop:
+                data = self.sock.recv(65536)
+                if not data:
+                    break
+                self.bytes += len(data)
+                chunk = self._tail + data
+                self.frames += chunk.count(b"--frame")
+                self._tail = chunk[-7:]
+        except OSError:
+            pass
+
+    def close(self):
+        self._stop = True
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+def wait_for_server(port, timeout=60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+def measure(server, port, viewer_counts, seconds, fps):
+    import psutil
+
+    child = subprocess.Popen([sys.executable, __file__, "--serve", server, "--port", str(port), "--fps", str(fps)],
+                             stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+    rows = []
+    try:
+        if not wait_for_server(port):
+            print(f"❌ {server} server did not start")
+            return rows
+        process = psutil.Process(child.pid)
+        for count in viewer_counts:
+            viewers = []
+            for _ in range(count):
+                viewers.append(Viewer(port, "/video_feed"))
+                viewers.append(Viewer(port, "/events"))
+            time.sleep(2.0)  # Warm-up: connections set up, encoder running
+
+            cpu_start = sum(process.cpu_times()[:2])
+            frames_start = [v.frames for v in viewers[::2]]
+            time.sleep(seconds)
+            cpu = (sum(process.cpu_times()[:2]) - cpu_start) / seconds * 100
+            fps_per_viewer = [(v.frames - f) / seconds for v, f in zip(viewers[::2], frames_start)]
+
+            rows.append({
+                "viewers": count,
+                "cpu": cpu,
+                "threads": process.num_threads(),
+                "rss_mb": process.memory_info().rss / 2 ** 20,
+                "fps": min(fps_per_viewer) if fps_per_viewer else 0.0
+            })
+            for v in viewers:
+                v.close()
+            time.sleep(1.0)  # Let the server notice the disconnects
+    finally:
+        child.terminate()
+        child.wait(10)
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Web viewer load test")
+    parser.add_argument("--viewers", default="0,1,5,10,20", help="Comma-separated viewer counts")
+    parser.add_argument("--seconds", type=float, default=5.0, help="Measurement time per viewer count")
+    parser.add_argument("--servers", default="threaded,async", help="threaded and/or async")
+    parser.add_argument("--fps", type=float, default=30.0, help="Synthetic camera frame rate")
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--serve", choices=("threaded", "async"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.port, args.fps)
+        return 0
+
+    # measure() reads the server's CPU and RSS through psutil
+    if importlib.util.find_spec("psutil") is None:
+        print("❌ psutil is required: pip install psutil")
+        return 1
+
+    viewer_counts = [int(v) for v in args.viewers.split(",")]
+    print("=" * 78)
+    print(f"Viewer load test ({os.cpu_count()} CPUs, camera {args.fps:.0f} FPS, {args.seconds:.0f} s per step)")
+    print("=" * 78)
+    print(f"{'Server':<10} {'Viewers':>7} {'CPU %':>7} {'Threads':>8} {'RSS MB':>8} "
+          f"{'CPU/viewer':>11} {'KB/viewer':>10} {'Min FPS':>8}")
+    print("-" * 78)
+    for server in args.servers.split(","):
+        rows = measure(server, args.port, viewer_counts, args.seconds, args.fps)
+        base = rows[0] if rows and rows[0]["viewers"] == 0 else None
+        for row in rows:
+            per_cpu = per_kb = ""
+            if base and row["viewers"]:
+                per_cpu = f"{(row['cpu'] - base['cpu']) / row['viewers']:.2f}%"
+                per_kb = f"{(row['rss_mb'] - base['rss_mb']) * 1024 / row['viewers']:.0f}"
+            print(f"{server:<10} {row['viewers']:>7} {row['cpu']:>7.1f} {row['threads']:>8} {row['rss_mb']:>8.1f} "
+                  f"{per_cpu:>11} {per_kb:>10} {row['fps']:>8.1f}")
+        args.port += 1  # Fresh port, the old one may linger in TIME_WAIT
+    print("-" * 78)
+    print("Viewer = one /video_feed + one /events connection (a dashboard tab).")
+    print("CPU/viewer and KB/viewer are relative to the 0-viewer row.")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Drowsiness Detection - Inference Worker Latency Benchmark
+Measures the per-frame latency distribution of face inference in-process
+(as app.py / app_auto.py do by default) and in the worker process
+(DROWSY_INFERENCE_WORKER=1), each without and with simulated web serving
+load: threads that JPEG-encode frames like the MJPEG stream and build JSON
+like the Flask routes, all competing for the GIL.
+
+Frames are paced at the camera rate, so the numbers are latencies, not
+throughput. Faces are fixed boxes (no cascade), unless --detect is given.
+
+Usage:
+    python3 benchmark_worker.py [--frames 300] [--load-threads 4] [--fps 30] [--detect]
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from face_detection import face_crops
+from inference import BatchInference, get_interpreter_class, load_interpreter
+from inference_worker import InferenceWorker
+
+FACE_BOXES = [(180, 100, 200, 220)]
+
+def make_frames(count, size=(640, 480)):
+    """A few smooth random frames to cycle through"""
+    rng = np.random.default_rng(0)
+    return [cv2.GaussianBlur(rng.integers(0, 256, (size[1], size[0], 3), dtype=np.uint8), (7, 7), 0)
+            for _ in range(count)]
+
+def web_load(stop_event, frame):
+    """One 'request handler': JPEG encode (MJPEG stream) + Python-heavy JSON work (routes)"""
+    state = {"status": "ALERT", "confidence": 0.8, "faces": [{"id": i, "box": [1, 2, 3, 4]} for i in range(8)]}
+    while not stop_event.is_set():
+        small = cv2.resize(frame, (480, 360))
+        cv2.imencode('.jpg', small, [cv2.IMWRITE_JPEG_QUALITY, 50])
+        for _ in range(50):
+            json.loads(json.dumps(state))
+
+def percentiles(latencies):
+    values = np.array(latencies)
+    return {
+        "p50": float(np.percentile(values, 50)),
+        "p90": float(np.percentile(values, 90)),
+        "p99": float(np.percentile(values, 99)),
+        "max": float(values.max()),
+        "std": float(values.std())
+    }
+
+def measure(process_frame, frames, count, fps, load_threads):
+    """Latency (ms) of process_frame for `count` frames paced at `fps`, with background load"""
+    stop_event = threading.Event()
+    threads = [threading.Thread(target=web_load, args=(stop_event, frames[0]), daemon=True)
+               for _ in range(load_threads)]
+    for t in threads:
+        t.start()
+
+    latencies = []
+    interval = 1.0 / fps
+    next_time = time.perf_counter()
+    try:
+        for i in range(count):
+            next_time += interval
+            start = time.perf_counter()
+            process_frame(frames[i % len(frames)], i + 1)
+            latencies.append((time.perf_counter() - start) * 1000)
+            time.sleep(max(0.0, next_time - time.perf_counter()))
+    finally:
+        stop_event.set()
+        for t in threads:
+            t.join()
+    return latencies
+
+def main():
+    parser = argparse.ArgumentParser(description="Inference worker latency benchmark")
+    parser.add_argument("--frames", type=int, default=300, help="Frames per measurement")
+    parser.add_argument("--load-threads", type=int, default=4, help="Simulated web serving threads")
+    parser.add_argument("--fps", type=float, default=30.0, help="Camera frame rate to pace frames at")
+    parser.add_argument("--detect", action="store_true", help="Run the face cascade too (needs real faces to reach inference)")
+    parser.add_argument("--model", default=os.path.join(os.path.dirname(__file__), 'best_model_compatible.tflite'))
+    args = parser.parse_args()
+
+    Interpreter, backend = get_interpreter_class()
+    if Interpreter is None:
+        print("❌ No TFLite interpreter found!")
+        return 1
+
+    cascade_path = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+    frames = make_frames(8)
+    faces = None if args.detect else FACE_BOXES
+
+    # In-process: the same detection + inference steps the worker runs
+    interpreter, settings = load_interpreter(args.model)
+    runner = BatchInference(interpreter)
+    cascade = cv2.CascadeClassifier(cascade_path)
+    lock = threading.Lock()
+
+    def in_process(frame, seq):
+        with lock:
+            found = faces
+            if found is None:
+                found = cascade.detectMultiScale(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), 1.1, 5, minSize=(60, 60))
+            boxes, crops = face_crops(frame, found)
+            return runner.run(crops) if crops else []
+
+    worker = InferenceWorker(args.model, cascade_path)
+    if not worker.start():
+        print("❌ Inference worker failed to start")
+        return 1
+
+    def out_of_process(frame, seq):
+        return worker.run(frame, seq, faces=faces)
+
+    print("=" * 78)
+    print(f"Worker latency benchmark ({backend}, {settings['num_threads']} threads, "
+          f"{os.cpu_count()} CPUs, {args.frames} frames @ {args.fps:.0f} FPS)")
+    print("=" * 78)
+    print(f"{'Mode':<16} {'Load':>6} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9} {'std ms':>9}")
+    print("-" * 78)
+
+    try:
+        for name, func in (("in-process", in_process), ("worker process", out_of_process)):
+            for load in (0, args.load_threads):
+                measure(func, frames, 10, args.fps, 0)  # Warm-up
+                result = percentiles(measure(func, frames, args.frames, args.fps, load))
+                print(f"{name:<16} {load:>6} {result['p50']:>9.2f} {result['p90']:>9.2f} "
+                      f"{result['p99']:>9.2f} {result['max']:>9.2f} {result['std']:>9.2f}")
+    finally:
+        worker.stop()
+
+    print("-" * 78)
+    print("Load = simulated web serving threads (JPEG encode + JSON). The worker mode")
+    print("includes copying the frame into shared memory and the pipe round trip.")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,310 @@
+"""
+Drowsiness Detection - Camera Sources
+picamera2 dual-stream capture: BGR main stream for the model crop,
+low-resolution YUV stream whose Y plane feeds face detection directly.
+Video file, image directory and synthetic sources stand in for a camera
+on machines without one (DROWSY_CAMERA_SOURCE)
+"""
+
+import os
+import time
+
+import cv2
+import numpy as np
+
+import config
+from metrics import stage_metrics
+
+MAIN_SIZE = (640, 480)
+
+# ============================================================
+# PICAMERA2 DUAL STREAM
+# ============================================================
+def configure_picamera2(cam):
+    """Create the picamera2 video configuration (main + optional lores stream)
+
+    picamera2's "RGB888" format is stored as [B, G, R] in memory, so the main
+    stream can be used by OpenCV without any colour conversion. The lores
+    stream is YUV420: its first plane is already a grayscale image.
+    """
+    if config.CAMERA_LORES:
+        try:
+            return cam.create_video_configuration(
+                main={"size": MAIN_SIZE, "format": "RGB888"},
+                lores={"size": config.CAMERA_LORES_SIZE, "format": "YUV420"}
+            )
+        except Exception:
+            pass  # Sensor/pipeline without lores support - main stream only
+    return cam.create_video_configuration(
+        main={"size": MAIN_SIZE, "format": "RGB888"}
+    )
+
+def crop_channel_order(camera_type):
+    """Channel order of the face crops fed to the model: "RGB" for picamera2, "BGR" otherwise
+
+    Frames are B,G,R in memory for every camera (picamera2's RGB888 is
+    stored that way). The classifier has always been given picamera2 crops
+    in R,G,B order, because the old capture path applied RGB2BGR to every
+    frame, and OpenCV/file crops in B,G,R order. face_crops() swaps the
+    crop only, so the model input per camera is unchanged.
+    """
+    return "RGB" if camera_type == "picamera2" else "BGR"
+
+def lores_size(cam):
+    """(width, height) of the configured lores stream, or None"""
+    try:
+        lores = cam.camera_config.get("lores")
+    except Exception:
+        return None
+    if not lores:
+        return None
+    return tuple(lores["size"])
+
+def capture_picamera2(cam, lores=None):
+    """Capture one frame, return (bgr_frame, gray, gray_scale)
+
+    gray is the lores Y plane (None without a lores stream) and gray_scale
+    is the factor that maps gray coordinates back to the main frame.
+    """
+    if lores is None:
+        return cam.capture_array(), None, 1.0
+
+    # Both arrays come from the same request, so they show the same instant
+    request = cam.capture_request()
+    try:
+        frame = request.make_array("main")
+        yuv = request.make_array("lores")
+    finally:
+        request.release()
+
+    width, height = lores
+    gray = yuv[:height, :width]
+    return frame, gray, frame.shape[1] / float(width)
+
+# ============================================================
+# FILE AND SYNTHETIC SOURCES
+# ============================================================
+FILE_SOURCES = ("video", "images", "synthetic")
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+class ReplaySource:
+    """Camera stand-in with the cv2.VideoCapture interface the apps use
+
+    read() blocks until the next frame is due, like a camera's read().
+    Frames are due every 1/fps from the first read, and a late reader gets
+    the frame of the current instant, not a backlog, so frame content and
+    timing match a camera at that FPS. `timestamp` is the wall-clock capture
+    time of the last frame and `wait` the seconds read() slept for it.
+    Frames are resized to `size` (the camera's main stream); read(image)
+    resizes into `image` when it has that shape.
+    """
+
+    kind = None
+
+    def __init__(self, fps, size=MAIN_SIZE, loop=True):
+        self.fps = fps
+        self.size = size
+        self.loop = loop
+        self.timestamp = None
+        self.wait = 0.0
+        self.frames = 0
+        self.skipped = 0
+        self.loops = 0
+        self._index = -1
+        self._start = None
+        self._wall_start = None
+        self._opened = True
+
+    def isOpened(self):
+        return self._opened
+
+    def read(self, image=None):
+        """(ret, frame) like cv2.VideoCapture.read(); False at the end without looping"""
+        if not self._opened:
+            return False, None
+
+        now = time.monotonic()
+        self.wait = 0.0
+        if self._start is None:
+            self._start, self._wall_start = now, time.time()
+            index = 0
+        else:
+            index = max(self._index + 1, int((now - self._start) * self.fps))
+            due = self._start + index / self.fps
+            if due > now:
+                self.wait = due - now
+                time.sleep(self.wait)
+
+        frame = self._next_frame(index - self._index - 1)
+        if frame is None and self.loop:
+            self.loops += 1
+            self._rewind()
+            frame = self._next_frame(0)
+        if frame is None:
+            self.release()  # End of the source: isOpened() turns False like an unplugged camera
+            return False, None
+
+        self.skipped += index - self._index - 1
+        self._index = index
+        self.frames += 1
+        self.timestamp = self._wall_start + index / self.fps
+        return True, self._fit(frame, image)
+
+    def release(self):
+        self._opened = False
+
+    def describe(self):
+        return f"{self.kind} source @ {self.fps:g} FPS"
+
+    def get_stats(self):
+        return {"kind": self.kind, "fps": self.fps, "frames": self.frames,
+                "skipped": self.skipped, "loops": self.loops}
+
+    def _fit(self, frame, image):
+        if (frame.shape[1], frame.shape[0]) != self.size:
+            if image is not None and image.shape == (self.size[1], self.size[0], 3):
+                return cv2.resize(frame, self.size, dst=image, interpolation=cv2.INTER_AREA)
+            return cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        return frame  # Already a fresh array, no copy into `image` needed
+
+    def _next_frame(self, skip):
+        """Skip `skip` frames and return the next one, None at the end"""
+        raise NotImplementedError
+
+    def _rewind(self):
+        raise NotImplementedError
+
+class VideoFileSource(ReplaySource):
+    """Frames of a video file, at its own frame rate unless `fps` is given"""
+
+    kind = "video"
+
+    def __init__(self, path, fps=0, size=MAIN_SIZE, loop=True):
+        self.path = path
+        self._cap = cv2.VideoCapture(path)
+        if not self._cap.isOpened():
+            raise ValueError(f"Cannot open video {path}")
+        super().__init__(fps or self._cap.get(cv2.CAP_PROP_FPS) or 15.0, size, loop)
+
+    def release(self):
+        super().release()
+        self._cap.release()
+
+    def describe(self):
+        return f"Video {os.path.basename(self.path)} @ {self.fps:g} FPS"
+
+    def _next_frame(self, skip):
+        for _ in range(skip):
+            if not self._cap.grab():
+                return None
+        ret, frame = self._cap.read()
+        return frame if ret else None
+
+    def _rewind(self):
+        self._cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+
+class ImageDirectorySource(ReplaySource):
+    """Images of a directory in name order, decoded as they are read"""
+
+    kind = "images"
+
+    def __init__(self, path, fps=0, size=MAIN_SIZE, loop=True):
+        self.path = path
+        self.files = sorted(os.path.join(path, f) for f in os.listdir(path)
+                            if f.lower().endswith(IMAGE_EXTENSIONS))
+        if not self.files:
+            raise ValueError(f"No images in {path}")
+        self._position = 0
+        super().__init__(fps or 15.0, size, loop)
+
+    def describe(self):
+        return f"{len(self.files)} images from {self.path} @ {self.fps:g} FPS"
+
+    def _next_frame(self, skip):
+        self._position += skip
+        while self._position < len(self.files):
+            frame = cv2.imread(self.files[self._position])
+            self._position += 1
+            if frame is not None:
+                return frame
+        return None
+
+    def _rewind(self):
+        self._position = 0
+
+class SyntheticSource(ReplaySource):
+    """Generated frames: textured background with a moving shape and a frame counter
+
+    No face for the cascade to find (so detection keeps searching, its
+    worst case), but real image content for JPEG encoding and streaming.
+    """
+
+    kind = "synthetic"
+
+    def __init__(self, fps=0, size=MAIN_SIZE, loop=True):
+        super().__init__(fps or 15.0, size, loop)
+        rng = np.random.default_rng(0)
+        noise = rng.integers(0, 256, (size[1], size[0], 3), dtype=np.uint8)
+        self._background = cv2.GaussianBlur(noise, (15, 15), 0)
+        self._position = 0
+
+    def describe(self):
+        return f"Synthetic {self.size[0]}x{self.size[1]} @ {self.fps:g} FPS"
+
+    def _next_frame(self, skip):
+        self._position += skip + 1
+        frame = self._background.copy()
+        w, h = self.size
+        angle = self._position / (2.0 * self.fps)
+        center = (int(w / 2 + w / 4 * np.cos(angle)), int(h / 2 + h / 4 * np.sin(angle)))
+        cv2.circle(frame, center, h // 6, (200, 180, 160), -1)
+        cv2.putText(frame, f"#{self._position}", (10, h - 15), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255), 2)
+        return frame
+
+    def _rewind(self):
+        pass
+
+def open_file_source(kind=None, path=None, fps=None, loop=None):
+    """Open the configured file/synthetic camera source (DROWSY_CAMERA_SOURCE)
+
+    Raises ValueError for an unknown kind or an unusable path.
+    """
+    kind = config.CAMERA_SOURCE if kind is None else kind
+    path = config.CAMERA_SOURCE_PATH if path is None else path
+    fps = config.CAMERA_SOURCE_FPS if fps is None else fps
+    loop = config.CAMERA_SOURCE_LOOP if loop is None else loop
+    if kind == "synthetic":
+        return SyntheticSource(fps, loop=loop)
+    if kind not in FILE_SOURCES:
+        raise ValueError(f"Unknown camera source '{kind}'")
+    if not path:
+        raise ValueError(f"Camera source '{kind}' needs DROWSY_CAMERA_SOURCE_PATH")
+    if kind == "images":
+        if not os.path.isdir(path):
+            raise ValueError(f"Not a directory: {path}")
+        return ImageDirectorySource(path, fps, loop=loop)
+    return VideoFileSource(path, fps, loop=loop)
+
+def read_frame(cam, image=None):
+    """cam.read(), recorded as the "capture" stage; return (ret, frame)
+
+    A file source's sleep until its next frame is due is replay pacing,
+    not capture latency, so it is left out of the measurement.
+    """
+    start = time.perf_counter()
+    ret, frame = cam.read() if image is None else cam.read(image)
+    elapsed = time.perf_counter() - start
+    if isinstance(cam, ReplaySource):
+        elapsed = max(0.0, elapsed - cam.wait)
+    stage_metrics.observe("capture", elapsed)
+    return ret, frame
+
+def source_ended(cam):
+    """True once a non-looping file source has delivered its last frame"""
+    return isinstance(cam, ReplaySource) and not cam.isOpened()
+
+def capture_timestamp(cam):
+    """Capture time of the frame just read: the source's own clock for file sources"""
+    if isinstance(cam, ReplaySource):
+        return cam.timestamp
+    return time.time()
@@ -0,0 +1,234 @@
+"""
+Drowsiness Detection - Runtime Configuration
+Performance tunables shared by all app versions
+Every value can be overridden with an environment variable (see PERFORMANCE_README.md)
+"""
+
+import os
+
+def _env_str(name, default):
+    return os.environ.get(name, default)
+
+def _env_int(name, default):
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+def _env_float(name, default):
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+def _env_bool(name, default):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+# ============================================================
+# FACE TRACKING
+# ============================================================
+# Run the full Haar cascade every N frames, follow the face with
+# optical flow in between
+FACE_TRACKING = _env_bool("DROWSY_FACE_TRACKING", True)
+FACE_DETECT_INTERVAL = _env_int("DROWSY_FACE_DETECT_INTERVAL", 5)
+FACE_TRACK_MIN_CONFIDENCE = _env_float("DROWSY_FACE_TRACK_MIN_CONFIDENCE", 0.5)
+FACE_BOX_SMOOTHING = _env_float("DROWSY_FACE_BOX_SMOOTHING", 0.5)  # 0 = no smoothing
+
+# ============================================================
+# FACE SEARCH REGION
+# ============================================================
+# Search near the last face with a size range learned from recent
+# detections, fall back to a full-frame scan after N misses
+FACE_ROI_SEARCH = _env_bool("DROWSY_FACE_ROI_SEARCH", True)
+FACE_ROI_EXPAND = _env_float("DROWSY_FACE_ROI_EXPAND", 0.5)  # Margin around last face, in face widths
+FACE_ROI_MAX_MISSES = _env_int("DROWSY_FACE_ROI_MAX_MISSES", 2)
+FACE_SIZE_HISTORY = _env_int("DROWSY_FACE_SIZE_HISTORY", 10)
+FACE_SIZE_MARGIN = _env_float("DROWSY_FACE_SIZE_MARGIN", 0.25)  # minSize/maxSize slack around history
+
+# ============================================================
+# INCREMENTAL FULL-FRAME SEARCH
+# ============================================================
+# While the face is lost, spread one full multi-scale search over
+# K frames so per-frame latency stays flat
+FACE_INCREMENTAL_SEARCH = _env_bool("DROWSY_FACE_INCREMENTAL_SEARCH", True)
+FACE_SEARCH_PHASES = _env_int("DROWSY_FACE_SEARCH_PHASES", 4)
+
+# ============================================================
+# MULTI-FACE MODE
+# ============================================================
+# Check every face in the cabin (driver + co-driver), all crops run
+# through the model in one batched invoke()
+MULTI_FACE = _env_bool("DROWSY_MULTI_FACE", False)
+MAX_FACES = _env_int("DROWSY_MAX_FACES", 2)
+FACE_STATE_TIMEOUT = _env_float("DROWSY_FACE_STATE_TIMEOUT", 1.0)  # Seconds before a lost face's state is dropped
+
+# ============================================================
+# EYE-CLOSURE STATISTICS
+# ============================================================
+# The alarm goes off once the eyes were closed for alarm_threshold seconds
+# out of the last alarm_threshold / ALARM_CLOSED_RATIO seconds, so a single
+# open frame no longer resets the timer (1.0 = closed without interruption)
+ALARM_CLOSED_RATIO = _env_float("DROWSY_ALARM_CLOSED_RATIO", 0.8)
+STATE_EMA_TAU = _env_float("DROWSY_STATE_EMA_TAU", 0.3)  # Seconds, smoothing of the DROWSY/ALERT status
+PERCLOS_WINDOW = _env_float("DROWSY_PERCLOS_WINDOW", 60.0)  # Seconds for PERCLOS and blink rate
+BLINK_MAX_DURATION = _env_float("DROWSY_BLINK_MAX_DURATION", 0.5)  # Longer closures are not blinks
+SAMPLE_MAX_GAP = _env_float("DROWSY_SAMPLE_MAX_GAP", 1.0)  # Longest time one prediction may stand for
+
+# ============================================================
+# PIPELINE
+# ============================================================
+# Run capture / detection / inference / alarm decision as separate
+# stages on their own threads (0 = one sequential loop as before)
+PIPELINE = _env_bool("DROWSY_PIPELINE", True)
+PIPELINE_QUEUE_SIZE = _env_int("DROWSY_PIPELINE_QUEUE_SIZE", 1)  # Items between stages, oldest dropped when full
+
+# ============================================================
+# ADAPTIVE DETECTION RATE
+# ============================================================
+# Detection frames are paced by deadline instead of a fixed sleep. The rate
+# follows the driver state: full while DROWSY (or not yet stably ALERT), low
+# once ALERT has held for RATE_ALERT_HOLD seconds, probe while no face is in
+# view. 0 FPS = no limit (camera rate). Off = always the full rate.
+ADAPTIVE_RATE = _env_bool("DROWSY_ADAPTIVE_RATE", True)
+RATE_FULL_FPS = _env_float("DROWSY_RATE_FULL_FPS", 0.0)
+RATE_ALERT_FPS = _env_float("DROWSY_RATE_ALERT_FPS", 5.0)
+RATE_PROBE_FPS = _env_float("DROWSY_RATE_PROBE_FPS", 2.0)
+RATE_ALERT_HOLD = _env_float("DROWSY_RATE_ALERT_HOLD", 5.0)  # Seconds of stable ALERT before the rate drops
+
+# ============================================================
+# PERFORMANCE GOVERNOR
+# ============================================================
+# Steps detection resolution, stream FPS/JPEG quality and inference threads
+# down when the SoC gets hot or the CPU has no headroom (web versions),
+# and back up once it stayed below threshold - hysteresis for RECOVER_TIME
+GOVERNOR = _env_bool("DROWSY_GOVERNOR", True)
+GOVERNOR_INTERVAL = _env_float("DROWSY_GOVERNOR_INTERVAL", 2.0)  # Seconds between samples
+GOVERNOR_TEMP_WARM = _env_float("DROWSY_GOVERNOR_TEMP_WARM", 70.0)  # °C, Pi firmware throttles at 80-85
+GOVERNOR_TEMP_HOT = _env_float("DROWSY_GOVERNOR_TEMP_HOT", 78.0)
+GOVERNOR_TEMP_HYSTERESIS = _env_float("DROWSY_GOVERNOR_TEMP_HYSTERESIS", 5.0)
+GOVERNOR_CPU_HIGH = _env_float("DROWSY_GOVERNOR_CPU_HIGH", 90.0)  # % of all cores
+GOVERNOR_CPU_HYSTERESIS = _env_float("DROWSY_GOVERNOR_CPU_HYSTERESIS", 20.0)
+GOVERNOR_RECOVER_TIME = _env_float("DROWSY_GOVERNOR_RECOVER_TIME", 30.0)
+
+# ============================================================
+# RESOURCE SAMPLER
+# ============================================================
+# CPU / RAM / temperature / throttling are read on a background thread
+# (web versions); routes and the governor use the cached samples
+RESOURCE_SAMPLE_INTERVAL = _env_float("DROWSY_RESOURCE_SAMPLE_INTERVAL", 1.0)  # Seconds
+RESOURCE_HISTORY = _env_int("DROWSY_RESOURCE_HISTORY", 300)  # Samples kept (5 min at 1 s)
+
+# ============================================================
+# INFERENCE WORKER
+# ============================================================
+# Run face detection + TFLite inference in a separate process (app.py,
+# app_auto.py); frames are passed through shared memory slots
+INFERENCE_WORKER = _env_bool("DROWSY_INFERENCE_WORKER", False)
+# Frames in flight to the worker; 1 = lowest latency, 2 keeps the worker busy
+# while the next frame is copied but each result is one frame older
+INFERENCE_WORKER_SLOTS = _env_int("DROWSY_INFERENCE_WORKER_SLOTS", 1)
+INFERENCE_WORKER_TIMEOUT = _env_float("DROWSY_INFERENCE_WORKER_TIMEOUT", 2.0)  # Seconds to wait for a result
+
+# ============================================================
+# SERVER-SENT EVENTS
+# ============================================================
+# Dashboards subscribe to /events instead of polling; status is pushed on
+# change, statistics and resource snapshots at their own rates
+EVENTS_MIN_INTERVAL = _env_float("DROWSY_EVENTS_MIN_INTERVAL", 0.1)  # Seconds, caps pushes per client at 10/s
+EVENTS_STATS_INTERVAL = _env_float("DROWSY_EVENTS_STATS_INTERVAL", 1.0)  # Seconds
+EVENTS_RESOURCE_INTERVAL = _env_float("DROWSY_EVENTS_RESOURCE_INTERVAL", 5.0)  # Seconds
+EVENTS_KEEPALIVE = _env_float("DROWSY_EVENTS_KEEPALIVE", 15.0)  # Seconds between comments on an idle stream
+
+# ============================================================
+# LATENCY METRICS
+# ============================================================
+# Per-stage histograms are served at /metrics (web versions); the CLI/GUI
+# versions rewrite a Prometheus textfile every interval (0 = off)
+METRICS_DUMP_INTERVAL = _env_float("DROWSY_METRICS_DUMP_INTERVAL", 15.0)  # Seconds
+METRICS_DUMP_FILE = _env_str("DROWSY_METRICS_DUMP_FILE", "")  # "" = <tmp>/drowsiness_<app>.prom
+LATENCY_WINDOW = _env_int("DROWSY_LATENCY_WINDOW", 5000)  # Inference-time samples kept for percentiles (app.py)
+
+# ============================================================
+# EVENT LOG
+# ============================================================
+# Binary per-frame log of every session (event_log.py), written by a
+# background thread; runs of the same state are merged into one record.
+# Off by default: a constant write load the SD card should not carry unasked
+EVENT_LOG = _env_bool("DROWSY_EVENT_LOG", False)
+EVENT_LOG_DIR = _env_str("DROWSY_EVENT_LOG_DIR", "")  # "" = backend/event_logs
+EVENT_LOG_FLUSH_INTERVAL = _env_float("DROWSY_EVENT_LOG_FLUSH_INTERVAL", 1.0)  # Seconds between batched writes
+EVENT_LOG_FSYNC_INTERVAL = _env_float("DROWSY_EVENT_LOG_FSYNC_INTERVAL", 10.0)  # Seconds between fsyncs
+EVENT_LOG_MAX_RUN = _env_int("DROWSY_EVENT_LOG_MAX_RUN", 150)  # Frames per merged record (1 = every frame)
+
+# ============================================================
+# SESSION STORE
+# ============================================================
+# SQLite history of sessions, drowsy/alarm episodes and per-minute
+# aggregates (session_store.py), served at /sessions in the web versions.
+# Off by default, like the event log (SD card writes only when asked for)
+SESSION_STORE = _env_bool("DROWSY_SESSION_STORE", False)
+SESSION_DB = _env_str("DROWSY_SESSION_DB", "")  # "" = backend/sessions.db
+SESSION_SCENARIO = _env_str("DROWSY_SESSION_SCENARIO", "Real-time Testing")  # Scenario of new sessions
+SESSION_FLUSH_INTERVAL = _env_float("DROWSY_SESSION_FLUSH_INTERVAL", 5.0)  # Seconds between transactions
+SESSION_PAGE_MAX = _env_int("DROWSY_SESSION_PAGE_MAX", 500)  # Largest ?limit= of the history routes
+
+# ============================================================
+# ASYNC SERVER
+# ============================================================
+# Serve app.py / app_auto.py on uvicorn: /video_feed and /events become
+# async generators on one event loop instead of a thread per viewer
+ASYNC_SERVER = _env_bool("DROWSY_ASYNC_SERVER", False)
+ASYNC_SERVER_THREADS = _env_int("DROWSY_ASYNC_SERVER_THREADS", 4)  # Threads for the other (Flask) routes
+
+# ============================================================
+# FRAME BUS
+# ============================================================
+# Ring depth must cover the slowest consumer (detection) at the camera FPS
+FRAME_BUS_SLOTS = _env_int("DROWSY_FRAME_BUS_SLOTS", 8)
+
+# ============================================================
+# CAMERA
+# ============================================================
+# "auto" = USB webcam, then Pi camera; "opencv" / "picamera2" to force one;
+# "video" (looping file), "images" (directory) or "synthetic" to run
+# without a camera at the same frame rate
+CAMERA_SOURCE = _env_str("DROWSY_CAMERA_SOURCE", "auto")
+CAMERA_SOURCE_PATH = _env_str("DROWSY_CAMERA_SOURCE_PATH", "")  # Video file or image directory
+CAMERA_SOURCE_FPS = _env_float("DROWSY_CAMERA_SOURCE_FPS", 0.0)  # 0 = the video's own rate, 15 otherwise
+CAMERA_SOURCE_LOOP = _env_bool("DROWSY_CAMERA_SOURCE_LOOP", True)  # Off = capture stops at the end
+# picamera2 lores stream used for face detection (Y plane of YUV420)
+CAMERA_LORES = _env_bool("DROWSY_CAMERA_LORES", True)
+CAMERA_LORES_SIZE = (
+    _env_int("DROWSY_CAMERA_LORES_WIDTH", 320),
+    _env_int("DROWSY_CAMERA_LORES_HEIGHT", 240)
+)
+
+# ============================================================
+# MODEL VARIANTS
+# ============================================================
+# "auto" = fastest variant in the registry whose accuracy is within
+# MODEL_ACCURACY_TOLERANCE of the float baseline, or a variant name
+# (float32 / float16 / dynamic / int8) to force one
+MODEL_VARIANT = _env_str("DROWSY_MODEL_VARIANT", "auto")
+MODEL_ACCURACY_TOLERANCE = _env_float("DROWSY_MODEL_ACCURACY_TOLERANCE", 0.02)  # Absolute accuracy drop allowed
+MODEL_REGISTRY_FILE = _env_str(
+    "DROWSY_MODEL_REGISTRY_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "model_variants", "registry.json")
+)
+
+# ============================================================
+# TFLITE INTERPRETER
+# ============================================================
+# 0 = use the tuned value from TFLITE_TUNING_FILE, or all cores if not tuned
+TFLITE_THREADS = _env_int("DROWSY_TFLITE_THREADS", 0)
+# "auto" = tuned value (XNNPACK on if not tuned), "1" = on, "0" = off
+TFLITE_XNNPACK = _env_str("DROWSY_TFLITE_XNNPACK", "auto")
+# Benchmark thread counts at startup when the model has no tuning record yet
+TFLITE_AUTOTUNE = _env_bool("DROWSY_TFLITE_AUTOTUNE", False)
+TFLITE_TUNING_FILE = _env_str(
+    "DROWSY_TFLITE_TUNING_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "tflite_tuning.json")
+)
@@ -0,0 +1,169 @@
+"""
+Drowsiness Detection - Per-Face Alarm State
+Alarm decision for one face from windowed eye-closure statistics, and a set
+of them that follows every face in the cabin from frame to frame
+"""
+
+import config
+from drowsiness_stats import EyeClosureStats
+from face_detection import box_iou
+
+# ============================================================
+# SINGLE FACE
+# ============================================================
+class DrowsinessState:
+    """ALERT / DROWSY / alarm state of one face
+
+    The status follows an exponential average of the closed predictions, so
+    one stray frame does not flip it. The alarm goes off once the eyes were
+    closed for `alarm_threshold` seconds out of the last
+    alarm_threshold / closed_ratio seconds: an open frame in between only
+    pauses the count instead of restarting it, which keeps the alarm
+    reliable at low detection rates. drowsy_duration is that closed time.
+    """
+
+    def __init__(self, face_id, alarm_threshold, closed_ratio=config.ALARM_CLOSED_RATIO):
+        self.face_id = face_id
+        self.alarm_threshold = alarm_threshold
+        self.closed_ratio = min(1.0, max(0.1, closed_ratio))
+        self.stats = EyeClosureStats(self._alarm_window())
+        self.box = None
+        self.is_drowsy = False
+        self.eyes_closed = False  # Raw prediction of the last frame (is_drowsy is smoothed)
+        self.confidence = None
+        self.drowsy_start_time = None
+        self.drowsy_duration = 0.0
+        self.alarm_active = False
+        self.started = False  # Drowsy spell started on this update
+        self.recovered_after = None  # Length of the drowsy spell that ended on this update
+        self.last_seen = None
+
+    @property
+    def status(self):
+        return "DROWSY" if self.is_drowsy else "ALERT"
+
+    def update(self, box, is_drowsy, confidence, now):
+        """Feed one prediction, return the state itself"""
+        self.box = box
+        self.eyes_closed = is_drowsy
+        self.confidence = confidence
+        self.last_seen = now
+        self.started = False
+        self.recovered_after = None
+
+        self.stats.alarm.length = self._alarm_window()  # The threshold can change at runtime
+        self.stats.update(is_drowsy, confidence, now)
+        self.drowsy_duration = self.stats.closed_time
+
+        was_drowsy = self.is_drowsy
+        self.is_drowsy = self.stats.closed_ema >= 0.5
+        if self.is_drowsy and not was_drowsy:
+            self.drowsy_start_time = now
+            self.started = True
+        elif was_drowsy and not self.is_drowsy:
+            self.recovered_after = now - self.drowsy_start_time
+            self.drowsy_start_time = None
+        # Small tolerance: running sums of float durations
+        self.alarm_active = self.is_drowsy and self.drowsy_duration >= self.alarm_threshold - 1e-6
+        return self
+
+    def reset(self):
+        """Forget the history (face lost)"""
+        self.stats.reset()
+        self.is_drowsy = False
+        self.eyes_closed = False
+        self.drowsy_start_time = None
+        self.drowsy_duration = 0.0
+        self.alarm_active = False
+
+    def severity(self):
+        """Sort key: alarm > drowsy > alert, longer drowsy first"""
+        return (self.alarm_active, self.is_drowsy, self.drowsy_duration)
+
+    def _alarm_window(self):
+        return self.alarm_threshold / self.closed_ratio
+
+    def to_dict(self):
+        x, y, w, h = self.box
+        return {
+            "id": self.face_id,
+            "status": self.status,
+            "is_drowsy": self.is_drowsy,
+            "confidence": self.confidence,
+            "drowsy_duration": self.drowsy_duration,
+            "alarm_active": self.alarm_active,
+            "perclos": round(self.stats.perclos, 3),
+            "ema_confidence": self.stats.ema_confidence,
+            "blink_rate": round(self.stats.blink_rate, 1),
+            "box": {"x": int(x), "y": int(y), "width": int(w), "height": int(h)}
+        }
+
+# ============================================================
+# ALL FACES
+# ============================================================
+class FaceStates:
+    """One DrowsinessState per face, matched across frames by box overlap
+
+    In multi-face mode a face that is not matched for `timeout` seconds is
+    dropped, so a short detection gap on one seat does not reset its
+    statistics. With a single face (max_faces=1, the default) the same state is
+    always reused and a frame without a face resets it immediately, exactly
+    like the old single-driver timer.
+    """
+
+    def __init__(self, alarm_threshold, max_faces=None, timeout=None):
+        if max_faces is None:
+            max_faces = config.MAX_FACES if config.MULTI_FACE else 1
+        if timeout is None:
+            timeout = config.FACE_STATE_TIMEOUT if max_faces > 1 else 0.0
+        self.alarm_threshold = alarm_threshold
+        self.max_faces = max(1, max_faces)
+        self.timeout = timeout
+        self.states = []
+        self.current = []
+        self._next_id = 1
+
+    def update(self, results, now):
+        """Feed [(box, is_drowsy, confidence), ...] for one frame
+
+        Returns the states of the faces seen in this frame, most severe first.
+        """
+        unmatched = list(self.states)
+        current = []
+        for box, is_drowsy, confidence in results[:self.max_faces]:
+            state = self._match(box, unmatched)
+            if state is None:
+                state = DrowsinessState(self._next_id, self.alarm_threshold)
+                self._next_id += 1
+                self.states.append(state)
+            else:
+                unmatched.remove(state)
+            state.alarm_threshold = self.alarm_threshold
+            current.append(state.update(box, is_drowsy, confidence, now))
+
+        # Faces not seen for a while are gone, their timers start over
+        self.states = [s for s in self.states if s in current or now - s.last_seen < self.timeout]
+        self.current = sorted(current, key=lambda s: s.severity(), reverse=True)
+        return self.current
+
+    def primary(self):
+        """Most severe face in the last frame (drives LEDs/buzzer) or None"""
+        return self.current[0] if self.current else None
+
+    def frame_status(self):
+        """Unsmoothed status of the last frame for the rate scheduler: any closed-eye prediction is DROWSY"""
+        if not self.current:
+            return "NO FACE"
+        return "DROWSY" if any(s.eyes_closed for s in self.current) else "ALERT"
+
+    def reset(self):
+        self.states = []
+        self.current = []
+
+    def _match(self, box, candidates):
+        if not candidates:
+            return None
+        if self.max_faces == 1:
+            return candidates[0]
+        best = max(candidates, key=lambda s: box_iou(s.box, box))
+        return best if box_iou(best.box, box) > 0 else None
@@ -0,0 +1,165 @@
+"""
+Drowsiness Detection - Windowed Eye-Closure Statistics
+Time-weighted ring buffers with running sums: closed time in the alarm
+window, PERCLOS, blink rate and EMA confidence, each updated in constant
+(amortised) time per prediction, independent of the detection rate
+"""
+
+import math
+
+import config
+
+# ============================================================
+# RING BUFFER
+# ============================================================
+class TimeWindow:
+    """Samples of the last `length` seconds with a running sum of their values
+
+    Each sample stands for `duration` seconds of `value` (e.g. 1.0 = eyes
+    closed). Samples are stored in a ring that doubles when full, so add()
+    and expiry cost O(1) amortised however many samples the window holds.
+    """
+
+    def __init__(self, length, capacity=64):
+        self.length = length
+        self._times = [0.0] * capacity
+        self._durations = [0.0] * capacity
+        self._values = [0.0] * capacity
+        self._head = 0  # Oldest sample
+        self._count = 0
+        self.total = 0.0  # Seconds covered
+        self.sum = 0.0  # Seconds weighted by value
+
+    def __len__(self):
+        return self._count
+
+    def add(self, t, duration, value=1.0):
+        if self._count == len(self._times):
+            self._grow()
+        i = (self._head + self._count) % len(self._times)
+        self._times[i] = t
+        self._durations[i] = duration
+        self._values[i] = value
+        self._count += 1
+        self.total += duration
+        self.sum += duration * value
+        self.expire(t)
+
+    def expire(self, now):
+        """Drop samples older than the window"""
+        cutoff = now - self.length
+        while self._count and self._times[self._head] <= cutoff:
+            i = self._head
+            self.total -= self._durations[i]
+            self.sum -= self._durations[i] * self._values[i]
+            self._head = (i + 1) % len(self._times)
+            self._count -= 1
+        if not self._count:
+            # Running sums drift by float rounding, an empty window starts exact again
+            self.total = self.sum = 0.0
+
+    def mean(self):
+        return max(0.0, self.sum) / self.total if self.total > 0 else 0.0
+
+    def clear(self):
+        self._head = self._count = 0
+        self.total = self.sum = 0.0
+
+    def _grow(self):
+        size = len(self._times)
+        order = [(self._head + k) % size for k in range(self._count)]
+        self._times = [self._times[i] for i in order] + [0.0] * size
+        self._durations = [self._durations[i] for i in order] + [0.0] * size
+        self._values = [self._values[i] for i in order] + [0.0] * size
+        self._head = 0
+
+# ============================================================
+# EYE-CLOSURE STATISTICS
+# ============================================================
+class EyeClosureStats:
+    """Windowed statistics of the closed/open predictions of one face
+
+    A prediction stands for the time since the previous one (at most
+    `max_gap`), so statistics are weighted by time, not by frame count: a
+    5 FPS stretch counts as much as a 30 FPS one.
+
+    - closed_time: closed seconds in the alarm window (`alarm_window` s)
+    - perclos: fraction of closed time in the last `perclos_window` s
+    - blink_rate: closed runs shorter than `blink_max` per minute
+    - closed_ema / ema_confidence: exponential averages with time constant `tau`
+    """
+
+    def __init__(self, alarm_window, perclos_window=config.PERCLOS_WINDOW, tau=config.STATE_EMA_TAU,
+                 blink_max=config.BLINK_MAX_DURATION, max_gap=config.SAMPLE_MAX_GAP):
+        self.alarm = TimeWindow(alarm_window)
+        self.perclos_window = TimeWindow(perclos_window)
+        self.blinks = TimeWindow(perclos_window)
+        self.tau = tau
+        self.blink_max = blink_max
+        self.max_gap = max_gap
+        self.closed_ema = 0.0
+        self.ema_confidence = None
+        self.samples = 0
+        self._first_time = None
+        self._last_time = None
+        self._closed_since = None  # Start of the current closed run
+
+    @property
+    def closed_time(self):
+        return max(0.0, self.alarm.sum)
+
+    @property
+    def perclos(self):
+        return self.perclos_window.mean()
+
+    @property
+    def blink_rate(self):
+        """Blinks per minute over the PERCLOS window (or the time seen so far)"""
+        if self._first_time is None or self._last_time is None:
+            return 0.0
+        span = min(self.blinks.length, self._last_time - self._first_time)
+        return len(self.blinks) * 60.0 / span if span > 0 else 0.0
+
+    def update(self, closed, confidence, now):
+        """Add one prediction (closed: bool, confidence: model output or None)"""
+        dt = 0.0 if self._last_time is None else min(max(0.0, now - self._last_time), self.max_gap)
+        value = 1.0 if closed else 0.0
+
+        self.alarm.add(now, dt, value)
+        self.perclos_window.add(now, dt, value)
+
+        # Time-aware EMA: the same smoothing in seconds at any frame rate
+        alpha = 1.0 - math.exp(-dt / self.tau) if self.tau > 0 and dt > 0 else 1.0
+        if self._last_time is None:
+            self.closed_ema = value
+        else:
+            self.closed_ema += alpha * (value - self.closed_ema)
+        if confidence is not None:
+            if self.ema_confidence is None:
+                self.ema_confidence = confidence
+            else:
+                self.ema_confidence += alpha * (confidence - self.ema_confidence)
+
+        # A blink is a closed run that ended within blink_max seconds
+        if closed:
+            if self._closed_since is None:
+                self._closed_since = now - dt
+        elif self._closed_since is not None:
+            if now - self._closed_since <= self.blink_max:
+                self.blinks.add(now, 0.0)
+            self._closed_since = None
+        self.blinks.expire(now)
+
+        if self._first_time is None:
+            self._first_time = now
+        self._last_time = now
+        self.samples += 1
+
+    def reset(self):
+        self.alarm.clear()
+        self.perclos_window.clear()
+        self.blinks.clear()
+        self.closed_ema = 0.0
+        self.ema_confidence = None
+        self.samples = 0
+        self._first_time = self._last_time = self._closed_since = None
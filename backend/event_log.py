@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+Drowsiness Detection - Binary Event Log
+Append-only per-frame record of a session: fixed-width little-endian
+records (timestamp, frame seq, face box, confidence, state, drowsy
+duration, stage timings) written by a background thread. Consecutive
+frames with the same state are run-length compacted into one record.
+Read back with open_event_log(), which memory-maps the file as a NumPy
+structured array.
+
+Usage (summary of a log):
+    python3 event_log.py event_logs/app_auto_20250101_120000.bin
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+import numpy as np
+
+import config
+from metrics import TIMING_STAGES
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"DRWSYLOG"
+VERSION = 1
+HEADER_DTYPE = np.dtype([("magic", "S8"), ("version", "<u4"), ("record_size", "<u4")])
+
+STATES = ("NO FACE", "ALERT", "DROWSY", "ALARM")  # state code = index
+
+# Stage timings stored per record (ms), keys as in metrics.STAGES
+TIMING_FIELDS = ("convert", "cascade", "crop_resize", "invoke", "dequantize", "frame_age")
+
+# 72 bytes per record. A run of `frames` frames keeps the first timestamp
+# and seq, the last box and drowsy duration, and mean confidence/timings.
+RECORD_DTYPE = np.dtype([
+    ("time", "<f8"),             # Capture time of the first frame (epoch seconds)
+    ("end_time", "<f8"),         # Capture time of the last frame
+    ("seq", "<u4"),              # Frame seq of the first frame
+    ("frames", "<u4"),           # Frames in this run (1 = single frame)
+    ("x", "<i2"), ("y", "<i2"), ("w", "<i2"), ("h", "<i2"),  # Primary face box (0 if none)
+    ("confidence", "<f4"),       # Mean model output (NaN without a face)
+    ("confidence_min", "<f4"),
+    ("drowsy_duration", "<f4"),  # Seconds, at the end of the run
+    ("state", "u1"),             # Index into STATES
+    ("faces", "u1"),             # Faces in the frame
+    ("reserved", "<u2"),
+] + [(f"{name}_ms", "<f4") for name in TIMING_FIELDS])
+
+def state_code(face):
+    """STATES index for a DrowsinessState (None = no face)"""
+    if face is None:
+        return 0
+    if face.alarm_active:
+        return 3
+    return 2 if face.is_drowsy else 1
+
+def _box(box):
+    """(x, y, w, h) from a box tuple or app.py's {'x', 'y', 'width', 'height'} dict"""
+    if box is None:
+        return 0, 0, 0, 0
+    if isinstance(box, dict):
+        return box["x"], box["y"], box["width"], box["height"]
+    return box
+
+# ============================================================
+# WRITER
+# ============================================================
+class EventLog:
+    """Background writer of the binary event log
+
+    record() only appends a tuple to a deque, so the detection thread
+    never waits for the disk; when more than `max_pending` frames are
+    waiting (disk stalled) new frames are counted as dropped instead.
+    The writer wakes every `flush_interval` seconds, compacts the pending
+    frames into runs (same state and face count, at most `max_run`
+    frames) and writes all finished runs with one write() call. The file
+    is fsync'ed at most every `fsync_interval` seconds. Only the writer
+    touches the file: on close() it writes what is left and closes it.
+    """
+
+    def __init__(self, path, flush_interval=config.EVENT_LOG_FLUSH_INTERVAL,
+                 fsync_interval=config.EVENT_LOG_FSYNC_INTERVAL, max_run=config.EVENT_LOG_MAX_RUN,
+                 max_pending=10000):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.fsync_interval = fsync_interval
+        self.max_run = max(1, max_run)
+        self.max_pending = max_pending
+        self._pending = deque()
+        self._run = None  # Open run: [code, faces, first, last, seq, frames, box, conf_sum, conf_n, conf_min, duration, timings]
+        self._seq = 0
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._file = None
+        self._last_fsync = 0.0
+        self.frames = 0
+        self.records = 0
+        self.dropped = 0
+        self.bytes = 0
+
+    def start(self):
+        new = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        self._file = open(self.path, "ab", buffering=0)
+        if new:
+            header = np.array([(MAGIC, VERSION, RECORD_DTYPE.itemsize)], dtype=HEADER_DTYPE)
+            self._file.write(header.tobytes())
+        self._last_fsync = time.monotonic()
+        self._thread = threading.Thread(target=self._run_writer, name="event-log", daemon=True)
+        self._thread.start()
+        return self
+
+    def record(self, timestamp, seq, face, faces=None, timings=None, now=None):
+        """Queue one processed frame (detection thread, never blocks)
+
+        face: the primary DrowsinessState or None; timings: the frame's
+        timings dict (keys as in metrics.TIMING_STAGES).
+        """
+        if len(self._pending) >= self.max_pending:
+            self.dropped += 1
+            return
+        if face is None:
+            entry = (timestamp, seq, 0, 0, None, None, 0.0, timings, now or time.time())
+        else:
+            entry = (timestamp, seq, state_code(face), 1 if faces is None else faces, face.box,
+                     face.confidence, face.drowsy_duration, timings, now or time.time())
+        self._pending.append(entry)
+
+    def close(self):
+        """Stop the writer, which writes everything still pending (including the open run) and fsyncs"""
+        self._stop_event.set()
+        if self._thread is None:
+            return
+        self._thread.join(5.0)
+        if self._thread.is_alive():
+            logger.warning(f"⚠️ Event log writer still busy, {self.path} is closed when it finishes")
+
+    def get_stats(self):
+        return {
+            "path": self.path,
+            "frames": self.frames,
+            "records": self.records,
+            "pending": len(self._pending),
+            "dropped": self.dropped,
+            "bytes": self.bytes
+        }
+
+    def _run_writer(self):
+        while not self._stop_event.wait(self.flush_interval):
+            try:
+                self._flush()
+            except Exception as e:
+                logger.error(f"Event log write failed: {e}")
+        try:
+            self._flush(final=True)
+            os.fsync(self._file.fileno())
+        except Exception as e:
+            logger.error(f"Event log write failed: {e}")
+        finally:
+            self._file.close()
+            self._file = None
+
+    def _flush(self, final=False):
+        rows = []
+        for _ in range(len(self._pending)):
+            self._add(self._pending.popleft(), rows)
+        if final and self._run is not None:
+            rows.append(self._pack(self._run))
+            self._run = None
+        if rows:
+            data = np.array(rows, dtype=RECORD_DTYPE).tobytes()
+            self._file.write(data)  # One write() per batch
+            self.records += len(rows)
+            self.bytes += len(data)
+        if time.monotonic() - self._last_fsync >= self.fsync_interval:
+            os.fsync(self._file.fileno())
+            self._last_fsync = time.monotonic()
+
+    def _add(self, entry, rows):
+        """Extend the open run with one frame or close it and start a new one"""
+        timestamp, seq, code, faces, box, confidence, duration, timings, decided = entry
+        if seq is None:
+            seq = self._seq
+        self._seq = seq + 1
+        self.frames += 1
+
+        stage = dict.fromkeys(TIMING_FIELDS, 0.0)
+        for key, seconds in (timings or {}).items():
+            name = TIMING_STAGES.get(key)
+            if name is not None:
+                stage[name] += seconds * 1000
+        stage["frame_age"] = max(0.0, decided - timestamp) * 1000
+
+        run = self._run
+        if run is not None and run[0] == code and run[1] == faces and run[5] < self.max_run:
+            run[3] = timestamp
+            run[5] += 1
+            run[6] = box
+            if confidence is not None:
+                run[7] += confidence
+                run[8] += 1
+                run[9] = min(run[9], confidence)
+            run[10] = duration
+            for name in TIMING_FIELDS:
+                run[11][name] += stage[name]
+            return
+
+        if run is not None:
+            rows.append(self._pack(run))
+        conf = 0.0 if confidence is None else confidence
+        self._run = [code, faces, timestamp, timestamp, seq, 1, box, conf, int(confidence is not None),
+                     conf if confidence is not None else np.inf, duration, stage]
+
+    def _pack(self, run):
+        code, faces, first, last, seq, frames, box, conf_sum, conf_n, conf_min, duration, stage = run
+        x, y, w, h = _box(box)
+        return (first, last, seq % 2 ** 32, frames, x, y, w, h,
+                conf_sum / conf_n if conf_n else np.nan, conf_min if conf_n else np.nan,
+                duration, code, min(faces, 255), 0, *(stage[name] / frames for name in TIMING_FIELDS))
+
+def start_event_log(app_name):
+    """Open <EVENT_LOG_DIR>/<app>_<date>_<time>.bin, None if disabled or the directory is not writable"""
+    if not config.EVENT_LOG:
+        return None
+    directory = config.EVENT_LOG_DIR or os.path.join(os.path.dirname(os.path.abspath(__file__)), "event_logs")
+    path = os.path.join(directory, f"{app_name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.bin")
+    try:
+        os.makedirs(directory, exist_ok=True)
+        return EventLog(path).start()
+    except OSError as e:
+        logger.warning(f"⚠️ Event log disabled ({directory}): {e}")
+        return None
+
+# ============================================================
+# READER
+# ============================================================
+def open_event_log(path):
+    """Memory-mapped RECORD_DTYPE array of a log (a torn last record is ignored)"""
+    header = np.fromfile(path, dtype=HEADER_DTYPE, count=1)
+    if not len(header) or header[0]["magic"] != MAGIC:
+        raise ValueError(f"{path} is not an event log")
+    if header[0]["record_size"] != RECORD_DTYPE.itemsize:
+        raise ValueError(f"{path}: record size {header[0]['record_size']}, expected {RECORD_DTYPE.itemsize}")
+    count = (os.path.getsize(path) - HEADER_DTYPE.itemsize) // RECORD_DTYPE.itemsize
+    if count <= 0:
+        return np.zeros(0, dtype=RECORD_DTYPE)
+    return np.memmap(path, dtype=RECORD_DTYPE, mode="r", offset=HEADER_DTYPE.itemsize, shape=(count,))
+
+def summarize(records):
+    """Frames, time span, seconds per state, alarm episodes and mean timings (vectorised)"""
+    if not len(records):
+        return None
+    frames = records["frames"].astype(np.int64)
+    # A record lasts until the next one starts (the last one until its last frame)
+    span = np.maximum(np.diff(records["time"], append=records["end_time"][-1]), 0.0)
+    alarm = records["state"] == 3
+    starts = alarm & ~np.concatenate(([False], alarm[:-1]))
+    return {
+        "records": int(len(records)),
+        "frames": int(frames.sum()),
+        "start": float(records["time"][0]),
+        "end": float(records["end_time"][-1]),
+        "seconds_per_state": {
+            name: float(span[records["state"] == code].sum()) for code, name in enumerate(STATES)
+        },
+        "frames_per_state": {
+            name: int(frames[records["state"] == code].sum()) for code, name in enumerate(STATES)
+        },
+        "alarm_episodes": int(starts.sum()),
+        "mean_ms": {
+            name: float((records[f"{name}_ms"] * frames).sum() / frames.sum()) for name in TIMING_FIELDS
+        }
+    }
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Summary of a binary event log")
+    parser.add_argument("path")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    records = open_event_log(args.path)
+    summary = summarize(records)
+    elapsed = time.perf_counter() - start
+    if summary is None:
+        print("Empty log")
+        return 0
+
+    print(f"{args.path}: {summary['records']} records, {summary['frames']} frames "
+          f"({summary['frames'] / summary['records']:.1f} frames/record), read in {elapsed * 1000:.1f} ms")
+    print(f"{datetime.fromtimestamp(summary['start']):%Y-%m-%d %H:%M:%S} - "
+          f"{datetime.fromtimestamp(summary['end']):%H:%M:%S} ({summary['end'] - summary['start']:.0f} s)")
+    for name in STATES:
+        print(f"  {name:<8} {summary['frames_per_state'][name]:>8} frames {summary['seconds_per_state'][name]:>9.1f} s")
+    print(f"Alarm episodes: {summary['alarm_episodes']}")
+    print("Mean ms: " + ", ".join(f"{name} {value:.2f}" for name, value in summary["mean_ms"].items()))
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,161 @@
+"""
+Drowsiness Detection - Server-Sent Events
+One broadcaster per app pushes status, statistics and resource snapshots to
+every dashboard over a single long-lived /events response instead of each
+browser polling several routes
+"""
+
+import asyncio
+import json
+import logging
+import threading
+import time
+
+import config
+from async_server import LoopSignal
+
+logger = logging.getLogger(__name__)
+
+KEEPALIVE = b": keepalive\n\n"
+
+class EventBroadcaster:
+    """Fan-out of named events to any number of SSE subscribers
+
+    publish() serialises an event once and keeps only the latest message
+    per name; an unchanged payload is not sent again. Subscribers wake up
+    on a Condition and get every name that changed since their last
+    message, so a slow client skips intermediate values instead of queueing
+    them. Each client gets at most one batch per `min_interval`: a status
+    that changes every frame is coalesced, the latest value always arrives.
+    Periodic producers (add_producer) run on one thread, and only
+    while at least one client is subscribed. subscribe() serves a thread per
+    client (Flask), async_subscribe() an asyncio task per client.
+    """
+
+    def __init__(self, min_interval=config.EVENTS_MIN_INTERVAL, keepalive=config.EVENTS_KEEPALIVE):
+        self.min_interval = min_interval
+        self.keepalive = keepalive
+        self._cond = threading.Condition()
+        self._signal = LoopSignal()  # Wakes async subscribers
+        self._version = 0
+        self._messages = {}  # name -> (version, encoded SSE message)
+        self._payloads = {}  # name -> last JSON payload, for change detection
+        self._producers = []  # [name, interval, func, next due]
+        self._thread = None
+        self.subscribers = 0
+        self.published = 0
+        self.unchanged = 0
+        self.sent = 0
+
+    def publish(self, name, data):
+        """Send `data` (JSON-serialisable) as event `name`, return False if unchanged"""
+        payload = json.dumps(data, separators=(",", ":"))
+        with self._cond:
+            if self._payloads.get(name) == payload:
+                self.unchanged += 1
+                return False
+            self._version += 1
+            self._payloads[name] = payload
+            self._messages[name] = (self._version, f"event: {name}\ndata: {payload}\n\n".encode())
+            self.published += 1
+            self._cond.notify_all()
+        self._signal.notify()
+        return True
+
+    def add_producer(self, name, interval, func):
+        """Publish func() as event `name` every `interval` seconds while clients are connected"""
+        with self._cond:
+            self._producers.append([name, interval, func, 0.0])
+
+    def subscribe(self):
+        """Generator of SSE chunks for one client (a Flask streaming response body)
+
+        The latest message of every event is sent first, so a new page is
+        filled in at once. Comment lines keep idle connections open, which
+        also lets the server notice clients that went away.
+        """
+        self._join()
+        seen = 0
+        try:
+            yield b"retry: 2000\n\n"
+            while True:
+                with self._cond:
+                    self._cond.wait_for(lambda: self._version > seen, timeout=self.keepalive)
+                    seen, chunk = self._take(seen)
+                yield chunk
+                if chunk is not KEEPALIVE:
+                    # Changes in the meantime are picked up together on the next round
+                    time.sleep(self.min_interval)
+        finally:
+            self._leave()
+
+    async def async_subscribe(self):
+        """Async generator of SSE chunks for one client (async server)"""
+        self._join()
+        seen = 0
+        deadline = time.monotonic() + self.keepalive
+        try:
+            yield b"retry: 2000\n\n"
+            while True:
+                remaining = deadline - time.monotonic()
+                if self._version <= seen and remaining > 0:
+                    await self._signal.wait(remaining)
+                    continue
+                with self._cond:
+                    seen, chunk = self._take(seen)
+                yield chunk
+                deadline = time.monotonic() + self.keepalive
+                if chunk is not KEEPALIVE:
+                    await asyncio.sleep(self.min_interval)
+        finally:
+            self._leave()
+
+    def get_stats(self):
+        with self._cond:
+            return {
+                "subscribers": self.subscribers,
+                "published": self.published,
+                "unchanged": self.unchanged,
+                "sent": self.sent,
+                "events": sorted(self._messages)
+            }
+
+    def _join(self):
+        with self._cond:
+            self.subscribers += 1
+            if self._producers and self._thread is None:
+                self._thread = threading.Thread(target=self._run_producers, name="event-producers", daemon=True)
+                self._thread.start()
+
+    def _take(self, seen):
+        """(version, chunk) with every message newer than `seen`; caller holds self._cond"""
+        fresh = sorted(m for m in self._messages.values() if m[0] > seen)
+        if not fresh:
+            return seen, KEEPALIVE
+        self.sent += len(fresh)
+        return self._version, b"".join(message for _, message in fresh)
+
+    def _leave(self):
+        with self._cond:
+            self.subscribers -= 1
+            self._cond.notify_all()  # Lets the producer thread see it is no longer needed
+
+    def _run_producers(self):
+        while True:
+            with self._cond:
+                if not self.subscribers:
+                    self._thread = None
+                    return
+                now = time.monotonic()
+                due = [p for p in self._producers if p[3] <= now]
+                for producer in due:
+                    producer[3] = now + producer[1]
+                wait = min(p[3] for p in self._producers) - now
+            for name, _, func, _ in due:
+                try:
+                    self.publish(name, func())
+                except Exception as e:
+                    logger.error(f"Event producer '{name}' failed: {e}")
+            if not due:
+                with self._cond:
+                    self._cond.wait(max(0.01, wait))
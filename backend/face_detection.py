@@ -0,0 +1,671 @@
+"""
+Drowsiness Detection - Shared Face Detection
+Haar cascade face/eye detection, optical-flow face tracking and a per-frame result cache
+Used by all app versions so the cascades run as rarely as possible
+"""
+
+import threading
+import time
+from collections import OrderedDict, deque
+
+import cv2
+import numpy as np
+
+import config
+
+# ============================================================
+# CASCADE SETTINGS
+# ============================================================
+FACE_SCALE_FACTOR = 1.1
+FACE_MIN_NEIGHBORS = 4
+FACE_MIN_SIZE = (30, 30)
+
+EYE_SCALE_FACTOR = 1.1
+EYE_MIN_NEIGHBORS = 10
+EYE_MIN_SIZE = (30, 30)
+EYE_REGION_RATIO = 0.6  # Eyes are searched in the top 60% of the face
+
+# ============================================================
+# DETECTION HELPERS
+# ============================================================
+def detect_faces(face_cascade, gray, min_size=FACE_MIN_SIZE, max_size=None):
+    """Run the face cascade on a grayscale frame, return list of (x, y, w, h)"""
+    faces = face_cascade.detectMultiScale(
+        gray,
+        scaleFactor=FACE_SCALE_FACTOR,
+        minNeighbors=FACE_MIN_NEIGHBORS,
+        minSize=min_size,
+        maxSize=max_size if max_size is not None else (0, 0)
+    )
+    return [tuple(int(v) for v in f) for f in faces]
+
+def detect_eyes(eye_cascade, gray, face_box):
+    """Detect up to 2 eyes inside a face box, coordinates relative to the face"""
+    x, y, w, h = face_box
+    eye_region_height = int(h * EYE_REGION_RATIO)
+    roi_gray = gray[y:y+eye_region_height, x:x+w]
+    if roi_gray.size == 0:
+        return []
+
+    eyes = eye_cascade.detectMultiScale(
+        roi_gray,
+        scaleFactor=EYE_SCALE_FACTOR,
+        minNeighbors=EYE_MIN_NEIGHBORS,
+        minSize=EYE_MIN_SIZE
+    )
+
+    # Keep only the 2 largest detections (left and right eye)
+    eyes_sorted = sorted(eyes, key=lambda e: e[2] * e[3], reverse=True)
+    return [tuple(int(v) for v in e) for e in eyes_sorted[:2]]
+
+def largest_face(faces):
+    """Return the largest face box or None"""
+    if len(faces) == 0:
+        return None
+    return max(faces, key=lambda f: f[2] * f[3])
+
+def scale_boxes(faces, scale):
+    """Map boxes found on a downscaled gray image back to full-frame coordinates"""
+    if scale == 1.0:
+        return faces
+    return [tuple(int(round(v * scale)) for v in f) for f in faces]
+
+def box_iou(a, b):
+    """Intersection over union of two (x, y, w, h) boxes"""
+    ax2, ay2 = a[0] + a[2], a[1] + a[3]
+    bx2, by2 = b[0] + b[2], b[1] + b[3]
+    iw = max(0, min(ax2, bx2) - max(a[0], b[0]))
+    ih = max(0, min(ay2, by2) - max(a[1], b[1]))
+    inter = iw * ih
+    union = a[2] * a[3] + b[2] * b[3] - inter
+    return inter / union if union > 0 else 0.0
+
+def _rescale_box(box, fx, fy):
+    """Box in the coordinates of an image resized by (fx, fy), as floats"""
+    x, y, w, h = box
+    return (x * fx, y * fy, w * fx, h * fy)
+
+# ============================================================
+# REGION-OF-INTEREST FACE SEARCH
+# ============================================================
+class FaceSearcher:
+    """Runs the face cascade near the last known face
+
+    The driver's face stays in roughly the same place and size from one
+    frame to the next, so the cascade is limited to an expanded box around
+    the last face and to the scale range seen in recent detections. After
+    `max_misses` empty ROI searches it falls back to a full-frame scan.
+    Per-path counters and timings show how much the ROI path saves.
+
+    In incremental mode the full-frame scan is split into `phases` scale
+    bands of roughly equal cost (small faces cost the most since the
+    cascade sees the largest image), and each call scans one band. The
+    whole pyramid is covered every `phases` frames while the driver is
+    being reacquired, keeping per-frame latency flat.
+
+    The last box and the size history are in the coordinates of the gray
+    image searched last; a gray image of another size (governor
+    detect_scale step) rescales them first.
+    """
+
+    def __init__(self, face_cascade,
+                 enabled=config.FACE_ROI_SEARCH,
+                 expand=config.FACE_ROI_EXPAND,
+                 max_misses=config.FACE_ROI_MAX_MISSES,
+                 history=config.FACE_SIZE_HISTORY,
+                 size_margin=config.FACE_SIZE_MARGIN,
+                 incremental=config.FACE_INCREMENTAL_SEARCH,
+                 phases=config.FACE_SEARCH_PHASES):
+        self.face_cascade = face_cascade
+        self.enabled = enabled
+        self.expand = expand
+        self.max_misses = max_misses
+        self.size_margin = size_margin
+        self.sizes = deque(maxlen=max(1, history))
+        self.last_box = None
+        self.misses = 0
+        self.phases = max(1, phases) if incremental else 1
+        self.phase = 0
+        self._shape = None  # Gray image size the last box and sizes refer to
+        self._bands = None
+        self._bands_shape = None
+        self.counters = {
+            "roi_searches": 0,
+            "roi_hits": 0,
+            "roi_time_ms": 0.0,
+            "full_searches": 0,
+            "full_hits": 0,
+            "full_time_ms": 0.0,
+            "full_sweeps": 0
+        }
+
+    def search(self, gray, around=None):
+        """Find the driver's face, return list with zero or one (x, y, w, h) box
+
+        `around` overrides the ROI center (e.g. the tracker's current box).
+        """
+        self._follow_shape(gray.shape)
+        if around is not None:
+            self.last_box = tuple(int(v) for v in around)
+
+        start = time.perf_counter()
+        if self.enabled and self.last_box is not None and self.misses < self.max_misses:
+            face = self._search_roi(gray)
+            path = "roi"
+            if face is None:
+                self.misses += 1
+        else:
+            face = self._search_full(gray)
+            path = "full"
+            self.misses = 0
+            if face is None:
+                self.last_box = None
+
+        self.counters[path + "_searches"] += 1
+        self.counters[path + "_time_ms"] += (time.perf_counter() - start) * 1000
+        if face is None:
+            return []
+
+        self.counters[path + "_hits"] += 1
+        self.misses = 0
+        self.phase = 0
+        self.last_box = face
+        self.sizes.append(face[2])
+        return [face]
+
+    def get_stats(self):
+        """Per-path search counters"""
+        stats = dict(self.counters)
+        stats["roi_time_ms"] = round(stats["roi_time_ms"], 1)
+        stats["full_time_ms"] = round(stats["full_time_ms"], 1)
+        return stats
+
+    def _follow_shape(self, shape):
+        """Rescale the last box and the size history to a resized gray image"""
+        if self._shape is not None and self._shape != shape[:2]:
+            fx, fy = shape[1] / self._shape[1], shape[0] / self._shape[0]
+            if self.last_box is not None:
+                self.last_box = tuple(int(round(v)) for v in _rescale_box(self.last_box, fx, fy))
+            self.sizes = deque((int(round(w * fx)) for w in self.sizes), maxlen=self.sizes.maxlen)
+        self._shape = shape[:2]
+
+    def _search_full(self, gray):
+        if self.phases == 1:
+            self.counters["full_sweeps"] += 1
+            return largest_face(detect_faces(self.face_cascade, gray))
+
+        bands = self._scale_bands(gray.shape)
+        min_side, max_side = bands[self.phase % len(bands)]
+        self.phase = (self.phase + 1) % len(bands)
+        if self.phase == 0:
+            self.counters["full_sweeps"] += 1
+        return largest_face(detect_faces(self.face_cascade, gray,
+                                         min_size=(min_side, min_side),
+                                         max_size=(max_side, max_side)))
+
+    def _scale_bands(self, shape):
+        """Split the cascade's scale pyramid into bands of roughly equal cost"""
+        if self._bands_shape == shape[:2]:
+            return self._bands
+
+        max_side = min(shape[:2])
+        sizes = []
+        size = float(FACE_MIN_SIZE[0])
+        while size <= max_side:
+            sizes.append(size)
+            size *= FACE_SCALE_FACTOR
+        if not sizes:
+            sizes = [float(FACE_MIN_SIZE[0])]
+
+        # Work per scale ~ windows evaluated on the downscaled image. OpenCV
+        # slides the window with a 2px step while the scale is <= 2x the
+        # cascade's base window and with a 1px step above that.
+        try:
+            base = float(self.face_cascade.getOriginalWindowSize()[0]) or 24.0
+        except Exception:
+            base = 24.0
+        costs = [(base / s) ** 2 * (0.25 if s / base <= 2.0 else 1.0) for s in sizes]
+        budget = sum(costs) / self.phases
+        groups = [[]]
+        spent = 0.0
+        for s, cost in zip(sizes, costs):
+            if spent + cost / 2 > budget * len(groups) and len(groups) < self.phases and groups[-1]:
+                groups.append([])
+            groups[-1].append(s)
+            spent += cost
+
+        # Adjacent bands share one scale so faces on a band edge keep their neighbours
+        bands = []
+        for i, group in enumerate(groups):
+            lo = max(FACE_MIN_SIZE[0], int(group[0]))
+            hi = max_side if i == len(groups) - 1 else int(group[-1] * FACE_SCALE_FACTOR) + 1
+            bands.append((lo, hi))
+
+        self._bands = bands
+        self._bands_shape = shape[:2]
+        return bands
+
+    def _search_roi(self, gray):
+        frame_h, frame_w = gray.shape[:2]
+        x, y, w, h = self.last_box
+        mx, my = int(w * self.expand), int(h * self.expand)
+        x1, y1 = max(0, x - mx), max(0, y - my)
+        x2, y2 = min(frame_w, x + w + mx), min(frame_h, y + h + my)
+        roi = gray[y1:y2, x1:x2]
+        if roi.size == 0:
+            return None
+
+        min_side = int(min(self.sizes) * (1 - self.size_margin)) if self.sizes else FACE_MIN_SIZE[0]
+        max_side = int(max(self.sizes) * (1 + self.size_margin)) if self.sizes else min(roi.shape)
+        min_side = max(FACE_MIN_SIZE[0], min_side)
+        max_side = max(min_side, min(max_side, min(roi.shape)))
+
+        face = largest_face(detect_faces(self.face_cascade, roi,
+                                         min_size=(min_side, min_side),
+                                         max_size=(max_side, max_side)))
+        if face is None:
+            return None
+        fx, fy, fw, fh = face
+        return (fx + x1, fy + y1, fw, fh)
+
+# ============================================================
+# FACE TRACKER
+# ============================================================
+LK_PARAMS = dict(
+    winSize=(15, 15),
+    maxLevel=2,
+    criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03)
+)
+TRACK_MAX_CORNERS = 40
+TRACK_MIN_POINTS = 4
+TRACK_MAX_FB_ERROR = 1.0  # pixels, forward-backward consistency check
+TRACK_JUMP_IOU = 0.3  # Below this IoU a new detection replaces the box instead of smoothing
+
+class FaceTracker:
+    """Follows the driver's face between full cascade detections
+
+    The cascade runs every `detect_interval` frames, or sooner when the
+    tracker loses confidence. In between, corner features inside the face
+    box are followed with pyramidal Lucas-Kanade optical flow and the box
+    is smoothed with an exponential moving average, so the 224x224 crop
+    fed to the model does not jitter from frame to frame.
+
+    Boxes, points and the previous frame are in the coordinates of the
+    gray image it was last given. When the size changes (governor
+    detect_scale step) they are rescaled, so tracking carries on instead
+    of losing the face.
+    """
+
+    def __init__(self, face_cascade,
+                 detect_interval=config.FACE_DETECT_INTERVAL,
+                 min_confidence=config.FACE_TRACK_MIN_CONFIDENCE,
+                 smoothing=config.FACE_BOX_SMOOTHING):
+        self.face_cascade = face_cascade
+        self.detect_interval = max(1, detect_interval)
+        self.min_confidence = min_confidence
+        self.smoothing = smoothing
+        self.searcher = FaceSearcher(face_cascade)
+        self.detect_count = 0
+        self.track_count = 0
+        self.reset()
+
+    def reset(self):
+        """Forget the current face (next update runs the cascade)"""
+        self.raw_box = None  # Measured box (detection + optical flow motion)
+        self.box = None  # Smoothed box returned to callers
+        self.points = None
+        self.initial_points = 0
+        self.prev_gray = None
+        self.frames_since_detect = 0
+        self.confidence = 0.0
+
+    def update(self, gray):
+        """Return the driver's face as a list with zero or one (x, y, w, h) box"""
+        self._follow_shape(gray)
+        if self.box is not None and self.frames_since_detect < self.detect_interval:
+            if self._track(gray):
+                self.track_count += 1
+                self.frames_since_detect += 1
+                self.prev_gray = gray
+                return [self._int_box(gray.shape)]
+        return self._detect(gray)
+
+    def get_stats(self):
+        """Detection/tracking counters for health endpoints and summaries"""
+        return {
+            "detections": self.detect_count,
+            "tracked": self.track_count,
+            "confidence": round(self.confidence, 2),
+            "search": self.searcher.get_stats()
+        }
+
+    def _detect(self, gray):
+        self.detect_count += 1
+        around = self._int_box(gray.shape) if self.box is not None else None
+        face = largest_face(self.searcher.search(gray, around=around))
+        if face is None:
+            self.reset()
+            return []
+        return [self._seed(gray, face)]
+
+    def _seed(self, gray, face):
+        """Start following a detected face, return the smoothed box"""
+        self._smooth(face)
+        box = self._int_box(gray.shape)
+        self._init_points(gray, box)
+        self.frames_since_detect = 1
+        self.prev_gray = gray
+        return box
+
+    def _follow_shape(self, gray):
+        """Rescale the tracked state when the gray image changes size"""
+        if self.prev_gray is None or self.prev_gray.shape == gray.shape:
+            return
+        frame_h, frame_w = gray.shape[:2]
+        fx, fy = frame_w / self.prev_gray.shape[1], frame_h / self.prev_gray.shape[0]
+        if self.box is not None:
+            self.box = _rescale_box(self.box, fx, fy)
+            self.raw_box = _rescale_box(self.raw_box, fx, fy)
+        if self.points is not None:
+            self.points = (self.points * np.float32((fx, fy))).astype(np.float32)
+        self.prev_gray = cv2.resize(self.prev_gray, (frame_w, frame_h), interpolation=cv2.INTER_AREA)
+
+    def _init_points(self, gray, box):
+        x, y, w, h = box
+        # Skip the box border so background corners are not tracked
+        mx, my = w // 6, h // 6
+        mask = np.zeros_like(gray)
+        mask[y+my:y+h-my, x+mx:x+w-mx] = 255
+        points = cv2.goodFeaturesToTrack(gray, maxCorners=TRACK_MAX_CORNERS,
+                                         qualityLevel=0.01, minDistance=5, mask=mask)
+        self.points = points
+        self.initial_points = 0 if points is None else len(points)
+        self.confidence = 1.0 if self.initial_points >= TRACK_MIN_POINTS else 0.0
+
+    def _track(self, gray):
+        if self.points is None or self.initial_points < TRACK_MIN_POINTS:
+            return False
+        if self.prev_gray is None or self.prev_gray.shape != gray.shape:
+            return False
+
+        new_points, status, _ = cv2.calcOpticalFlowPyrLK(self.prev_gray, gray, self.points, None, **LK_PARAMS)
+        back_points, back_status, _ = cv2.calcOpticalFlowPyrLK(gray, self.prev_gray, new_points, None, **LK_PARAMS)
+
+        fb_error = np.abs(self.points - back_points).reshape(-1, 2).max(axis=1)
+        good = (status.ravel() == 1) & (back_status.ravel() == 1) & (fb_error < TRACK_MAX_FB_ERROR)
+        self.confidence = float(good.sum()) / self.initial_points
+        if good.sum() < TRACK_MIN_POINTS or self.confidence < self.min_confidence:
+            return False
+
+        old = self.points[good].reshape(-1, 2)
+        new = new_points[good].reshape(-1, 2)
+
+        # Translation = median point motion, scale = median change of spread
+        dx, dy = np.median(new - old, axis=0)
+        old_dist = np.linalg.norm(old - old.mean(axis=0), axis=1)
+        new_dist = np.linalg.norm(new - new.mean(axis=0), axis=1)
+        valid = old_dist > 1e-3
+        scale = float(np.median(new_dist[valid] / old_dist[valid])) if valid.any() else 1.0
+
+        x, y, w, h = self.raw_box
+        cx, cy = x + w / 2.0 + dx, y + h / 2.0 + dy
+        nw, nh = w * scale, h * scale
+        self._smooth((cx - nw / 2.0, cy - nh / 2.0, nw, nh))
+        self.points = new.reshape(-1, 1, 2)
+        return True
+
+    def _smooth(self, box):
+        box = tuple(float(v) for v in box)
+        self.raw_box = box
+        if self.box is None or self.smoothing <= 0 or box_iou(self.box, box) < TRACK_JUMP_IOU:
+            self.box = box
+        else:
+            a = self.smoothing
+            self.box = tuple(a * old + (1 - a) * new for old, new in zip(self.box, box))
+
+    def _int_box(self, shape):
+        frame_h, frame_w = shape[:2]
+        x, y, w, h = self.box
+        x1 = int(round(max(0, min(x, frame_w - 1))))
+        y1 = int(round(max(0, min(y, frame_h - 1))))
+        x2 = int(round(max(x1 + 1, min(x + w, frame_w))))
+        y2 = int(round(max(y1 + 1, min(y + h, frame_h))))
+        return (x1, y1, x2 - x1, y2 - y1)
+
+class MultiFaceTracker:
+    """Follows up to `max_faces` faces (driver + co-driver)
+
+    Same scheme as FaceTracker, but the periodic detection is a full-frame
+    cascade scan that keeps the `max_faces` largest faces, each followed by
+    its own FaceTracker in between. A detection that overlaps a tracked
+    face re-seeds that tracker, so its box smoothing carries over. Boxes
+    are returned largest first.
+    """
+
+    def __init__(self, face_cascade,
+                 max_faces=config.MAX_FACES,
+                 detect_interval=config.FACE_DETECT_INTERVAL,
+                 min_confidence=config.FACE_TRACK_MIN_CONFIDENCE,
+                 smoothing=config.FACE_BOX_SMOOTHING):
+        self.face_cascade = face_cascade
+        self.max_faces = max(1, max_faces)
+        self.detect_interval = max(1, detect_interval)
+        self.min_confidence = min_confidence
+        self.smoothing = smoothing
+        self.trackers = []
+        self.frames_since_detect = 0
+        self.detect_count = 0
+        self.track_count = 0
+        self.detect_time_ms = 0.0
+
+    def update(self, gray):
+        """Return a list of up to max_faces (x, y, w, h) boxes"""
+        for t in self.trackers:
+            t._follow_shape(gray)
+        if self.trackers and self.frames_since_detect < self.detect_interval:
+            if all(t._track(gray) for t in self.trackers):
+                self.track_count += 1
+                self.frames_since_detect += 1
+                for t in self.trackers:
+                    t.prev_gray = gray
+                return [t._int_box(gray.shape) for t in self.trackers]
+        return self._detect(gray)
+
+    def get_stats(self):
+        """Detection/tracking counters for health endpoints and summaries"""
+        return {
+            "detections": self.detect_count,
+            "tracked": self.track_count,
+            "faces": len(self.trackers),
+            "detect_time_ms": round(self.detect_time_ms, 1)
+        }
+
+    def _detect(self, gray):
+        self.detect_count += 1
+        start = time.perf_counter()
+        faces = sorted(detect_faces(self.face_cascade, gray), key=lambda f: f[2] * f[3], reverse=True)
+        self.detect_time_ms += (time.perf_counter() - start) * 1000
+
+        unmatched = list(self.trackers)
+        trackers = []
+        for face in faces[:self.max_faces]:
+            tracker = max(unmatched, key=lambda t: box_iou(t.box, face), default=None)
+            if tracker is not None and box_iou(tracker.box, face) >= TRACK_JUMP_IOU:
+                unmatched.remove(tracker)
+            else:
+                tracker = FaceTracker(self.face_cascade, self.detect_interval,
+                                      self.min_confidence, self.smoothing)
+            tracker._seed(gray, face)
+            trackers.append(tracker)
+
+        self.trackers = trackers
+        self.frames_since_detect = 1
+        return [t._int_box(gray.shape) for t in trackers]
+
+def create_face_tracker(face_cascade):
+    """Return the face tracker for an app
+
+    Tracking off = cascade search every frame. Multi-face mode follows up
+    to MAX_FACES faces instead of only the driver's.
+    """
+    detect_interval = config.FACE_DETECT_INTERVAL if config.FACE_TRACKING else 1
+    if config.MULTI_FACE:
+        return MultiFaceTracker(face_cascade, detect_interval=detect_interval)
+    return FaceTracker(face_cascade, detect_interval=detect_interval)
+
+def find_faces(face_cascade, face_tracker, gray):
+    """Faces for one frame from the tracker (driver only, or all faces in multi-face mode)"""
+    if face_tracker is not None:
+        return face_tracker.update(gray)
+    return detect_faces(face_cascade, gray)
+
+def downscale_gray(gray, gray_scale, factor):
+    """Shrink the detection image by `factor`, return (gray, gray_scale) for scale_boxes()"""
+    if factor <= 1.0:
+        return gray, gray_scale
+    h, w = gray.shape[:2]
+    small = cv2.resize(gray, (int(w / factor), int(h / factor)), interpolation=cv2.INTER_AREA)
+    return small, gray_scale * w / small.shape[1]
+
+def face_crops(frame, faces, copy=False, channel_order="BGR"):
+    """Boxes and crops of the faces to classify, return (boxes, crops)
+
+    Only the largest face is used, or up to MAX_FACES faces in multi-face
+    mode (largest first). `copy` detaches the crops from the frame, so a
+    pipeline stage can hand them on after the frame buffer is reused.
+    channel_order "RGB" swaps each crop of the BGR frame into a new array
+    (camera_sources.crop_channel_order()).
+    """
+    if config.MULTI_FACE:
+        faces = sorted(faces, key=lambda f: f[2] * f[3], reverse=True)[:config.MAX_FACES]
+    elif faces:
+        faces = [largest_face(faces)]
+
+    boxes, crops = [], []
+    for x, y, w, h in faces:
+        crop = frame[y:y+h, x:x+w]
+        if crop.size > 0:
+            boxes.append((x, y, w, h))
+            if channel_order == "RGB":
+                crop = cv2.cvtColor(crop, cv2.COLOR_BGR2RGB)
+            elif copy:
+                crop = crop.copy()
+            crops.append(crop)
+    return boxes, crops
+
+# ============================================================
+# DETECTION CACHE
+# ============================================================
+class FrameDetections:
+    """Detection result for one captured frame (boxes in full-frame coordinates)"""
+
+    def __init__(self, seq, frame, gray, faces):
+        self.seq = seq
+        self.frame = frame
+        self.gray = gray  # Full-resolution gray, None when detection ran on a lores plane
+        self.faces = faces
+        self.eyes = None  # list of eye lists (one per face), filled lazily
+        self.timings = {}  # Seconds of "convert" / "cascade" spent on this frame, for metrics
+
+    def eye_gray(self, face_box):
+        """Gray image and face box to run the eye cascade on"""
+        if self.gray is not None:
+            return self.gray, face_box
+        # Detection ran on the lores plane - convert only the eye region of the main frame
+        x, y, w, h = face_box
+        roi = self.frame[y:y+int(h * EYE_REGION_RATIO), x:x+w]
+        if roi.size == 0:
+            return roi[:, :, 0], (0, 0, w, h)
+        return cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY), (0, 0, w, h)
+
+class DetectionCache:
+    """Caches face/eye detections keyed by frame sequence number
+
+    The detection loop, the MJPEG stream and the capture/export routes all
+    ask for the detections of the frame they hold. The first caller runs the
+    cascades, every later caller for the same sequence number gets the stored
+    result, so the cost no longer grows with the number of viewers.
+
+    Without a face cascade, faces come from put() (detected by the inference
+    worker process) and a frame without a result yet reuses the newest faces.
+    """
+
+    def __init__(self, face_cascade, eye_cascade=None, face_tracker=None, max_entries=4):
+        self.face_cascade = face_cascade
+        self.eye_cascade = eye_cascade
+        self.face_tracker = face_tracker
+        self.max_entries = max_entries
+        self.detect_scale = 1.0  # > 1 runs the face cascade on a downsized gray image (governor)
+        self._last_seq = None
+        self._latest_faces = []
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, seq, frame, with_eyes=False, gray=None, gray_scale=1.0):
+        """Return FrameDetections for frame `seq`, running the cascades on a miss
+
+        `gray` is an optional grayscale plane captured alongside the frame
+        (picamera2 lores Y plane), `gray_scale` maps its coordinates to the frame.
+        """
+        with self._lock:
+            entry = self._entries.get(seq) if seq is not None else None
+            if entry is None and self.face_cascade is None:
+                self.misses += 1
+                entry = FrameDetections(seq, frame, None, list(self._latest_faces))
+            elif entry is None:
+                self.misses += 1
+                start = time.perf_counter()
+                if gray is None:
+                    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+                    gray_scale = 1.0
+                converted = time.perf_counter()
+                full_gray = gray if gray_scale == 1.0 else None
+                gray, gray_scale = downscale_gray(gray, gray_scale, self.detect_scale)
+                # The tracker must see frames in capture order; older frames get a plain scan
+                if self.face_tracker is not None and (seq is None or self._last_seq is None or seq > self._last_seq):
+                    faces = self.face_tracker.update(gray)
+                    self._last_seq = seq
+                else:
+                    faces = detect_faces(self.face_cascade, gray)
+                faces = scale_boxes(faces, gray_scale)
+                entry = FrameDetections(seq, frame, full_gray, faces)
+                entry.timings = {"convert": converted - start, "cascade": time.perf_counter() - converted}
+                if seq is not None:
+                    self._store(seq, entry)
+            else:
+                self.hits += 1
+
+            if with_eyes and entry.eyes is None:
+                if self.eye_cascade is not None:
+                    entry.eyes = [detect_eyes(self.eye_cascade, *entry.eye_gray(f)) for f in entry.faces]
+                else:
+                    entry.eyes = [[] for _ in entry.faces]
+
+            return entry
+
+    def put(self, seq, frame, faces):
+        """Store faces detected outside the cache (inference worker) for frame `seq`"""
+        with self._lock:
+            self._latest_faces = faces
+            if seq is not None:
+                self._store(seq, FrameDetections(seq, frame, None, faces))
+
+    def get_frame(self, bus_frame, with_eyes=False):
+        """Detections for a FrameBus frame (uses its lores gray plane when present)"""
+        return self.get(bus_frame.seq, bus_frame.image, with_eyes,
+                        gray=bus_frame.gray, gray_scale=bus_frame.gray_scale)
+
+    def get_stats(self):
+        """Cache hit/miss counters for health endpoints"""
+        with self._lock:
+            stats = {"hits": self.hits, "misses": self.misses}
+            if self.face_tracker is not None:
+                stats["tracker"] = self.face_tracker.get_stats()
+            return stats
+
+    def _store(self, seq, entry):
+        self._entries[seq] = entry
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
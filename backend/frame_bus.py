@@ -0,0 +1,190 @@
+"""
+Drowsiness Detection - Frame Bus
+Preallocated ring of captured frames with sequence numbers and timestamps
+The capture thread publishes, every consumer blocks until a new frame arrives
+"""
+
+import threading
+import time
+from collections import namedtuple
+
+import config
+
+# gray is an optional grayscale plane captured with the frame (picamera2 lores Y),
+# gray_scale maps its coordinates back to the image
+BusFrame = namedtuple("BusFrame", ["seq", "timestamp", "image", "gray", "gray_scale"])
+
+class FrameBus:
+    """Single-producer, multi-consumer ring of frame slots
+
+    Frames are written into preallocated slots (the camera can read straight
+    into the next slot) or, when the camera already returned a fresh array,
+    the slot takes ownership of it. Consumers get read-only views, so a
+    read never copies. Consumers that need to draw on a frame copy it
+    themselves. A slot is reused `slots` frames later, so the ring must be
+    deep enough to cover the slowest consumer's processing time;
+    FrameReader.release() reports when that was not the case.
+    """
+
+    def __init__(self, slots=config.FRAME_BUS_SLOTS):
+        self.num_slots = max(2, slots)
+        self._images = [None] * self.num_slots
+        self._grays = [None] * self.num_slots
+        self._gray_scales = [1.0] * self.num_slots
+        self._seqs = [0] * self.num_slots
+        self._times = [0.0] * self.num_slots
+        self._cond = threading.Condition()
+        self._readers = []
+        self.seq = 0
+        self.published = 0
+
+    # ------------------------------------------------------------
+    # Producer side
+    # ------------------------------------------------------------
+    def next_slot(self):
+        """Buffer the next frame will be written to (None until the frame shape is known)
+
+        The slot is invalidated immediately so no consumer picks it up while
+        it is being overwritten.
+        """
+        with self._cond:
+            index = (self.seq + 1) % self.num_slots
+            self._seqs[index] = -1
+            return self._images[index]
+
+    def publish(self, image, timestamp=None, gray=None, gray_scale=1.0):
+        """Publish a frame captured into next_slot() or a freshly allocated array
+
+        The bus takes ownership of `image` and `gray`; the producer must not
+        modify them afterwards.
+        """
+        if timestamp is None:
+            timestamp = time.time()
+
+        with self._cond:
+            self.seq += 1
+            self.published += 1
+            index = self.seq % self.num_slots
+            self._images[index] = image
+            self._grays[index] = gray
+            self._gray_scales[index] = gray_scale
+            self._seqs[index] = self.seq
+            self._times[index] = timestamp
+            self._cond.notify_all()
+            return self.seq
+
+    # ------------------------------------------------------------
+    # Consumer side
+    # ------------------------------------------------------------
+    def latest(self):
+        """Most recent frame or None"""
+        with self._cond:
+            return self._frame_at(self.seq)
+
+    def wait_for_frame(self, after_seq=0, timeout=1.0):
+        """Block until a frame newer than `after_seq` is published (None on timeout)"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self.seq <= after_seq:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+            return self._frame_at(self.seq)
+
+    def is_valid(self, seq):
+        """True while the slot holding frame `seq` has not been reused"""
+        with self._cond:
+            index = seq % self.num_slots
+            return seq > 0 and self._seqs[index] == seq
+
+    def reader(self, name):
+        """Create a FrameReader with its own drop/skip counters"""
+        reader = FrameReader(self, name)
+        with self._cond:
+            self._readers.append(reader)
+        return reader
+
+    def get_stats(self):
+        """Bus and per-consumer counters"""
+        with self._cond:
+            readers = list(self._readers)
+            seq = self.seq
+        return {
+            "seq": seq,
+            "slots": self.num_slots,
+            "consumers": [r.get_stats() for r in readers]
+        }
+
+    def _remove_reader(self, reader):
+        with self._cond:
+            if reader in self._readers:
+                self._readers.remove(reader)
+
+    def _frame_at(self, seq):
+        index = seq % self.num_slots
+        if seq <= 0 or self._seqs[index] != seq:
+            return None
+        view = self._images[index].view()
+        view.flags.writeable = False
+        gray = self._grays[index]
+        if gray is not None:
+            gray = gray.view()
+            gray.flags.writeable = False
+        return BusFrame(seq, self._times[index], view, gray, self._gray_scales[index])
+
+class FrameReader:
+    """One consumer of a FrameBus
+
+    received - frames handed to this consumer
+    dropped  - frames published while the consumer was busy (never seen)
+    skipped  - frames seen but deliberately not processed (e.g. stream FPS cap)
+    overruns - frames whose slot was reused before the consumer released it
+    """
+
+    def __init__(self, bus, name):
+        self.bus = bus
+        self.name = name
+        self.last_seq = bus.seq
+        self.received = 0
+        self.dropped = 0
+        self.skipped = 0
+        self.timeouts = 0
+        self.overruns = 0
+
+    def next(self, timeout=1.0):
+        """Block until a frame this reader has not seen yet is available"""
+        frame = self.bus.wait_for_frame(self.last_seq, timeout)
+        if frame is None:
+            self.timeouts += 1
+            return None
+        if self.received > 0:
+            self.dropped += max(0, frame.seq - self.last_seq - 1)
+        self.last_seq = frame.seq
+        self.received += 1
+        return frame
+
+    def skip(self):
+        """Count the last received frame as deliberately skipped"""
+        self.skipped += 1
+
+    def release(self, frame):
+        """Finish with a frame, return False if its slot was overwritten meanwhile"""
+        if self.bus.is_valid(frame.seq):
+            return True
+        self.overruns += 1
+        return False
+
+    def close(self):
+        """Unregister this reader from the bus"""
+        self.bus._remove_reader(self)
+
+    def get_stats(self):
+        return {
+            "name": self.name,
+            "received": self.received,
+            "dropped": self.dropped,
+            "skipped": self.skipped,
+            "timeouts": self.timeouts,
+            "overruns": self.overruns
+        }
@@ -0,0 +1,174 @@
+"""
+Drowsiness Detection - Thermal / Load Governor
+Watches the SoC temperature and CPU headroom and steps the detection
+resolution, stream FPS, JPEG quality and inference thread count down
+before the firmware throttles, then restores them with hysteresis.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+
+import config
+from resource_monitor import resource_monitor
+
+logger = logging.getLogger(__name__)
+
+# Each level trades quality for heat. detect_scale downsizes the gray image
+# the face cascade runs on, thread_factor scales the tuned thread count.
+LEVELS = (
+    {"name": "normal", "detect_scale": 1.0, "stream_fps": 15, "jpeg_quality": 50, "thread_factor": 1.0},
+    {"name": "warm", "detect_scale": 1.5, "stream_fps": 10, "jpeg_quality": 40, "thread_factor": 0.5},
+    {"name": "hot", "detect_scale": 2.0, "stream_fps": 5, "jpeg_quality": 30, "thread_factor": 0.0}
+)
+
+# ============================================================
+# GOVERNOR
+# ============================================================
+class PerformanceGovernor:
+    """Background sampler that picks a LEVELS entry from temperature and CPU load
+
+    A level goes up as soon as a threshold is crossed. It comes back down
+    one step at a time, only after temperature and load have stayed below
+    threshold minus hysteresis for `recover_time` seconds. `on_change` is
+    called with the new settings on every transition. Temperature and load
+    come from the shared resource sampler unless other sensors are given.
+    """
+
+    def __init__(self, base_threads=1, on_change=None, interval=config.GOVERNOR_INTERVAL,
+                 read_temperature=None, read_cpu=None):
+        self.base_threads = base_threads or 1
+        self.on_change = on_change
+        self.interval = interval
+        self.read_temperature = read_temperature or resource_monitor.temperature
+        self.read_cpu = read_cpu or resource_monitor.cpu_percent
+        self.level = 0
+        self.temp_c = None
+        self.cpu_percent = None
+        self.transitions = deque(maxlen=20)
+        self._cool_since = None
+        self._lock = threading.RLock()  # on_change may read the stats
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def settings(self):
+        """Current level as {name, detect_scale, stream_fps, jpeg_quality, num_threads}"""
+        level = LEVELS[self.level]
+        return {
+            "level": self.level,
+            "name": level["name"],
+            "detect_scale": level["detect_scale"],
+            "stream_fps": level["stream_fps"],
+            "jpeg_quality": level["jpeg_quality"],
+            "num_threads": max(1, int(self.base_threads * level["thread_factor"]))
+        }
+
+    def start(self):
+        """Start the governor thread (resource_monitor must already be sampling)"""
+        self._thread = threading.Thread(target=self._run, name="governor", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.sample()
+            except Exception as e:
+                logger.error(f"Governor error: {e}")
+
+    def sample(self, now=None):
+        """Read the sensors and apply the resulting level"""
+        self.evaluate(self.read_temperature(), self.read_cpu(), now)
+
+    def evaluate(self, temp_c, cpu_percent, now=None):
+        """Pick the level for one sample (separate from sample() so it can be driven by hand)"""
+        if now is None:
+            now = time.time()
+
+        with self._lock:
+            self.temp_c = temp_c
+            self.cpu_percent = cpu_percent
+
+            target, reason = self._pressure(temp_c, cpu_percent)
+            if target > self.level:
+                self._cool_since = None
+                self._set_level(target, reason, now)
+            elif self.level > 0 and self._cooled(self.level, temp_c, cpu_percent):
+                if self._cool_since is None:
+                    self._cool_since = now
+                elif now - self._cool_since >= config.GOVERNOR_RECOVER_TIME:
+                    self._set_level(self.level - 1, f"cooled down ({self._describe(temp_c, cpu_percent)})", now)
+                    self._cool_since = now  # Next step needs another full recovery period
+            else:
+                self._cool_since = None
+
+    def get_stats(self):
+        """Level, last readings, thresholds and recent transitions for the API"""
+        with self._lock:
+            return {
+                "enabled": self._thread is not None,
+                "level": self.settings,
+                "temp_c": round(self.temp_c, 1) if self.temp_c is not None else None,
+                "cpu_percent": round(self.cpu_percent, 1) if self.cpu_percent is not None else None,
+                "thresholds": {
+                    "temp_warm": config.GOVERNOR_TEMP_WARM,
+                    "temp_hot": config.GOVERNOR_TEMP_HOT,
+                    "temp_hysteresis": config.GOVERNOR_TEMP_HYSTERESIS,
+                    "cpu_high": config.GOVERNOR_CPU_HIGH,
+                    "cpu_hysteresis": config.GOVERNOR_CPU_HYSTERESIS,
+                    "recover_time": config.GOVERNOR_RECOVER_TIME
+                },
+                "transitions": list(self.transitions)
+            }
+
+    def _pressure(self, temp_c, cpu_percent):
+        """Level demanded by the upper thresholds, with the reason"""
+        if temp_c is not None and temp_c >= config.GOVERNOR_TEMP_HOT:
+            return 2, f"temp {temp_c:.1f}°C >= {config.GOVERNOR_TEMP_HOT:g}°C"
+        if temp_c is not None and temp_c >= config.GOVERNOR_TEMP_WARM:
+            return 1, f"temp {temp_c:.1f}°C >= {config.GOVERNOR_TEMP_WARM:g}°C"
+        if cpu_percent is not None and cpu_percent >= config.GOVERNOR_CPU_HIGH:
+            return 1, f"CPU {cpu_percent:.0f}% >= {config.GOVERNOR_CPU_HIGH:g}%"
+        return 0, ""
+
+    def _cooled(self, level, temp_c, cpu_percent):
+        """True when the readings are below the thresholds of `level` minus hysteresis"""
+        if level >= 2:
+            return temp_c is None or temp_c < config.GOVERNOR_TEMP_HOT - config.GOVERNOR_TEMP_HYSTERESIS
+        temp_ok = temp_c is None or temp_c < config.GOVERNOR_TEMP_WARM - config.GOVERNOR_TEMP_HYSTERESIS
+        cpu_ok = cpu_percent is None or cpu_percent < config.GOVERNOR_CPU_HIGH - config.GOVERNOR_CPU_HYSTERESIS
+        return temp_ok and cpu_ok
+
+    def _describe(self, temp_c, cpu_percent):
+        parts = []
+        if temp_c is not None:
+            parts.append(f"temp {temp_c:.1f}°C")
+        if cpu_percent is not None:
+            parts.append(f"CPU {cpu_percent:.0f}%")
+        return ", ".join(parts) or "no readings"
+
+    def _set_level(self, level, reason, now):
+        previous = LEVELS[self.level]["name"]
+        self.level = level
+        settings = self.settings
+        self.transitions.append({
+            "time": now,
+            "from": previous,
+            "to": settings["name"],
+            "reason": reason,
+            "temp_c": self.temp_c,
+            "cpu_percent": self.cpu_percent
+        })
+        log = logger.warning if level > 0 else logger.info
+        log(f"🌡️ Governor: {previous} -> {settings['name']} ({reason}) | detection 1/{settings['detect_scale']:g}, "
+            f"stream {settings['stream_fps']} FPS q{settings['jpeg_quality']}, {settings['num_threads']} threads")
+        if self.on_change:
+            try:
+                self.on_change(settings)
+            except Exception as e:
+                logger.error(f"Governor could not apply {settings['name']}: {e}")
@@ -0,0 +1,416 @@
+"""
+Drowsiness Detection - Inference Helpers
+Model variant selection, TFLite interpreter loading (threads, XNNPACK, auto-tuning)
+and zero-allocation, quantization-aware input/output handling
+"""
+
+import json
+import logging
+import os
+import platform
+import sys
+import time
+
+import cv2
+import numpy as np
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# ============================================================
+# INTERPRETER IMPORT
+# ============================================================
+def get_interpreter_class():
+    """Return (Interpreter class, backend name) or (None, None)
+
+    Tries tflite-runtime first (lightest on the Pi), then full TensorFlow,
+    then ai_edge_litert (TF 2.19+).
+    """
+    try:
+        from tflite_runtime.interpreter import Interpreter
+        return Interpreter, "tflite-runtime"
+    except ImportError:
+        pass
+    try:
+        from tensorflow.lite.python.interpreter import Interpreter
+        return Interpreter, "tensorflow.lite"
+    except ImportError:
+        pass
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+        return Interpreter, "ai_edge_litert"
+    except ImportError:
+        pass
+    return None, None
+
+def create_interpreter(model_path, num_threads=None, use_xnnpack=True):
+    """Build and allocate an interpreter with an explicit thread count and XNNPACK setting"""
+    Interpreter, _ = get_interpreter_class()
+    if Interpreter is None:
+        raise RuntimeError("No TFLite interpreter found")
+
+    kwargs = {}
+    if num_threads:
+        kwargs["num_threads"] = int(num_threads)
+    if not use_xnnpack:
+        # XNNPACK is applied as a default delegate - the resolver without
+        # default delegates turns it off
+        op_resolver = getattr(sys.modules[Interpreter.__module__], "OpResolverType", None)
+        if op_resolver is not None:
+            kwargs["experimental_op_resolver_type"] = op_resolver.BUILTIN_WITHOUT_DEFAULT_DELEGATES
+
+    try:
+        interpreter = Interpreter(model_path=model_path, **kwargs)
+    except TypeError:
+        # Old tflite-runtime without these keyword arguments
+        interpreter = Interpreter(model_path=model_path)
+    interpreter.allocate_tensors()
+    return interpreter
+
+# ============================================================
+# THREAD / XNNPACK TUNING
+# ============================================================
+def _load_tuning():
+    try:
+        with open(config.TFLITE_TUNING_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _save_tuning(model_path, record):
+    tuning = _load_tuning()
+    tuning[os.path.basename(model_path)] = record
+    with open(config.TFLITE_TUNING_FILE, "w") as f:
+        json.dump(tuning, f, indent=2)
+
+def time_invoke(interpreter, iterations=20, warmup=3):
+    """Average invoke() time in milliseconds on random input"""
+    detail = interpreter.get_input_details()[0]
+    if np.issubdtype(detail['dtype'], np.integer):
+        info = np.iinfo(detail['dtype'])
+        data = np.random.randint(info.min, info.max + 1, detail['shape'], dtype=detail['dtype'])
+    else:
+        data = np.random.rand(*detail['shape']).astype(detail['dtype'])
+    interpreter.set_tensor(detail['index'], data)
+
+    for _ in range(warmup):
+        interpreter.invoke()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        interpreter.invoke()
+    return (time.perf_counter() - start) / iterations * 1000
+
+def autotune(model_path, iterations=20, thread_counts=None, save=True, report=None):
+    """Time invoke() for every thread count with XNNPACK on/off and keep the fastest
+
+    The winning setting is stored in TFLITE_TUNING_FILE under the model's
+    file name together with every measurement, so each board only needs to
+    be tuned once. `report` is called with each result as it is measured.
+    """
+    if thread_counts is None:
+        thread_counts = range(1, (os.cpu_count() or 1) + 1)
+
+    results = []
+    for use_xnnpack in (True, False):
+        for threads in thread_counts:
+            interpreter = create_interpreter(model_path, threads, use_xnnpack)
+            result = {
+                "num_threads": threads,
+                "xnnpack": use_xnnpack,
+                "invoke_ms": round(time_invoke(interpreter, iterations), 3)
+            }
+            results.append(result)
+            if report:
+                report(result)
+
+    best = min(results, key=lambda r: r["invoke_ms"])
+    record = {
+        "num_threads": best["num_threads"],
+        "xnnpack": best["xnnpack"],
+        "invoke_ms": best["invoke_ms"],
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "backend": get_interpreter_class()[1],
+        "tuned_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "results": results
+    }
+    if save:
+        _save_tuning(model_path, record)
+    return record
+
+def resolve_interpreter_settings(model_path):
+    """Thread count and XNNPACK setting: environment > tuning file > defaults"""
+    record = _load_tuning().get(os.path.basename(model_path))
+    if record is None and config.TFLITE_AUTOTUNE:
+        logger.info("⏱️ No TFLite tuning record - benchmarking thread counts...")
+        record = autotune(model_path)
+
+    settings = {
+        "num_threads": os.cpu_count() or 1,
+        "xnnpack": True,
+        "source": "default"
+    }
+    if record is not None:
+        settings.update(num_threads=record["num_threads"], xnnpack=record["xnnpack"], source="tuned")
+    if config.TFLITE_THREADS > 0:
+        settings.update(num_threads=config.TFLITE_THREADS, source="env")
+    if config.TFLITE_XNNPACK in ("0", "1"):
+        settings.update(xnnpack=config.TFLITE_XNNPACK == "1", source="env")
+    return settings
+
+# ============================================================
+# MODEL VARIANTS
+# ============================================================
+def load_model_registry(path=None):
+    """Variant registry written by model_variants.py, or None if there is none"""
+    path = path or config.MODEL_REGISTRY_FILE
+    try:
+        with open(path) as f:
+            registry = json.load(f)
+    except (OSError, ValueError):
+        return None
+    registry["_dir"] = os.path.dirname(os.path.abspath(path))
+    return registry
+
+def variant_path(registry, name):
+    """Absolute model path of a registry variant (paths are stored relative to the registry)"""
+    return os.path.normpath(os.path.join(registry["_dir"], registry["variants"][name]["file"]))
+
+def select_model_variant(default_path, registry=None):
+    """Pick the model file to load, return (model_path, variant_name)
+
+    With DROWSY_MODEL_VARIANT=auto this is the variant with the lowest
+    measured invoke() time whose calibration accuracy is no more than
+    MODEL_ACCURACY_TOLERANCE below the float baseline. Without a registry
+    (or without usable measurements) the default model is used.
+    """
+    if registry is None:
+        registry = load_model_registry()
+    if not registry or not registry.get("variants"):
+        return default_path, "default"
+
+    variants = registry["variants"]
+    available = [name for name in variants if os.path.exists(variant_path(registry, name))]
+
+    if config.MODEL_VARIANT != "auto":
+        if config.MODEL_VARIANT in available:
+            return variant_path(registry, config.MODEL_VARIANT), config.MODEL_VARIANT
+        logger.warning(f"⚠️ Model variant '{config.MODEL_VARIANT}' not available, using default model")
+        return default_path, "default"
+
+    baseline = variants.get(registry.get("baseline"), {})
+    if baseline.get("accuracy") is None:
+        return default_path, "default"
+    min_accuracy = baseline["accuracy"] - config.MODEL_ACCURACY_TOLERANCE
+
+    candidates = [
+        name for name in available
+        if variants[name].get("accuracy") is not None
+        and variants[name].get("invoke_ms") is not None
+        and variants[name]["accuracy"] >= min_accuracy
+    ]
+    if not candidates:
+        return default_path, "default"
+    best = min(candidates, key=lambda name: variants[name]["invoke_ms"])
+    return variant_path(registry, best), best
+
+def load_interpreter(model_path):
+    """Create the app's interpreter, return (interpreter, settings)
+
+    `model_path` is the default model; a faster registry variant may be
+    loaded instead. settings holds the chosen variant, its path, the thread
+    count and the XNNPACK setting.
+    """
+    model_path, variant = select_model_variant(model_path)
+    settings = resolve_interpreter_settings(model_path)
+    settings.update(variant=variant, model_path=model_path)
+    interpreter = create_interpreter(model_path, settings["num_threads"], settings["xnnpack"])
+    return interpreter, settings
+
+def reload_interpreter(settings, num_threads):
+    """New interpreter for the same model and XNNPACK setting with another thread count
+
+    Returns (interpreter, settings) like load_interpreter().
+    """
+    interpreter = create_interpreter(settings["model_path"], num_threads, settings["xnnpack"])
+    return interpreter, dict(settings, num_threads=num_threads)
+
+# ============================================================
+# QUANTIZATION
+# ============================================================
+def _quantization(detail):
+    """(scale, zero_point) of a tensor, scale is 0.0 for float tensors"""
+    scale, zero_point = detail.get('quantization', (0.0, 0))
+    return float(scale), int(zero_point)
+
+def read_output(interpreter, output_detail):
+    """Copy of an output tensor as float32, dequantized for uint8/int8 models"""
+    output = interpreter.get_tensor(output_detail['index'])
+    scale, zero_point = _quantization(output_detail)
+    if np.issubdtype(output.dtype, np.integer) and scale != 0.0:
+        return (output.astype(np.float32) - zero_point) * scale
+    return output.astype(np.float32)
+
+# ============================================================
+# INPUT PREPROCESSING
+# ============================================================
+class InputPreprocessor:
+    """Writes resized, normalised face crops straight into the input tensor
+
+    The old path (cv2.resize -> np.expand_dims -> astype/255 -> set_tensor)
+    allocated three to four temporary arrays per inference and copied the
+    result once more into the interpreter. Here the crop is resized into a
+    reused scratch buffer and normalised directly into the interpreter's
+    own input memory obtained through interpreter.tensor(). uint8 models
+    take raw 0-255 pixels, as predict_drowsiness() always fed them, so the
+    resize is written straight into the tensor with no float round-trip
+    (full-integer conversion calibrated on pixel/255 gives exactly that
+    input quantization). Other integer inputs (int8) go through a reused
+    float buffer and are quantized into the tensor from pixel/255.
+
+    The tensor view is dropped before returning because TFLite refuses to
+    invoke() while numpy views of its internal buffers are alive, so call
+    write() and then interpreter.invoke().
+    """
+
+    def __init__(self, interpreter, input_detail=None):
+        if input_detail is None:
+            input_detail = interpreter.get_input_details()[0]
+        self.interpreter = interpreter
+        self.index = input_detail['index']
+        self.dtype = input_detail['dtype']
+        _, self.height, self.width, channels = input_detail['shape']
+        self.scratch = np.empty((self.height, self.width, channels), dtype=np.uint8)
+        self.scale = np.float32(1.0 / 255.0)
+        self.offset = None
+
+        quant_scale, zero_point = _quantization(input_detail)
+        self.direct = self.dtype == np.uint8
+        if np.issubdtype(self.dtype, np.integer) and not self.direct:
+            # real = (q - zero_point) * quant_scale and real = pixel / 255
+            self.scale = np.float32(1.0 / (255.0 * quant_scale))
+            self.offset = np.float32(zero_point)
+            self.limits = np.iinfo(self.dtype).min, np.iinfo(self.dtype).max
+            self.float_scratch = np.empty(self.scratch.shape, dtype=np.float32)
+
+    def write(self, face_roi, batch_index=0):
+        """Resize + normalise one crop into slot `batch_index` of the input tensor"""
+        tensor = self.interpreter.tensor(self.index)()
+        try:
+            dst = tensor[batch_index]
+            if self.direct:
+                out = cv2.resize(face_roi, (self.width, self.height), dst=dst)
+                if out is not dst:
+                    np.copyto(dst, out)
+            elif self.offset is not None:
+                out = cv2.resize(face_roi, (self.width, self.height), dst=self.scratch)
+                buf = self.float_scratch
+                np.multiply(out, self.scale, out=buf)
+                np.add(buf, self.offset, out=buf)
+                np.rint(buf, out=buf)
+                np.clip(buf, self.limits[0], self.limits[1], out=buf)
+                np.copyto(dst, buf, casting='unsafe')
+            else:
+                out = cv2.resize(face_roi, (self.width, self.height), dst=self.scratch)
+                np.multiply(out, self.scale, out=dst, casting='unsafe')
+        finally:
+            # No references to interpreter memory may survive until invoke()
+            dst = None
+            tensor = None
+
+# ============================================================
+# BATCH INFERENCE
+# ============================================================
+class BatchInference:
+    """Runs the model on several face crops with one invoke()
+
+    The input tensor is resized to [n, H, W, C] with resize_tensor_input()
+    when the number of faces changes, so driver + co-driver cost one
+    invoke() instead of two. The model must have a dynamic batch dimension
+    (shape_signature -1); otherwise, or if resizing fails, the crops are
+    run one after another at batch size 1.
+
+    Not thread-safe - callers sharing the interpreter hold their lock.
+    """
+
+    def __init__(self, interpreter, max_batch=config.MAX_FACES):
+        self.interpreter = interpreter
+        self.max_batch = max(1, max_batch)
+        self.input_detail = interpreter.get_input_details()[0]
+        self.output_detail = interpreter.get_output_details()[0]
+        signature = self.input_detail.get('shape_signature')
+        self.batching = bool(signature is not None and len(signature) > 0 and signature[0] == -1)
+        self.batch_size = int(self.input_detail['shape'][0])
+        self.preprocessor = InputPreprocessor(interpreter, self.input_detail)
+        self.batched_invokes = 0
+        self.single_invokes = 0
+
+    def run(self, crops, timings=None):
+        """Confidence for every crop (float32 array, same order as `crops`)
+
+        `timings` (optional dict) accumulates seconds spent in "resize"
+        (writing the input tensor), "invoke" and "postprocess" (reading and
+        dequantizing the output).
+        """
+        crops = crops[:self.max_batch]
+        if not crops:
+            return np.empty(0, dtype=np.float32)
+
+        if len(crops) > 1 and self.batching and self._resize(len(crops)):
+            start = time.perf_counter()
+            for i, crop in enumerate(crops):
+                self.preprocessor.write(crop, batch_index=i)
+            written = time.perf_counter()
+            self.interpreter.invoke()
+            invoked = time.perf_counter()
+            self.batched_invokes += 1
+            confidences = read_output(self.interpreter, self.output_detail)[:, 0]
+            if timings is not None:
+                _add_timings(timings, start, written, invoked, time.perf_counter())
+            return confidences
+
+        self._resize(1)
+        confidences = np.empty(len(crops), dtype=np.float32)
+        for i, crop in enumerate(crops):
+            start = time.perf_counter()
+            self.preprocessor.write(crop)
+            written = time.perf_counter()
+            self.interpreter.invoke()
+            invoked = time.perf_counter()
+            self.single_invokes += 1
+            confidences[i] = read_output(self.interpreter, self.output_detail)[0][0]
+            if timings is not None:
+                _add_timings(timings, start, written, invoked, time.perf_counter())
+        return confidences
+
+    def get_stats(self):
+        return {
+            "batching": self.batching,
+            "batch_size": self.batch_size,
+            "batched_invokes": self.batched_invokes,
+            "single_invokes": self.single_invokes
+        }
+
+    def _resize(self, batch_size):
+        if batch_size == self.batch_size:
+            return True
+        shape = [batch_size] + [int(v) for v in self.input_detail['shape'][1:]]
+        try:
+            self.interpreter.resize_tensor_input(self.input_detail['index'], shape)
+            self.interpreter.allocate_tensors()
+        except Exception:
+            # Fixed-shape graph after all - stay at batch size 1
+            self.batching = False
+            if self.batch_size != 1:
+                self.interpreter.resize_tensor_input(self.input_detail['index'], [1] + shape[1:])
+                self.interpreter.allocate_tensors()
+                self.batch_size = 1
+            return batch_size == 1
+        self.batch_size = batch_size
+        return True
+
+def _add_timings(timings, start, written, invoked, done):
+    timings["resize"] = timings.get("resize", 0.0) + written - start
+    timings["invoke"] = timings.get("invoke", 0.0) + invoked - written
+    timings["postprocess"] = timings.get("postprocess", 0.0) + done - invoked
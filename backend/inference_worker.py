@@ -0,0 +1,409 @@
+"""
+Drowsiness Detection - Inference Worker Process
+Face detection and TFLite inference in a separate process, so Flask request
+handlers, MJPEG encoders and the capture thread no longer compete with
+invoke() for the GIL. Frames are handed over through shared memory slots,
+results (boxes + confidences) come back over a Pipe.
+"""
+
+import logging
+import multiprocessing as mp
+import threading
+import time
+from collections import deque
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# ============================================================
+# WORKER PROCESS
+# ============================================================
+def _worker_main(conn, model_path, cascade_path):
+    """Worker process: load cascade + tracker + interpreter, then serve frames until "stop"
+
+    Messages from the parent:
+        ("slots", [shm names])                       - (re)attach the frame slots
+        ("frame", slot, seq, image_shape, gray_shape, gray_scale, faces)
+        ("configure", {"detect_scale": ..., "num_threads": ..., "channel_order": ...})
+                                                     - governor level / model crop order
+        ("stop",)
+    Replies: ("ready", settings), ("result", seq, faces, boxes, confidences,
+    detect_ms, infer_ms, timings) or ("error", seq, message). timings holds
+    the per-stage seconds of the frame for the parent's latency metrics.
+    """
+    import cv2
+    from face_detection import create_face_tracker, detect_faces, downscale_gray, face_crops, scale_boxes
+    from inference import BatchInference, load_interpreter, reload_interpreter
+
+    try:
+        face_cascade = cv2.CascadeClassifier(cascade_path)
+        if face_cascade.empty():
+            raise RuntimeError(f"Face cascade not loaded: {cascade_path}")
+        face_tracker = create_face_tracker(face_cascade)
+        interpreter, settings = load_interpreter(model_path)
+        runner = BatchInference(interpreter)
+    except Exception as e:
+        conn.send(("error", None, str(e)))
+        return
+    conn.send(("ready", settings))
+
+    slots = []
+    last_seq = 0
+    detect_scale = 1.0
+    channel_order = "BGR"
+    try:
+        while True:
+            message = conn.recv()
+            if message[0] == "stop":
+                break
+            if message[0] == "slots":
+                for shm in slots:
+                    shm.close()
+                slots = [shared_memory.SharedMemory(name=name) for name in message[1]]
+                continue
+            if message[0] == "configure":
+                options = message[1]
+                detect_scale = options.get("detect_scale", detect_scale)
+                channel_order = options.get("channel_order", channel_order)
+                num_threads = options.get("num_threads")
+                if num_threads and num_threads != settings["num_threads"]:
+                    interpreter, settings = reload_interpreter(settings, num_threads)
+                    runner = BatchInference(interpreter)
+                continue
+
+            _, slot, seq, image_shape, gray_shape, gray_scale, faces = message
+            image = crops = None
+            try:
+                start = time.perf_counter()
+                timings = {}
+                image = np.ndarray(image_shape, np.uint8, slots[slot].buf)
+                if faces is None:
+                    # The tracker keeps the previous gray frame, so it gets its own copy
+                    if gray_shape is not None:
+                        gray = np.ndarray(gray_shape, np.uint8, slots[slot].buf, offset=image.nbytes).copy()
+                    else:
+                        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+                        gray_scale = 1.0
+                    converted = time.perf_counter()
+                    timings["convert"] = converted - start
+                    gray, gray_scale = downscale_gray(gray, gray_scale, detect_scale)
+                    # Same rule as DetectionCache: frames out of capture order get a plain scan
+                    if seq is None or seq > last_seq:
+                        faces = face_tracker.update(gray)
+                        last_seq = seq if seq is not None else last_seq
+                    else:
+                        faces = detect_faces(face_cascade, gray)
+                    faces = scale_boxes(faces, gray_scale)
+                    timings["cascade"] = time.perf_counter() - converted
+                detected = time.perf_counter()
+
+                boxes, crops = face_crops(image, faces, channel_order=channel_order)
+                timings["crop"] = time.perf_counter() - detected
+                confidences = runner.run(crops, timings=timings) if crops else []
+                done = time.perf_counter()
+
+                conn.send(("result", seq,
+                           [tuple(int(v) for v in f) for f in faces],
+                           [tuple(int(v) for v in b) for b in boxes],
+                           [float(c) for c in confidences],
+                           (detected - start) * 1000, (done - detected) * 1000, timings))
+            except Exception as e:
+                conn.send(("error", seq, str(e)))
+            finally:
+                # Views into the slot must be gone before it can be closed
+                image = crops = None
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        for shm in slots:
+            shm.close()
+
+# ============================================================
+# PARENT SIDE
+# ============================================================
+class InferenceWorker:
+    """Runs detection + inference of frames in a worker process
+
+    Each submitted frame is copied into one of `slots` shared memory slots,
+    only a small message goes through the pipe. Results come back in
+    submission order, so a slot is free again once the result of the frame
+    `slots` submissions earlier was received. reserve() + submit() and
+    collect() may run on different threads (pipeline stages); run() is the
+    synchronous round trip for request handlers.
+    """
+
+    def __init__(self, model_path, cascade_path, slots=config.INFERENCE_WORKER_SLOTS,
+                 timeout=config.INFERENCE_WORKER_TIMEOUT, window=100):
+        self.model_path = model_path
+        self.cascade_path = cascade_path
+        self.num_slots = max(1, slots)
+        self.timeout = timeout
+        self.settings = None
+        self.process = None
+        self._conn = None
+        self._slots = []
+        self._slot_bytes = 0
+        self._next_slot = 0
+        self._free = threading.Semaphore(self.num_slots)
+        self._reserved = False  # Slot reserved by reserve(), used by the next submit()
+        self._send_lock = threading.RLock()  # _restart() -> start() -> stop() re-enters
+        self._recv_lock = threading.Lock()
+        self._call_lock = threading.Lock()
+        self._submitted = {}  # seq -> submit time
+        self._abandoned = set()  # seqs whose collect() timed out, reply still due
+        self._received = deque()  # replies reserve() received while draining abandoned ones
+        self._options = {}  # configure() options, re-sent after a restart
+        self._roundtrip_ms = deque(maxlen=window)
+        self._detect_ms = deque(maxlen=window)
+        self._infer_ms = deque(maxlen=window)
+        self.frames = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.restarts = 0
+        self._last_start = 0.0
+
+    def start(self, timeout=60.0):
+        """Spawn the worker and wait until its model is loaded, return True on success"""
+        self._release_slots()
+        self._free = threading.Semaphore(self.num_slots)
+        self._reserved = False
+        self._submitted.clear()
+        self._abandoned.clear()
+        self._received.clear()
+        self._last_start = time.monotonic()
+
+        # spawn: the parent already runs camera/Flask threads, a fork could copy held locks
+        ctx = mp.get_context("spawn")
+        self._conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, name="inference-worker", daemon=True,
+                                   args=(child_conn, self.model_path, self.cascade_path))
+        self.process.start()
+        child_conn.close()
+
+        try:
+            message = self._conn.recv() if self._conn.poll(timeout) else ("error", None, "did not start in time")
+        except EOFError:
+            message = ("error", None, f"exited with code {self.process.exitcode}")
+        if message[0] != "ready":
+            logger.error(f"❌ Inference worker failed: {message[2]}")
+            self.stop()
+            return False
+        self.settings = message[1]
+        if self._options:
+            self._conn.send(("configure", dict(self._options)))
+        return True
+
+    def is_alive(self):
+        return self.process is not None and self.process.is_alive()
+
+    def reserve(self, timeout=None):
+        """Wait for a free slot, return False if none got free in time
+
+        Called before grabbing a frame, so the frame submitted next is the
+        newest one and not one that aged while waiting for the worker.
+        """
+        if self._reserved:
+            return True
+        if not self.is_alive() and not self._restart():
+            return False
+        wait = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + wait
+        # A slot of a timed-out frame only gets free once its late reply is
+        # received - nobody else may be collecting, so fetch it here
+        while not self._free.acquire(timeout=min(wait, 0.05) if self._abandoned else wait):
+            self._drain_abandoned()
+            wait = deadline - time.monotonic()
+            if wait <= 0:
+                self.timeouts += 1
+                return False
+        self._reserved = True
+        return True
+
+    def _drain_abandoned(self):
+        """Receive pending replies of timed-out frames, freeing their slots"""
+        if not self._abandoned or not self._recv_lock.acquire(blocking=False):
+            return  # A running collect() frees the slots itself
+        try:
+            while self._abandoned and self._conn.poll(0):
+                message = self._receive()
+                if message[1] in self._abandoned:
+                    self._abandoned.discard(message[1])
+                    self._submitted.pop(message[1], None)
+                else:
+                    self._received.append(message)  # Still wanted, collect() takes it
+        except (EOFError, OSError):
+            pass
+        finally:
+            self._recv_lock.release()
+
+    def _receive(self):
+        message = self._conn.recv()
+        self._free.release()
+        return message
+
+    def submit(self, image, seq, gray=None, gray_scale=1.0, faces=None):
+        """Copy a frame into the reserved (or next free) slot and queue it, return False on timeout
+
+        `faces` skips detection in the worker (precomputed boxes, e.g. benchmarks).
+        """
+        if not self.reserve():
+            return False
+        self._reserved = False
+
+        with self._send_lock:
+            nbytes = image.nbytes + (gray.nbytes if gray is not None else 0)
+            if nbytes > self._slot_bytes:
+                self._allocate_slots(nbytes)
+            slot = self._next_slot
+            self._next_slot = (slot + 1) % self.num_slots
+
+            buf = self._slots[slot].buf
+            np.copyto(np.ndarray(image.shape, np.uint8, buf), image)
+            if gray is not None:
+                np.copyto(np.ndarray(gray.shape, np.uint8, buf, offset=image.nbytes), gray)
+
+            self._submitted[seq] = time.perf_counter()
+            self._conn.send(("frame", slot, seq, image.shape,
+                             gray.shape if gray is not None else None, gray_scale, faces))
+        return True
+
+    def collect(self, seq=None, timeout=None):
+        """Result dict of frame `seq` (or of the next frame), None on timeout or error
+
+        Results of older frames that nobody waits for any more (dropped by a
+        pipeline queue) are discarded on the way.
+        """
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        with self._recv_lock:
+            while True:
+                remaining = deadline - time.monotonic()
+                try:
+                    if self._received:
+                        message = self._received.popleft()
+                    elif remaining <= 0 or not self._conn.poll(remaining):
+                        self.timeouts += 1
+                        if seq is not None and seq in self._submitted:
+                            self._abandoned.add(seq)
+                        return None
+                    else:
+                        message = self._receive()
+                except (EOFError, OSError):
+                    return None
+
+                self._abandoned.discard(message[1])
+                submitted = self._submitted.pop(message[1], None)
+                if message[0] == "error":
+                    self.errors += 1
+                    logger.error(f"Inference worker error: {message[2]}")
+                    if seq is None or message[1] == seq:
+                        return None
+                    continue
+
+                _, result_seq, faces, boxes, confidences, detect_ms, infer_ms, timings = message
+                self.frames += 1
+                roundtrip_ms = (time.perf_counter() - submitted) * 1000 if submitted else None
+                if roundtrip_ms is not None:
+                    self._roundtrip_ms.append(roundtrip_ms)
+                self._detect_ms.append(detect_ms)
+                self._infer_ms.append(infer_ms)
+                if seq is not None and result_seq is not None and result_seq < seq:
+                    continue
+                return {
+                    "seq": result_seq,
+                    "faces": faces,
+                    "boxes": boxes,
+                    "confidences": confidences,
+                    "detect_ms": detect_ms,
+                    "infer_ms": infer_ms,
+                    "roundtrip_ms": roundtrip_ms,
+                    "timings": timings
+                }
+
+    def run(self, image, seq, gray=None, gray_scale=1.0, faces=None):
+        """Synchronous submit + collect (thread-safe, one frame at a time)"""
+        with self._call_lock:
+            if not self.submit(image, seq, gray, gray_scale, faces):
+                return None
+            return self.collect(seq)
+
+    def configure(self, **options):
+        """Change detect_scale / num_threads / channel_order in the worker (kept across restarts)"""
+        self._options.update(options)
+        with self._send_lock:
+            if self.is_alive():
+                self._conn.send(("configure", dict(self._options)))
+
+    def stop(self, timeout=2.0):
+        """Stop the worker process and free the shared memory"""
+        if self._conn is not None:
+            try:
+                with self._send_lock:
+                    self._conn.send(("stop",))
+            except (OSError, ValueError):
+                pass
+        if self.process is not None:
+            self.process.join(timeout)
+            if self.process.is_alive():
+                self.process.terminate()
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+        self._release_slots()
+
+    def get_stats(self):
+        """Worker state and averaged timings for health endpoints"""
+        def avg(values):
+            values = list(values)
+            return round(sum(values) / len(values), 2) if values else None
+        return {
+            "alive": self.is_alive(),
+            "pid": self.process.pid if self.process is not None else None,
+            "slots": self.num_slots,
+            "frames": self.frames,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "restarts": self.restarts,
+            "roundtrip_ms": avg(self._roundtrip_ms),
+            "detect_ms": avg(self._detect_ms),
+            "infer_ms": avg(self._infer_ms)
+        }
+
+    def _restart(self, min_interval=5.0):
+        """Start a new worker after the old one died (at most every min_interval seconds)"""
+        with self._send_lock:
+            if self.process is None or self.is_alive() or time.monotonic() - self._last_start < min_interval:
+                return self.is_alive()
+            logger.warning(f"⚠️ Inference worker exited (code {self.process.exitcode}) - restarting")
+            self.restarts += 1
+            if self._conn is not None:
+                self._conn.close()
+            return self.start()
+
+    def _allocate_slots(self, nbytes):
+        # Frames still in flight keep reading the old mappings, the worker
+        # attaches the new slots only after it has finished them
+        self._release_slots()
+        self._slots = [shared_memory.SharedMemory(create=True, size=nbytes) for _ in range(self.num_slots)]
+        self._slot_bytes = nbytes
+        self._next_slot = 0
+        self._conn.send(("slots", [shm.name for shm in self._slots]))
+
+    def _release_slots(self):
+        for shm in self._slots:
+            # A view still held elsewhere makes close() fail; unlink anyway so
+            # the /dev/shm segment goes away once the last mapping is dropped
+            try:
+                shm.close()
+            except BufferError:
+                pass
+            finally:
+                try:
+                    shm.unlink()
+                except FileNotFoundError:
+                    pass
+        self._slots = []
+        self._slot_bytes = 0
@@ -0,0 +1,316 @@
+"""
+Drowsiness Detection - Latency Metrics
+Fixed-bucket latency histograms per processing stage plus frame age at
+decision time, exported in the Prometheus text format: GET /metrics in the
+web versions, a periodically rewritten .prom file in the CLI/GUI versions
+(node_exporter textfile collector). LatencyWindow keeps the raw samples of
+a recent window for exact percentiles.
+"""
+
+import functools
+import logging
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# Bucket upper bounds in seconds, 0.5 ms .. 10 s
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+STAGES = (
+    "capture",       # Camera read, includes waiting for the next frame (not a file source's pacing)
+    "convert",       # BGR -> grayscale for face detection
+    "cascade",       # Face detection (cascade / tracker)
+    "crop_resize",   # Face crop + resize into the input tensor
+    "invoke",        # TFLite invoke()
+    "dequantize",    # Output read-back and dequantization
+    "state_update",  # Drowsiness state machine
+    "gpio",          # One LED / buzzer write
+    "jpeg_encode",   # MJPEG stream frame encode
+)
+
+# Keys of per-frame timings dicts (DetectionCache, BatchInference, worker) -> stage
+TIMING_STAGES = {
+    "convert": "convert",
+    "cascade": "cascade",
+    "crop": "crop_resize",
+    "resize": "crop_resize",
+    "invoke": "invoke",
+    "postprocess": "dequantize"
+}
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus sense (not thread-safe on its own)"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        # le is inclusive: a value equal to a bound belongs to that bucket
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding quantile q (None if empty)"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            if total >= rank:
+                return bound
+        return float("inf")
+
+class RateMeter:
+    """Events per second over the last `window` events"""
+
+    def __init__(self, window=30):
+        self._times = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def mark(self, now=None):
+        with self._lock:
+            self._times.append(time.monotonic() if now is None else now)
+
+    def rate(self, max_age=5.0):
+        """Recent rate, 0 when the last event is older than max_age seconds"""
+        with self._lock:
+            times = list(self._times)
+        if len(times) < 2 or time.monotonic() - times[-1] > max_age:
+            return 0.0
+        return (len(times) - 1) / max(times[-1] - times[0], 1e-6)
+
+class LatencyWindow:
+    """The last `size` latency samples in a preallocated NumPy ring
+
+    add() is O(1) with no allocation; summary() is one vectorised pass
+    (mean/min/max) plus one partition for the percentiles over at most
+    `size` samples, however long the session has run.
+    """
+
+    PERCENTILES = (50, 90, 99)
+
+    def __init__(self, size=config.LATENCY_WINDOW):
+        self._values = np.zeros(max(1, size), dtype=np.float64)
+        self._next = 0  # Slot of the next sample
+        self._filled = 0
+        self.total = 0  # Samples ever added
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._filled
+
+    def add(self, value):
+        with self._lock:
+            self._values[self._next] = value
+            self._next = (self._next + 1) % len(self._values)
+            self._filled = min(self._filled + 1, len(self._values))
+            self.total += 1
+
+    def clear(self):
+        with self._lock:
+            self._next = self._filled = self.total = 0
+
+    def values(self):
+        """Copy of the window, oldest sample first"""
+        with self._lock:
+            if self._filled < len(self._values):
+                return self._values[:self._filled].copy()
+            return np.concatenate((self._values[self._next:], self._values[:self._next]))
+
+    def summary(self):
+        """{samples, total, mean, min, max, p50, p90, p99}; statistics are None while empty"""
+        with self._lock:
+            window = self._values[:self._filled].copy()
+            total = self.total
+        result = {"samples": len(window), "total": total}
+        if not len(window):
+            return dict(result, mean=None, min=None, max=None, **{f"p{p}": None for p in self.PERCENTILES})
+        percentiles = np.percentile(window, self.PERCENTILES)
+        result.update(mean=float(window.mean()), min=float(window.min()), max=float(window.max()))
+        result.update({f"p{p}": float(v) for p, v in zip(self.PERCENTILES, percentiles)})
+        return result
+
+class LatencyMetrics:
+    """Latency histograms per stage and the frame age at decision time
+
+    observe() costs one bisect and a lock; stages can also be timed with
+    the time() context manager or the timed() decorator. Frame-level code
+    collects a timings dict (DetectionCache, BatchInference.run(), the
+    inference worker) and hands it to observe_timings() once per frame.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._stages = {name: Histogram(buckets) for name in STAGES}
+        self._frame_age = Histogram(buckets)
+        self._gauges = []  # (name, help, func)
+        self.detection_rate = RateMeter()
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            histogram = self._stages.get(stage)
+            if histogram is None:
+                histogram = self._stages[stage] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def observe_timings(self, timings):
+        """Record one frame's timings dict (several keys can add up to one stage)"""
+        stages = {}
+        for key, seconds in timings.items():
+            stage = TIMING_STAGES.get(key)
+            if stage is not None:
+                stages[stage] = stages.get(stage, 0.0) + seconds
+        for stage, seconds in stages.items():
+            self.observe(stage, seconds)
+
+    def observe_decision(self, capture_time, now=None):
+        """A detection result reached the alarm logic: frame age + detection rate"""
+        now = time.time() if now is None else now
+        self.detection_rate.mark()
+        with self._lock:
+            self._frame_age.observe(max(0.0, now - capture_time))
+
+    @contextmanager
+    def time(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def timed(self, stage):
+        """Decorator recording every call of a function as `stage`"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.time(stage):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def add_gauge(self, name, help_text, func):
+        """Export func() as gauge drowsy_<name>"""
+        self._gauges.append((name, help_text, func))
+
+    def summary(self):
+        """Count and mean (ms) per stage, for JSON endpoints"""
+        with self._lock:
+            histograms = dict(self._stages, frame_age=self._frame_age)
+            return {
+                name: {"count": h.count, "mean_ms": round(h.sum / h.count * 1000, 2)}
+                for name, h in histograms.items() if h.count
+            }
+
+    def render(self, labels=None):
+        """Prometheus text exposition of all metrics"""
+        common = ",".join(f'{k}="{v}"' for k, v in sorted((labels or {}).items()))
+        lines = [
+            "# HELP drowsy_stage_latency_seconds Processing time per pipeline stage",
+            "# TYPE drowsy_stage_latency_seconds histogram"
+        ]
+        with self._lock:
+            for name, histogram in self._stages.items():
+                stage_labels = f'stage="{name}",{common}' if common else f'stage="{name}"'
+                _render_histogram(lines, "drowsy_stage_latency_seconds", stage_labels, histogram)
+            lines.append("# HELP drowsy_frame_age_seconds Time from frame capture to the alarm decision")
+            lines.append("# TYPE drowsy_frame_age_seconds histogram")
+            _render_histogram(lines, "drowsy_frame_age_seconds", common, self._frame_age)
+
+        suffix = f"{{{common}}}" if common else ""
+        gauges = [("detection_fps", "Detection results per second (measured)", self.detection_rate.rate)]
+        for name, help_text, func in gauges + self._gauges:
+            try:
+                value = func()
+            except Exception as e:
+                logger.debug(f"Gauge {name} failed: {e}")
+                continue
+            if value is None:
+                continue
+            lines.append(f"# HELP drowsy_{name} {help_text}")
+            lines.append(f"# TYPE drowsy_{name} gauge")
+            lines.append(f"drowsy_{name}{suffix} {float(value):g}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path, labels=None):
+        """Atomically replace `path` with the current exposition (textfile collector format)"""
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(prefix=".metrics-", dir=directory)
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(self.render(labels))
+            os.replace(tmp_path, path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+
+def _render_histogram(lines, name, labels, histogram):
+    sep = "," if labels else ""
+    total = 0
+    for bound, count in zip(histogram.buckets, histogram.counts):
+        total += count
+        lines.append(f'{name}_bucket{{{labels}{sep}le="{bound:g}"}} {total}')
+    lines.append(f'{name}_bucket{{{labels}{sep}le="+Inf"}} {histogram.count}')
+    suffix = f"{{{labels}}}" if labels else ""
+    lines.append(f"{name}_sum{suffix} {histogram.sum:.6f}")
+    lines.append(f"{name}_count{suffix} {histogram.count}")
+
+class MetricsDumper:
+    """Rewrites the metrics file every `interval` seconds (CLI/GUI versions)"""
+
+    def __init__(self, metrics, path, interval=config.METRICS_DUMP_INTERVAL, labels=None):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self.labels = labels
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="metrics-dump", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop and write a last dump"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(2.0)
+        self._dump()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._dump()
+
+    def _dump(self):
+        try:
+            self.metrics.write(self.path, self.labels)
+        except Exception as e:
+            logger.warning(f"⚠️ Metrics dump to {self.path} failed: {e}")
+
+def start_metrics_dump(app_name):
+    """Start the periodic dump for a CLI/GUI app, None if disabled (DROWSY_METRICS_DUMP_INTERVAL=0)"""
+    if config.METRICS_DUMP_INTERVAL <= 0:
+        return None
+    path = config.METRICS_DUMP_FILE or os.path.join(tempfile.gettempdir(), f"drowsiness_{app_name}.prom")
+    return MetricsDumper(stage_metrics, path, labels={"app": app_name}).start()
+
+# One registry per process, shared by the detection code and the apps
+stage_metrics = LatencyMetrics()
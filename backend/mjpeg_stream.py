@@ -0,0 +1,165 @@
+"""
+Drowsiness Detection - Shared MJPEG Encoder
+One thread renders, resizes and JPEG-encodes the stream frame once per
+frame interval; every /video_feed viewer sends the same bytes
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+
+import cv2
+
+from async_server import LoopSignal
+from metrics import stage_metrics
+
+logger = logging.getLogger(__name__)
+
+BOUNDARY = b"--frame\r\nContent-Type: image/jpeg\r\n\r\n"
+
+class MJPEGBroadcaster:
+    """Encodes the MJPEG stream once for all viewers
+
+    The encoder thread runs only while at least one viewer is connected. It
+    takes the newest bus frame when the next frame is due, so encoding cost
+    no longer grows with the number of viewers. `render(bus_frame)` returns
+    the image to send (e.g. with bounding boxes drawn). `settings()` returns
+    (max FPS, JPEG quality) and is read for every frame, so the governor can
+    change them on the fly. A viewer that falls behind skips to the newest
+    JPEG instead of queueing. viewer() serves a thread per client (Flask),
+    async_viewer() an asyncio task per client (async server).
+    """
+
+    def __init__(self, frame_bus, render, settings, size=(480, 360), window=30):
+        self.frame_bus = frame_bus
+        self.render = render
+        self.settings = settings
+        self.size = size
+        self._cond = threading.Condition()
+        self._signal = LoopSignal()  # Wakes async viewers
+        self._chunk = None  # Multipart part of the newest JPEG
+        self._version = 0
+        self._thread = None
+        self._reader = None
+        self._encode_ms = deque(maxlen=window)
+        self.viewers = 0
+        self.total_viewers = 0
+        self.encoded = 0
+        self.sent = 0
+        self.errors = 0
+        self.last_size = 0
+
+    def viewer(self):
+        """Generator of multipart chunks for one /video_feed response"""
+        seen = self._join()
+        try:
+            while True:
+                with self._cond:
+                    if not self._cond.wait_for(lambda: self._version > seen, timeout=1.0):
+                        continue
+                    seen, chunk = self._take()
+                yield chunk
+        finally:
+            self._leave()
+
+    async def async_viewer(self):
+        """Async generator of multipart chunks for one /video_feed response"""
+        seen = self._join()
+        try:
+            while True:
+                if self._version <= seen:
+                    await self._signal.wait(1.0)
+                    continue
+                with self._cond:
+                    seen, chunk = self._take()
+                yield chunk
+        finally:
+            self._leave()
+
+    def get_stats(self):
+        with self._cond:
+            encode_ms = list(self._encode_ms)
+            return {
+                "running": self._thread is not None,
+                "viewers": self.viewers,
+                "total_viewers": self.total_viewers,
+                "encoded": self.encoded,
+                "sent": self.sent,
+                "errors": self.errors,
+                "encode_ms": round(sum(encode_ms) / len(encode_ms), 2) if encode_ms else None,
+                "jpeg_bytes": self.last_size,
+                "reader": self._reader.get_stats() if self._reader is not None else None
+            }
+
+    def _join(self):
+        """Register a viewer (starting the encoder), return the version it has seen"""
+        with self._cond:
+            self.viewers += 1
+            self.total_viewers += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="mjpeg-encoder", daemon=True)
+                self._thread.start()
+            return self._version
+
+    def _take(self):
+        # Caller holds self._cond
+        self.sent += 1
+        return self._version, self._chunk
+
+    def _leave(self):
+        with self._cond:
+            self.viewers -= 1
+
+    def _run(self):
+        reader = self._reader = self.frame_bus.reader("stream")
+        next_due = time.monotonic()
+        try:
+            while True:
+                with self._cond:
+                    if not self.viewers:
+                        return
+
+                delay = next_due - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                bus_frame = reader.next(timeout=1.0)
+                if bus_frame is None:
+                    continue
+
+                fps, quality = self.settings()
+                start = time.perf_counter()
+                try:
+                    frame = self.render(bus_frame)
+                    small = cv2.resize(frame, self.size)
+                    with stage_metrics.time("jpeg_encode"):
+                        ret, buffer = cv2.imencode('.jpg', small, [cv2.IMWRITE_JPEG_QUALITY, quality])
+                except Exception as e:
+                    self.errors += 1
+                    logger.error(f"Stream encoding error: {e}")
+                    ret = False
+                if not ret:
+                    next_due = time.monotonic() + 1.0 / fps
+                    continue
+
+                chunk = BOUNDARY + buffer.tobytes() + b"\r\n"
+                with self._cond:
+                    self._chunk = chunk
+                    self._version += 1
+                    self.encoded += 1
+                    self.last_size = len(buffer)
+                    self._encode_ms.append((time.perf_counter() - start) * 1000)
+                    self._cond.notify_all()
+                self._signal.notify()
+
+                # Deadline from the previous one, so encoding time does not lower the rate
+                next_due = max(next_due + 1.0 / fps, time.monotonic())
+        finally:
+            reader.close()
+            with self._cond:
+                self._reader = None
+                self._thread = None
+                if self.viewers:
+                    # A viewer connected while this thread was stopping
+                    self._thread = threading.Thread(target=self._run, name="mjpeg-encoder", daemon=True)
+                    self._thread.start()
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+Drowsiness Detection - Model Variant Pipeline
+Offline toolchain that converts the source model into float32 / float16 /
+dynamic-range / full-int8 TFLite variants, evaluates every variant on a
+recorded calibration set and writes the variant registry that
+initialize_model() picks from at startup.
+
+Calibration set layout (face crops, any size, BGR images):
+    calibration/alert/*.jpg     eyes open  -> model output >= threshold
+    calibration/drowsy/*.jpg    eyes closed -> model output <  threshold
+
+Usage:
+    # 1. Record face crops from the camera (repeat for each label)
+    python3 model_variants.py record --label alert --count 200
+    python3 model_variants.py record --label drowsy --count 200
+
+    # 2. Convert (needs full TensorFlow, can run on a PC)
+    python3 model_variants.py build --source drowsiness_model.keras
+
+    # 3. Measure accuracy + invoke() time on the target board
+    python3 model_variants.py evaluate
+"""
+
+import argparse
+import glob
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+
+import config
+from face_detection import detect_faces, largest_face
+from inference import (
+    InputPreprocessor, create_interpreter, load_model_registry, read_output,
+    resolve_interpreter_settings, select_model_variant, time_invoke, variant_path
+)
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_MODEL = os.path.join(BACKEND_DIR, 'best_model_compatible.tflite')
+DEFAULT_CALIBRATION = os.path.join(BACKEND_DIR, 'calibration')
+LABELS = ("alert", "drowsy")
+VARIANTS = ("float32", "float16", "dynamic", "int8")
+IMAGE_PATTERNS = ("*.jpg", "*.jpeg", "*.png")
+
+# ============================================================
+# CALIBRATION SET
+# ============================================================
+def load_calibration_set(calibration_dir, limit=None):
+    """Return (images, labels), label 1 = alert, 0 = drowsy"""
+    images, labels = [], []
+    for label in LABELS:
+        paths = []
+        for pattern in IMAGE_PATTERNS:
+            paths.extend(glob.glob(os.path.join(calibration_dir, label, pattern)))
+        for path in sorted(paths)[:limit]:
+            image = cv2.imread(path)
+            if image is not None:
+                images.append(image)
+                labels.append(1 if label == "alert" else 0)
+    return images, np.array(labels, dtype=np.int32)
+
+def record_calibration(calibration_dir, label, count, camera_index=0, interval=0.2):
+    """Save face crops from the camera into calibration_dir/label"""
+    cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+    out_dir = os.path.join(calibration_dir, label)
+    os.makedirs(out_dir, exist_ok=True)
+
+    camera = cv2.VideoCapture(camera_index)
+    if not camera.isOpened():
+        print(f"❌ Cannot open camera {camera_index}")
+        return 0
+
+    saved = 0
+    try:
+        while saved < count:
+            ret, frame = camera.read()
+            if not ret:
+                continue
+            face = largest_face(detect_faces(cascade, cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)))
+            if face is None:
+                continue
+            x, y, w, h = face
+            name = f"{label}_{time.strftime('%Y%m%d_%H%M%S')}_{saved:04d}.jpg"
+            cv2.imwrite(os.path.join(out_dir, name), frame[y:y+h, x:x+w])
+            saved += 1
+            print(f"\r📸 {label}: {saved}/{count}", end="", flush=True)
+            time.sleep(interval)
+    finally:
+        camera.release()
+    print()
+    return saved
+
+# ============================================================
+# CONVERSION (needs TensorFlow)
+# ============================================================
+def _representative_dataset(images, input_size):
+    """Calibration inputs exactly as the app feeds the float model (BGR crop resized, /255)"""
+    def generator():
+        for image in images:
+            data = cv2.resize(image, input_size).astype(np.float32) / 255.0
+            yield [data[np.newaxis]]
+    return generator
+
+def convert_variant(source, variant, images=None, input_size=(224, 224)):
+    """Convert a Keras model / SavedModel into one TFLite variant, return the flatbuffer"""
+    import tensorflow as tf
+
+    if os.path.isdir(source):
+        converter = tf.lite.TFLiteConverter.from_saved_model(source)
+    else:
+        converter = tf.lite.TFLiteConverter.from_keras_model(tf.keras.models.load_model(source))
+
+    if variant == "float16":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+    elif variant == "dynamic":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    elif variant == "int8":
+        if not images:
+            raise ValueError("int8 conversion needs a calibration set")
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = _representative_dataset(images, input_size)
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        # uint8 in/out: the input quantization becomes pixel/255, so
+        # InputPreprocessor writes the resized crop straight into the tensor
+        converter.inference_input_type = tf.uint8
+        converter.inference_output_type = tf.uint8
+    return converter.convert()
+
+def build_variants(source, out_dir, images, variants=VARIANTS):
+    """Write every variant to out_dir, return {name: file name}"""
+    os.makedirs(out_dir, exist_ok=True)
+    files = {}
+    for variant in variants:
+        print(f"🔧 Converting {variant}...")
+        try:
+            model = convert_variant(source, variant, images)
+        except Exception as e:
+            print(f"   ❌ {variant} failed: {e}")
+            continue
+        name = f"drowsiness_{variant}.tflite"
+        with open(os.path.join(out_dir, name), "wb") as f:
+            f.write(model)
+        files[variant] = name
+        print(f"   ✅ {name} ({len(model) / 1024:.0f} KiB)")
+    return files
+
+# ============================================================
+# EVALUATION
+# ============================================================
+def predict_all(model_path, images):
+    """Model output (float confidence) for every calibration image"""
+    settings = resolve_interpreter_settings(model_path)
+    interpreter = create_interpreter(model_path, settings["num_threads"], settings["xnnpack"])
+    input_detail = interpreter.get_input_details()[0]
+    output_detail = interpreter.get_output_details()[0]
+    preprocessor = InputPreprocessor(interpreter, input_detail)
+
+    outputs = np.empty(len(images), dtype=np.float32)
+    for i, image in enumerate(images):
+        preprocessor.write(image)
+        interpreter.invoke()
+        outputs[i] = read_output(interpreter, output_detail)[0][0]
+    return outputs, time_invoke(interpreter), settings
+
+def evaluate_variant(model_path, images, labels, threshold, baseline_outputs=None):
+    """Accuracy, agreement with the float baseline and invoke() time of one variant"""
+    outputs, invoke_ms, settings = predict_all(model_path, images)
+    predictions = (outputs >= threshold).astype(np.int32)
+    result = {
+        "accuracy": round(float(np.mean(predictions == labels)), 4) if len(labels) else None,
+        "invoke_ms": round(invoke_ms, 3),
+        "num_threads": settings["num_threads"],
+        "xnnpack": settings["xnnpack"],
+        "size_bytes": os.path.getsize(model_path)
+    }
+    if baseline_outputs is not None:
+        baseline_predictions = (baseline_outputs >= threshold).astype(np.int32)
+        result["agreement"] = round(float(np.mean(predictions == baseline_predictions)), 4)
+        result["max_output_diff"] = round(float(np.max(np.abs(outputs - baseline_outputs))), 4)
+    return result, outputs
+
+def evaluate_registry(registry, images, labels, threshold):
+    """Re-measure every variant in place (accuracy is portable, invoke_ms is per board)"""
+    baseline = registry["baseline"]
+    names = [baseline] + [n for n in registry["variants"] if n != baseline]
+    baseline_outputs = None
+    for name in names:
+        path = variant_path(registry, name)
+        if not os.path.exists(path):
+            print(f"⚠️ {name}: {path} missing, skipped")
+            continue
+        result, outputs = evaluate_variant(path, images, labels, threshold, baseline_outputs)
+        if name == baseline:
+            baseline_outputs = outputs
+        registry["variants"][name].update(result)
+        print(f"{name:<10} acc {result['accuracy']}  agree {result.get('agreement', 1.0)}  "
+              f"{result['invoke_ms']:8.2f} ms  {result['size_bytes'] / 1024:7.0f} KiB")
+
+    registry["threshold"] = threshold
+    registry["calibration_images"] = len(images)
+    registry["evaluated_at"] = time.strftime("%Y-%m-%d %H:%M:%S")
+    return registry
+
+def save_registry(registry, path):
+    data = {k: v for k, v in registry.items() if not k.startswith("_")}
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2)
+
+# ============================================================
+# CLI
+# ============================================================
+def main():
+    parser = argparse.ArgumentParser(description="Model variant pipeline")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    rec = sub.add_parser("record", help="Record labelled face crops from the camera")
+    rec.add_argument("--label", choices=LABELS, required=True)
+    rec.add_argument("--count", type=int, default=200)
+    rec.add_argument("--camera", type=int, default=0)
+
+    build = sub.add_parser("build", help="Convert the source model into all variants (needs TensorFlow)")
+    build.add_argument("--source", help="Keras model (.keras/.h5) or SavedModel directory; "
+                                        "without it only the shipped model is registered as float32")
+    build.add_argument("--variants", default=",".join(VARIANTS))
+
+    sub.add_parser("evaluate", help="Measure accuracy and invoke() time of every registered variant")
+
+    for p in (rec, build, sub.choices["evaluate"]):
+        p.add_argument("--calibration", default=DEFAULT_CALIBRATION)
+    for p in (build, sub.choices["evaluate"]):
+        p.add_argument("--registry", default=config.MODEL_REGISTRY_FILE)
+        p.add_argument("--threshold", type=float, default=0.5, help="Output >= threshold counts as alert")
+        p.add_argument("--limit", type=int, help="Max images per label")
+    args = parser.parse_args()
+
+    if args.command == "record":
+        record_calibration(args.calibration, args.label, args.count, args.camera)
+        return 0
+
+    images, labels = load_calibration_set(args.calibration, args.limit)
+    if not images:
+        print(f"❌ No calibration images in {args.calibration} (run 'record' first)")
+        return 1
+    print(f"📂 Calibration set: {int(labels.sum())} alert, {int(len(labels) - labels.sum())} drowsy")
+
+    out_dir = os.path.dirname(os.path.abspath(args.registry))
+    if args.command == "build":
+        if args.source:
+            files = build_variants(args.source, out_dir, images, args.variants.split(","))
+        else:
+            files = {"float32": os.path.relpath(DEFAULT_MODEL, out_dir)}
+        if "float32" not in files:
+            print("❌ No float32 baseline, registry not written")
+            return 1
+        registry = {"baseline": "float32", "source": args.source or os.path.basename(DEFAULT_MODEL),
+                    "variants": {name: {"file": file} for name, file in files.items()},
+                    "_dir": out_dir}
+    else:
+        registry = load_model_registry(args.registry)
+        if registry is None:
+            print(f"❌ No registry at {args.registry} (run 'build' first)")
+            return 1
+
+    print("=" * 60)
+    evaluate_registry(registry, images, labels, args.threshold)
+    save_registry(registry, args.registry)
+    print("=" * 60)
+
+    path, variant = select_model_variant(DEFAULT_MODEL, registry)
+    print(f"✅ Startup choice (tolerance {config.MODEL_ACCURACY_TOLERANCE}): {variant} -> {os.path.basename(path)}")
+    print(f"💾 Registry saved to {args.registry}")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
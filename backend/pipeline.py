@@ -0,0 +1,188 @@
+"""
+Drowsiness Detection - Staged Pipeline
+Capture -> detect -> infer -> decide stages, each on its own thread,
+connected by bounded drop-oldest queues
+"""
+
+import threading
+import time
+from collections import deque
+
+import config
+
+# ============================================================
+# DROP-OLDEST QUEUE
+# ============================================================
+class DropOldestQueue:
+    """Bounded queue that discards its oldest item when full
+
+    A slow stage never blocks the stage in front of it and never works
+    through a backlog of stale frames: it always gets the newest item.
+    """
+
+    def __init__(self, maxsize=1):
+        self.maxsize = max(1, maxsize)
+        self._items = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self.put_count = 0
+        self.dropped = 0
+
+    def put(self, item):
+        """Add an item, return False if an older item had to be dropped"""
+        with self._cond:
+            dropped = len(self._items) >= self.maxsize
+            if dropped:
+                self._items.popleft()
+                self.dropped += 1
+            self._items.append(item)
+            self.put_count += 1
+            self._cond.notify()
+            return not dropped
+
+    def get(self, timeout=None):
+        """Oldest queued item, or None on timeout / after close()"""
+        with self._cond:
+            if not self._items and not self._closed:
+                self._cond.wait(timeout)
+            if not self._items:
+                return None
+            return self._items.popleft()
+
+    def close(self):
+        """Wake every waiting get()"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def __len__(self):
+        with self._cond:
+            return len(self._items)
+
+# ============================================================
+# STAGE
+# ============================================================
+class PipelineStage(threading.Thread):
+    """Worker thread running one step of the pipeline
+
+    Source stages (no inbox) call `func()` in a loop, e.g. a camera read.
+    Other stages call `func(item)` for every item from their inbox. A
+    non-None return value is passed to the outbox. Items are dicts; when
+    they carry the capture "timestamp", the stage reports how old items are
+    when it finishes them (latency_ms), which at the last stage is the full
+    capture-to-decision latency. An optional `pacer` (RateScheduler) is
+    waited on before each item, so the stage takes the newest item when it
+    is due.
+    """
+
+    def __init__(self, name, func, inbox=None, outbox=None, on_error=None, window=30, pacer=None):
+        super().__init__(name=f"pipeline-{name}", daemon=True)
+        self.stage_name = name
+        self.func = func
+        self.inbox = inbox
+        self.outbox = outbox
+        self.on_error = on_error
+        self.pacer = pacer
+        self._stop_event = threading.Event()
+        self._done_times = deque(maxlen=window)
+        self._busy_ms = deque(maxlen=window)
+        self._latency_ms = deque(maxlen=window)
+        self.processed = 0
+        self.errors = 0
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            if self.pacer is not None:
+                self.pacer.wait(self._stop_event)
+            if self.inbox is not None:
+                item = self.inbox.get(timeout=0.1)
+                if item is None:
+                    continue
+            start = time.perf_counter()
+            try:
+                result = self.func(item) if self.inbox is not None else self.func()
+            except Exception as e:
+                self.errors += 1
+                if self.on_error:
+                    self.on_error(self.stage_name, e)
+                time.sleep(0.1)
+                continue
+            if result is None:
+                continue
+
+            now = time.perf_counter()
+            self.processed += 1
+            self._busy_ms.append((now - start) * 1000)
+            self._done_times.append(now)
+            if isinstance(result, dict) and "timestamp" in result:
+                self._latency_ms.append((time.time() - result["timestamp"]) * 1000)
+            if self.outbox is not None:
+                self.outbox.put(result)
+
+    def get_stats(self):
+        """Throughput, busy time, item latency and inbox depth/drops"""
+        done = list(self._done_times)
+        fps = (len(done) - 1) / (done[-1] - done[0]) if len(done) > 1 and done[-1] > done[0] else 0.0
+        busy = list(self._busy_ms)
+        latency = list(self._latency_ms)
+        return {
+            "name": self.stage_name,
+            "processed": self.processed,
+            "errors": self.errors,
+            "fps": round(fps, 1),
+            "busy_ms": round(sum(busy) / len(busy), 2) if busy else 0.0,
+            "latency_ms": round(sum(latency) / len(latency), 1) if latency else None,
+            "queue_depth": len(self.inbox) if self.inbox is not None else 0,
+            "queue_dropped": self.inbox.dropped if self.inbox is not None else 0
+        }
+
+# ============================================================
+# PIPELINE
+# ============================================================
+class Pipeline:
+    """Chain of PipelineStages, each connected to the next by a DropOldestQueue"""
+
+    def __init__(self, queue_size=config.PIPELINE_QUEUE_SIZE, on_error=None):
+        self.queue_size = queue_size
+        self.on_error = on_error
+        self.stages = []
+        self.queues = []
+
+    def add_stage(self, name, func, pacer=None):
+        """Append a stage; the first stage is the source (func takes no argument)"""
+        inbox = None
+        if self.stages:
+            inbox = DropOldestQueue(self.queue_size)
+            self.stages[-1].outbox = inbox
+            self.queues.append(inbox)
+        self.stages.append(PipelineStage(name, func, inbox, None, self.on_error, pacer=pacer))
+        return self
+
+    def output(self):
+        """Queue receiving the last stage's results (e.g. frames to display on the main thread)"""
+        queue = DropOldestQueue(self.queue_size)
+        self.stages[-1].outbox = queue
+        self.queues.append(queue)
+        return queue
+
+    def start(self):
+        for stage in self.stages:
+            stage.start()
+        return self
+
+    def stop(self, timeout=1.0):
+        for stage in self.stages:
+            stage.stop()
+            if stage.pacer is not None:
+                stage.pacer.wake()
+        for queue in self.queues:
+            queue.close()
+        for stage in self.stages:
+            if stage.is_alive():
+                stage.join(timeout)
+
+    def get_stats(self):
+        return [stage.get_stats() for stage in self.stages]
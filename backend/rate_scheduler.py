@@ -0,0 +1,153 @@
+"""
+Drowsiness Detection - Adaptive Detection Rate
+Deadline-based pacing of the detection loop. The target rate follows the
+driver state: full rate while drowsy, a low rate once ALERT has been stable
+for a while and a low-power probe rate while no face is in view.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+
+import config
+
+logger = logging.getLogger(__name__)
+
+class RateScheduler:
+    """Paces detection frames to the rate of the current mode
+
+    Modes: "full" (DROWSY, or ALERT not yet stable for `alert_hold`
+    seconds), "alert" (stable ALERT) and "probe" (NO FACE). A rate of 0
+    means no limit. Deadlines advance by one period from the previous
+    deadline, not from the end of the work, so processing time does not
+    add up to drift. A frame that is late by more than a whole period
+    restarts the schedule instead of bursting to catch up. Switching to a
+    faster mode takes effect immediately, even in the middle of a wait.
+    """
+
+    def __init__(self, full_fps=config.RATE_FULL_FPS, alert_fps=config.RATE_ALERT_FPS,
+                 probe_fps=config.RATE_PROBE_FPS, alert_hold=config.RATE_ALERT_HOLD,
+                 adaptive=config.ADAPTIVE_RATE, window=30):
+        self.rates = {"full": full_fps, "alert": alert_fps, "probe": probe_fps}
+        self.alert_hold = alert_hold
+        self.adaptive = adaptive
+        self.mode = "full"
+        self._cond = threading.Condition()
+        self._next_deadline = None
+        self._last_start = None
+        self._alert_since = None
+        self._timings = deque(maxlen=window)
+        self.frames = 0
+        self.missed = 0
+        self.transitions = 0
+
+    @property
+    def target_fps(self):
+        return self.rates[self.mode] if self.adaptive else self.rates["full"]
+
+    def period(self):
+        fps = self.target_fps
+        return 1.0 / fps if fps > 0 else 0.0
+
+    def wait(self, stop_event=None):
+        """Block until the next frame is due, return its timing record
+
+        The record gets the frame's work time (time until the next wait())
+        filled in afterwards.
+        """
+        with self._cond:
+            entered = time.perf_counter()
+            if self._timings and self._last_start is not None:
+                self._timings[-1]["work_ms"] = (entered - self._last_start) * 1000
+
+            while self._next_deadline is not None:
+                remaining = self._next_deadline - time.perf_counter()
+                if remaining <= 0 or (stop_event is not None and stop_event.is_set()):
+                    break
+                # Woken early by update() when a faster mode starts
+                self._cond.wait(min(remaining, 0.5))
+
+            start = time.perf_counter()
+            deadline = self._next_deadline if self._next_deadline is not None else start
+            period = self.period()
+            lateness = start - deadline if period else 0.0
+            if not period:
+                self._next_deadline = start  # No limit
+            elif lateness > period:
+                self.missed += 1
+                self._next_deadline = start + period
+            else:
+                self._next_deadline = deadline + period
+
+            timing = {
+                "mode": self.mode,
+                "target_fps": self.target_fps,
+                "interval_ms": (start - self._last_start) * 1000 if self._last_start is not None else None,
+                "lateness_ms": max(0.0, lateness) * 1000,
+                "slept_ms": (start - entered) * 1000,
+                "work_ms": None
+            }
+            self._last_start = start
+            self._timings.append(timing)
+            self.frames += 1
+            return timing
+
+    def update(self, status, now=None):
+        """Feed the decision for the last frame ("DROWSY" / "ALERT" / "NO FACE")"""
+        if now is None:
+            now = time.time()
+
+        with self._cond:
+            if status == "DROWSY":
+                mode = "full"
+                self._alert_since = None
+            elif status == "ALERT":
+                if self._alert_since is None:
+                    self._alert_since = now
+                mode = "alert" if now - self._alert_since >= self.alert_hold else "full"
+            else:
+                mode = "probe"
+                self._alert_since = None
+
+            if mode == self.mode:
+                return
+            previous = self.mode
+            self.mode = mode
+            self.transitions += 1
+            if self.adaptive:
+                fps = self.target_fps
+                logger.info(f"⏱️ Detection rate: {previous} -> {mode} "
+                            f"({f'{fps:g} FPS' if fps > 0 else 'unlimited'})")
+
+            # A faster rate applies to the frame being waited for, not one slow period later
+            if self._last_start is not None and self._next_deadline is not None:
+                due = max(time.perf_counter(), self._last_start + self.period())
+                self._next_deadline = min(self._next_deadline, due)
+            self._cond.notify_all()
+
+    def wake(self):
+        """Interrupt a wait() so it re-checks its stop event"""
+        with self._cond:
+            self._cond.notify_all()
+
+    def get_stats(self):
+        """Current mode/rate and the timing of recent frames"""
+        with self._cond:
+            timings = list(self._timings)
+            intervals = [t["interval_ms"] for t in timings if t["interval_ms"]]
+            work = [t["work_ms"] for t in timings if t["work_ms"] is not None]
+            lateness = [t["lateness_ms"] for t in timings]
+            return {
+                "adaptive": self.adaptive,
+                "mode": self.mode,
+                "target_fps": self.target_fps,
+                "actual_fps": round(1000 / (sum(intervals) / len(intervals)), 1) if intervals else 0.0,
+                "work_ms": round(sum(work) / len(work), 2) if work else None,
+                "lateness_ms": round(sum(lateness) / len(lateness), 2) if lateness else None,
+                "max_lateness_ms": round(max(lateness), 2) if lateness else None,
+                "frames": self.frames,
+                "missed_deadlines": self.missed,
+                "transitions": self.transitions,
+                "last_frame": timings[-1] if timings else None
+            }
@@ -0,0 +1,214 @@
+"""
+Drowsiness Detection - Resource Sampler
+One background thread reads CPU (per core), RAM, process RSS, SoC
+temperature and the firmware throttling flags at a fixed rate and keeps a
+short time series. Routes, the 'resources' event and the governor read the
+cached values instead of blocking on psutil or spawning vcgencmd.
+"""
+
+import logging
+import os
+import subprocess
+import threading
+import time
+from collections import deque
+
+import config
+
+logger = logging.getLogger(__name__)
+
+THERMAL_ZONE = "/sys/class/thermal/thermal_zone0/temp"
+THROTTLED_SYSFS = "/sys/devices/platform/soc/soc:firmware/get_throttled"
+
+# get_throttled bits: 0-3 = now, 16-19 = since boot
+THROTTLE_FLAGS = {
+    0: "under_voltage",
+    1: "freq_capped",
+    2: "throttled",
+    3: "soft_temp_limit"
+}
+
+# ============================================================
+# SENSORS
+# ============================================================
+def read_thermal_zone():
+    """SoC temperature in °C from sysfs, None if there is no thermal zone"""
+    try:
+        with open(THERMAL_ZONE) as f:
+            return int(f.read().strip()) / 1000.0
+    except (OSError, ValueError):
+        return None
+
+def read_vcgencmd_temperature():
+    """SoC temperature in °C from the Pi firmware (spawns a process)"""
+    try:
+        output = subprocess.check_output(['vcgencmd', 'measure_temp'], timeout=2).decode()
+        return float(output.replace("temp=", "").replace("'C\n", ""))
+    except Exception:
+        return None
+
+def read_throttled():
+    """Raw get_throttled bit field, from sysfs or vcgencmd, None when neither exists"""
+    try:
+        with open(THROTTLED_SYSFS) as f:
+            return int(f.read().strip(), 16)
+    except (OSError, ValueError):
+        pass
+    try:
+        output = subprocess.check_output(['vcgencmd', 'get_throttled'], timeout=2).decode()
+        return int(output.strip().split("=", 1)[1], 16)
+    except Exception:
+        return None
+
+def decode_throttled(value):
+    """{"raw", "now": [...], "since_boot": [...]} for a get_throttled value"""
+    if value is None:
+        return None
+    return {
+        "raw": hex(value),
+        "now": [name for bit, name in THROTTLE_FLAGS.items() if value & (1 << bit)],
+        "since_boot": [name for bit, name in THROTTLE_FLAGS.items() if value & (1 << (bit + 16))]
+    }
+
+def empty_sample():
+    """Sample with no readings (sampler not started or first sample pending)"""
+    return dict.fromkeys(("time", "cpu_percent", "cpu_cores", "ram_gb", "ram_percent",
+                          "rss_mb", "temp_c", "throttled"))
+
+# ============================================================
+# SAMPLER
+# ============================================================
+class ResourceMonitor:
+    """Samples the system every `interval` seconds on one daemon thread
+
+    snapshot() and history() only copy the cached data, so request threads
+    never wait for a CPU measurement; until the first sample is in, every
+    field of snapshot() is None. CPU load is the per-core time since
+    the previous sample (psutil with interval=None, one reference point
+    owned by this thread). A sensor that fails on the first sample
+    (no psutil, no thermal zone, no vcgencmd) is not tried again. The
+    throttling flags are read every `throttle_every` samples.
+    """
+
+    def __init__(self, interval=config.RESOURCE_SAMPLE_INTERVAL, history=config.RESOURCE_HISTORY,
+                 throttle_every=5):
+        self.interval = interval
+        self.throttle_every = max(1, throttle_every)
+        self._history = deque(maxlen=max(1, history))
+        self._latest = None
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._samples = 0
+        self._psutil = None
+        self._process = None
+        self._read_temperature = None  # Chosen on the first sample
+        self._throttled_available = True
+        self._throttled = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="resource-monitor", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+
+    def snapshot(self):
+        """Latest sample (dict), all fields None before the sampler's first sample"""
+        with self._lock:
+            latest = self._latest
+        return latest if latest is not None else empty_sample()
+
+    def history(self, seconds=None):
+        """Samples of the last `seconds` (all kept samples if None), oldest first"""
+        with self._lock:
+            samples = list(self._history)
+        if seconds is not None and samples:
+            cutoff = samples[-1]["time"] - seconds
+            samples = [s for s in samples if s["time"] >= cutoff]
+        return samples
+
+    def temperature(self):
+        """Latest SoC temperature (governor sensor)"""
+        return self.snapshot()["temp_c"]
+
+    def cpu_percent(self):
+        """Latest CPU load, % of all cores (governor sensor)"""
+        return self.snapshot()["cpu_percent"]
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.sample()
+            except Exception as e:
+                logger.error(f"Resource sampler error: {e}")
+            self._stop_event.wait(self.interval)
+
+    def sample(self):
+        """Read every sensor once, store and return the sample"""
+        now = time.time()
+        cpu_cores = self._read_cpu()
+        sample = {
+            "time": now,
+            "cpu_percent": round(sum(cpu_cores) / len(cpu_cores), 1) if cpu_cores else None,
+            "cpu_cores": cpu_cores,
+            "ram_gb": None,
+            "ram_percent": None,
+            "rss_mb": None,
+            "temp_c": self._temperature(),
+            "throttled": self._throttled_flags()
+        }
+        if self._psutil is not None:
+            memory = self._psutil.virtual_memory()
+            sample["ram_gb"] = round(memory.used / (1024 ** 3), 2)
+            sample["ram_percent"] = round(memory.percent, 1)
+            sample["rss_mb"] = round(self._process.memory_info().rss / (1024 ** 2), 1)
+
+        with self._lock:
+            self._samples += 1
+            self._latest = sample
+            self._history.append(sample)
+        return sample
+
+    def _read_cpu(self):
+        """Per-core load since the previous call, None without psutil"""
+        if self._psutil is None:
+            if self._process is False:
+                return None
+            try:
+                import psutil
+            except ImportError:
+                logger.warning("⚠️ psutil not installed - no CPU/RAM figures (pip install psutil)")
+                self._process = False
+                return None
+            self._psutil = psutil
+            self._process = psutil.Process(os.getpid())
+            psutil.cpu_percent(interval=None, percpu=True)  # First call only sets the reference point
+            time.sleep(0.1)
+        return [round(p, 1) for p in self._psutil.cpu_percent(interval=None, percpu=True)]
+
+    def _temperature(self):
+        if self._read_temperature is None:
+            # sysfs is cheap enough to poll, vcgencmd needs a subprocess
+            for reader in (read_thermal_zone, read_vcgencmd_temperature):
+                temp_c = reader()
+                if temp_c is not None:
+                    self._read_temperature = reader
+                    return round(temp_c, 1)
+            self._read_temperature = lambda: None
+            return None
+        temp_c = self._read_temperature()
+        return round(temp_c, 1) if temp_c is not None else None
+
+    def _throttled_flags(self):
+        if self._throttled_available and self._samples % self.throttle_every == 0:
+            value = read_throttled()
+            if value is None and self._samples == 0:
+                self._throttled_available = False
+            self._throttled = decode_throttled(value)
+        return self._throttled
+
+# One sampler per process, started by the apps
+resource_monitor = ResourceMonitor()
@@ -0,0 +1,425 @@
+"""
+Drowsiness Detection - Session Store
+SQLite database (WAL mode) of past sessions, drowsy/alarm episodes,
+per-minute aggregates and test exports, so the dashboard can query the
+history. The detection loop only queues frames; a writer thread
+aggregates them and commits one transaction per flush interval.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+
+import config
+from event_log import state_code
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    app TEXT NOT NULL,
+    scenario TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    ended_at REAL,
+    frames INTEGER NOT NULL DEFAULT 0,
+    face_frames INTEGER NOT NULL DEFAULT 0,
+    drowsy_frames INTEGER NOT NULL DEFAULT 0,
+    alarm_frames INTEGER NOT NULL DEFAULT 0,
+    episodes INTEGER NOT NULL DEFAULT 0,
+    alarms INTEGER NOT NULL DEFAULT 0,
+    event_log TEXT
+);
+CREATE INDEX IF NOT EXISTS sessions_started ON sessions (started_at);
+CREATE INDEX IF NOT EXISTS sessions_scenario ON sessions (scenario);  -- Entries are in id (= page) order
+
+CREATE TABLE IF NOT EXISTS episodes (
+    id INTEGER PRIMARY KEY,
+    session_id INTEGER NOT NULL REFERENCES sessions (id),
+    started_at REAL NOT NULL,
+    ended_at REAL,
+    alarm_at REAL,
+    max_drowsy_duration REAL NOT NULL DEFAULT 0,
+    min_confidence REAL,
+    frames INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS episodes_session ON episodes (session_id);
+CREATE INDEX IF NOT EXISTS episodes_started ON episodes (started_at);
+
+CREATE TABLE IF NOT EXISTS minutes (
+    session_id INTEGER NOT NULL REFERENCES sessions (id),
+    minute REAL NOT NULL,
+    frames INTEGER NOT NULL,
+    face_frames INTEGER NOT NULL,
+    drowsy_frames INTEGER NOT NULL,
+    alarm_frames INTEGER NOT NULL,
+    mean_confidence REAL,
+    max_drowsy_duration REAL NOT NULL,
+    PRIMARY KEY (session_id, minute)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS minutes_time ON minutes (minute);
+
+CREATE TABLE IF NOT EXISTS exports (
+    id INTEGER PRIMARY KEY,
+    session_id INTEGER NOT NULL REFERENCES sessions (id),
+    created_at REAL NOT NULL,
+    scenario TEXT NOT NULL,
+    csv_path TEXT,
+    photo_path TEXT
+);
+CREATE INDEX IF NOT EXISTS exports_session ON exports (session_id, created_at);
+"""
+
+SESSION_COLUMNS = ("id", "app", "scenario", "started_at", "ended_at", "frames", "face_frames",
+                   "drowsy_frames", "alarm_frames", "episodes", "alarms", "event_log")
+EPISODE_COLUMNS = ("id", "session_id", "started_at", "ended_at", "alarm_at", "max_drowsy_duration",
+                   "min_confidence", "frames")
+MINUTE_COLUMNS = ("minute", "frames", "face_frames", "drowsy_frames", "alarm_frames", "mean_confidence",
+                  "max_drowsy_duration")
+
+def default_path():
+    return config.SESSION_DB or os.path.join(os.path.dirname(os.path.abspath(__file__)), "sessions.db")
+
+def connect(path, readonly=False):
+    """Connection in WAL mode; synchronous=NORMAL only syncs at checkpoints (SD-card friendly)"""
+    if readonly:
+        db = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+    else:
+        db = sqlite3.connect(path, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.executescript(SCHEMA)
+    db.execute("PRAGMA busy_timeout=2000")
+    return db
+
+# ============================================================
+# WRITER
+# ============================================================
+class SessionStore:
+    """Session database with a batching writer thread
+
+    record() and the other write calls only append to a deque; the writer
+    applies them in order every `flush_interval` seconds inside one
+    transaction: session totals, drowsy episodes (a drowsy spell of the
+    primary face, with the time it turned into an alarm) and per-minute
+    aggregates are kept in memory and upserted. When more than
+    `max_pending` operations are waiting, new frames are dropped.
+    """
+
+    def __init__(self, path=None, app_name="app", scenario=config.SESSION_SCENARIO,
+                 flush_interval=config.SESSION_FLUSH_INTERVAL, max_pending=50000):
+        self.path = path or default_path()
+        self.app_name = app_name
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._ops = deque()
+        self._db = None
+        self._session = None  # Totals of the current session (dict)
+        self._episode = None  # Open episode (dict)
+        self._minutes = {}  # minute -> aggregate of the current session
+        self._stop_event = threading.Event()
+        self._thread = None
+        self.frames = 0
+        self.dropped = 0
+        self.commits = 0
+        self.new_session(scenario)
+
+    def start(self):
+        self._db = connect(self.path)
+        self._thread = threading.Thread(target=self._run, name="session-store", daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self):
+        """Stop the writer, which writes everything pending, marks the session ended and closes the db"""
+        if self._thread is None or self._stop_event.is_set():
+            return
+        self._ops.append(("end", time.time()))
+        self._stop_event.set()
+        self._thread.join(5.0)
+        if self._thread.is_alive():
+            logger.warning(f"⚠️ Session store writer still busy, {self.path} is closed when it finishes")
+
+    # Detection / route side: queue only
+    def record(self, timestamp, face, faces=None):
+        """Queue one processed frame (face: primary DrowsinessState or None)"""
+        if len(self._ops) >= self.max_pending:
+            self.dropped += 1
+            return
+        if face is None:
+            self._ops.append(("frame", timestamp, 0, 0, None, 0.0))
+        else:
+            self._ops.append(("frame", timestamp, state_code(face), 1 if faces is None else faces,
+                              face.confidence, face.drowsy_duration))
+
+    def new_session(self, scenario=None, event_log=None):
+        """End the current session and start a new one (e.g. on a test reset)"""
+        self._ops.append(("session", time.time(), scenario, event_log))
+
+    def set_scenario(self, scenario):
+        self._ops.append(("scenario", scenario))
+
+    def set_event_log(self, path):
+        self._ops.append(("event_log", path))
+
+    def add_export(self, scenario, csv_path=None, photo_path=None):
+        self._ops.append(("export", time.time(), scenario, csv_path, photo_path))
+
+    def get_stats(self):
+        session = self._session
+        return {
+            "path": self.path,
+            "session_id": session["id"] if session else None,
+            "frames": self.frames,
+            "pending": len(self._ops),
+            "dropped": self.dropped,
+            "commits": self.commits
+        }
+
+    # Writer thread
+    def _run(self):
+        while not self._stop_event.wait(self.flush_interval):
+            try:
+                self._flush()
+            except Exception as e:
+                logger.error(f"Session store write failed: {e}")
+        try:
+            self._flush()
+        except Exception as e:
+            logger.error(f"Session store write failed: {e}")
+        finally:
+            self._db.close()
+            self._db = None
+
+    def _flush(self):
+        if not self._ops:
+            return
+        with self._db:  # One transaction per batch
+            for _ in range(len(self._ops)):
+                op = self._ops.popleft()
+                getattr(self, f"_op_{op[0]}")(*op[1:])
+            self._write_totals()
+        self.commits += 1
+
+    def _op_session(self, now, scenario, event_log):
+        if self._session is not None:
+            self._op_end(now)
+        scenario = scenario or (self._session["scenario"] if self._session else config.SESSION_SCENARIO)
+        cursor = self._db.execute("INSERT INTO sessions (app, scenario, started_at, event_log) VALUES (?, ?, ?, ?)",
+                                  (self.app_name, scenario, now, event_log))
+        self._session = dict(id=cursor.lastrowid, scenario=scenario, frames=0, face_frames=0, drowsy_frames=0,
+                             alarm_frames=0, episodes=0, alarms=0, ended_at=None, event_log=event_log)
+        self._minutes = {}
+
+    def _op_end(self, now):
+        session = self._session
+        if session is None:
+            return
+        self._close_episode()
+        session["ended_at"] = now
+        self._write_totals()
+        self._session = None
+
+    def _op_scenario(self, scenario):
+        if self._session is not None:
+            self._session["scenario"] = scenario
+
+    def _op_event_log(self, path):
+        if self._session is not None:
+            self._session["event_log"] = path
+
+    def _op_export(self, now, scenario, csv_path, photo_path):
+        if self._session is not None:
+            self._db.execute("INSERT INTO exports (session_id, created_at, scenario, csv_path, photo_path) "
+                             "VALUES (?, ?, ?, ?, ?)", (self._session["id"], now, scenario, csv_path, photo_path))
+
+    def _op_frame(self, timestamp, code, faces, confidence, drowsy_duration):
+        session = self._session
+        if session is None:
+            return
+        self.frames += 1
+        drowsy = code >= 2
+        alarm = code == 3
+        session["frames"] += 1
+        session["face_frames"] += faces > 0
+        session["drowsy_frames"] += drowsy
+        session["alarm_frames"] += alarm
+
+        minute = timestamp // 60 * 60
+        agg = self._minutes.get(minute)
+        if agg is None:
+            agg = self._minutes[minute] = dict(frames=0, face_frames=0, drowsy_frames=0, alarm_frames=0,
+                                               conf_sum=0.0, conf_n=0, max_drowsy_duration=0.0, dirty=True)
+        agg["frames"] += 1
+        agg["face_frames"] += faces > 0
+        agg["drowsy_frames"] += drowsy
+        agg["alarm_frames"] += alarm
+        if confidence is not None:
+            agg["conf_sum"] += confidence
+            agg["conf_n"] += 1
+        agg["max_drowsy_duration"] = max(agg["max_drowsy_duration"], drowsy_duration)
+        agg["dirty"] = True
+
+        episode = self._episode
+        if not drowsy:
+            self._close_episode()
+            return
+        if episode is None:
+            cursor = self._db.execute("INSERT INTO episodes (session_id, started_at) VALUES (?, ?)",
+                                      (session["id"], timestamp))
+            episode = self._episode = dict(id=cursor.lastrowid, ended_at=None, alarm_at=None,
+                                           max_drowsy_duration=0.0, min_confidence=None, frames=0)
+            session["episodes"] += 1
+        episode["frames"] += 1
+        episode["ended_at"] = timestamp
+        episode["max_drowsy_duration"] = max(episode["max_drowsy_duration"], drowsy_duration)
+        if confidence is not None and (episode["min_confidence"] is None or confidence < episode["min_confidence"]):
+            episode["min_confidence"] = confidence
+        if alarm and episode["alarm_at"] is None:
+            episode["alarm_at"] = timestamp
+            session["alarms"] += 1
+
+    def _close_episode(self):
+        if self._episode is not None:
+            self._write_episode(self._episode)
+            self._episode = None
+
+    def _write_episode(self, episode):
+        self._db.execute("UPDATE episodes SET ended_at = ?, alarm_at = ?, max_drowsy_duration = ?, "
+                         "min_confidence = ?, frames = ? WHERE id = ?",
+                         (episode["ended_at"], episode["alarm_at"], episode["max_drowsy_duration"],
+                          episode["min_confidence"], episode["frames"], episode["id"]))
+
+    def _write_totals(self):
+        """Upsert changed minutes, the open episode and the session row"""
+        session = self._session
+        if session is None:
+            return
+        rows = []
+        for minute, agg in self._minutes.items():
+            if agg["dirty"]:
+                rows.append((session["id"], minute, agg["frames"], agg["face_frames"], agg["drowsy_frames"],
+                             agg["alarm_frames"], agg["conf_sum"] / agg["conf_n"] if agg["conf_n"] else None,
+                             agg["max_drowsy_duration"]))
+                agg["dirty"] = False
+        if rows:
+            self._db.executemany(
+                "INSERT INTO minutes (session_id, minute, frames, face_frames, drowsy_frames, alarm_frames, "
+                "mean_confidence, max_drowsy_duration) VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (session_id, minute) DO UPDATE SET frames = excluded.frames, "
+                "face_frames = excluded.face_frames, drowsy_frames = excluded.drowsy_frames, "
+                "alarm_frames = excluded.alarm_frames, mean_confidence = excluded.mean_confidence, "
+                "max_drowsy_duration = excluded.max_drowsy_duration", rows)
+        # Finished minutes are in the database, keep only the latest in memory
+        if len(self._minutes) > 1:
+            latest = max(self._minutes)
+            self._minutes = {latest: self._minutes[latest]}
+        if self._episode is not None:
+            self._write_episode(self._episode)
+        self._db.execute("UPDATE sessions SET scenario = ?, ended_at = ?, frames = ?, face_frames = ?, "
+                         "drowsy_frames = ?, alarm_frames = ?, episodes = ?, alarms = ?, event_log = ? WHERE id = ?",
+                         (session["scenario"], session["ended_at"], session["frames"], session["face_frames"],
+                          session["drowsy_frames"], session["alarm_frames"], session["episodes"],
+                          session["alarms"], session["event_log"], session["id"]))
+
+def start_session_store(app_name, event_log=None):
+    """Open the database and start a session, None if disabled or not writable"""
+    if not config.SESSION_STORE:
+        return None
+    try:
+        store = SessionStore(app_name=app_name)
+        if event_log is not None:
+            store.set_event_log(event_log.path)
+        return store.start()
+    except (OSError, sqlite3.Error) as e:
+        logger.warning(f"⚠️ Session store disabled ({default_path()}): {e}")
+        return None
+
+# ============================================================
+# QUERIES
+# ============================================================
+def _clamp_limit(limit):
+    return max(1, min(int(limit or 50), config.SESSION_PAGE_MAX))
+
+def query_sessions(path, limit=50, before=None, scenario=None, since=None, until=None):
+    """Newest first; `before` is the id cursor of the next page"""
+    where, params = [], []
+    if before is not None:
+        where.append("id < ?")
+        params.append(before)
+    if scenario:
+        where.append("scenario = ?")
+        params.append(scenario)
+    if since is not None:
+        where.append("started_at >= ?")
+        params.append(since)
+    if until is not None:
+        where.append("started_at < ?")
+        params.append(until)
+    sql = f"SELECT {', '.join(SESSION_COLUMNS)} FROM sessions"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY id DESC LIMIT ?"
+    return _page(path, "sessions", SESSION_COLUMNS, sql, params, limit, "id")
+
+def query_episodes(path, session_id, limit=50, after=None, alarms_only=False):
+    """Oldest first; `after` is the id cursor of the next page"""
+    sql = f"SELECT {', '.join(EPISODE_COLUMNS)} FROM episodes WHERE session_id = ?"
+    params = [session_id]
+    if after is not None:
+        sql += " AND id > ?"
+        params.append(after)
+    if alarms_only:
+        sql += " AND alarm_at IS NOT NULL"
+    sql += " ORDER BY id LIMIT ?"
+    return _page(path, "episodes", EPISODE_COLUMNS, sql, params, limit, "id")
+
+def query_minutes(path, session_id, limit=60, after=None):
+    """Oldest first; `after` is the minute cursor of the next page"""
+    sql = f"SELECT {', '.join(MINUTE_COLUMNS)} FROM minutes WHERE session_id = ?"
+    params = [session_id]
+    if after is not None:
+        sql += " AND minute > ?"
+        params.append(after)
+    sql += " ORDER BY minute LIMIT ?"
+    return _page(path, "minutes", MINUTE_COLUMNS, sql, params, limit, "minute")
+
+def _page(path, key, columns, sql, params, limit, cursor_column):
+    """One page as a JSON document streamed in chunks: {"<key>": [...], "next": cursor or null}
+
+    The read-only connection is opened and the query run here, so a
+    missing or broken database raises sqlite3.Error before a response is
+    started. Rows are then fetched in small batches and serialised as
+    they arrive, so a large page is never built in memory. One extra row
+    tells whether there is a next page.
+    """
+    limit = _clamp_limit(limit)
+    db = connect(path, readonly=True)
+    try:
+        cursor = db.execute(sql, params + [limit + 1])
+    except sqlite3.Error:
+        db.close()
+        raise
+    return _stream_page(db, cursor, key, columns, limit, columns.index(cursor_column))
+
+def _stream_page(db, cursor, key, columns, limit, cursor_index):
+    try:
+        yield f'{{"{key}":['.encode()
+        sent = 0
+        last = None
+        while sent < limit:
+            rows = cursor.fetchmany(min(100, limit - sent))
+            if not rows:
+                break
+            chunk = ",".join(json.dumps(dict(zip(columns, row)), separators=(",", ":")) for row in rows)
+            yield (("," if sent else "") + chunk).encode()
+            sent += len(rows)
+            last = rows[-1][cursor_index]
+        more = sent == limit and cursor.fetchone() is not None
+        yield f'],"next":{json.dumps(last if more else None)}}}'.encode()
+    finally:
+        db.close()